@@ -10,8 +10,11 @@ from telegram.ext import (
     ConversationHandler
 )
 
-from config import get_config  # Corrected import statement
 from keyboards import Keyboards
+from rate_manager import CURRENCIES, parse_rate, preview_rate_change, commit_rate_change
+from broadcast_manager import get_broadcast_manager, count_recipients
+from database import get_async_db
+from handlers import is_admin, WAITING_FOR_BROADCAST_TEXT
 
 # Initialize logging
 logging.basicConfig(
@@ -28,6 +31,9 @@ ADMIN_MODIFY_BALANCE = 3
 # Keyboards
 keyboards = Keyboards()
 
+# Repriced packages listed in a rate change preview
+RATE_PREVIEW_LINES = 20
+
 
 async def ban_user_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Starts the ban user conversation."""
@@ -101,7 +107,7 @@ async def edit_rate_callback(update: Update, context: ContextTypes.DEFAULT_TYPE)
     query = update.callback_query
     await query.answer()
 
-    currency = query.data.split('_')[-1]  # Extract currency from callback data
+    currency = query.data.split('_')[-1].upper()  # Extract currency from callback data
     context.user_data['currency'] = currency  # Store currency in user_data
 
     await query.edit_message_text(
@@ -112,40 +118,164 @@ async def edit_rate_callback(update: Update, context: ContextTypes.DEFAULT_TYPE)
 
 
 async def handle_rate_update(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
-    """Handles the update of the exchange rate."""
-    new_rate = update.message.text
+    """Preview the repricing a new exchange rate would cause and ask for confirmation."""
     currency = context.user_data.get('currency')
+    rate = parse_rate(update.message.text)
 
-    if currency == 'USD':
-        config = get_config()
-        success = config.update_usd_rate(new_rate)
-        if success:
-            await update.message.reply_text(
-                f"تم تحديث سعر صرف الدولار إلى {new_rate} بنجاح.",
-                reply_markup=keyboards.admin_keyboard()
-            )
-        else:
-            await update.message.reply_text(
-                "حدث خطأ أثناء تحديث سعر صرف الدولار.",
-                reply_markup=keyboards.admin_keyboard()
-            )
-    elif currency == 'USDT':
-        config = get_config()
-        success = config.update_usdt_rate(new_rate)
-        if success:
-            await update.message.reply_text(
-                f"تم تحديث سعر صرف USDT إلى {new_rate} بنجاح.",
-                reply_markup=keyboards.admin_keyboard()
-            )
-        else:
-            await update.message.reply_text(
-                "حدث خطأ أثناء تحديث سعر صرف USDT.",
-                reply_markup=keyboards.admin_keyboard()
-            )
-    else:
+    if currency not in CURRENCIES:
         await update.message.reply_text(
             "حدث خطأ: لم يتم تحديد العملة.",
-            reply_markup=keyboards.admin_keyboard()
+            reply_markup=Keyboards.admin_rates()
+        )
+        return ConversationHandler.END
+    if rate is None:
+        await update.message.reply_text(
+            "❌ الرجاء إدخال سعر صرف صحيح (رقم موجب).",
+            reply_markup=Keyboards.admin_rates()
         )
+        return ConversationHandler.END
+
+    current, changes = await preview_rate_change(currency, rate)
+    lines = [f"💱 {currency}: {current or 0:,} ← {rate:,} ل.س", ""]
+    if changes:
+        lines.append(f"📦 سيتغير سعر {len(changes)} باقة:")
+        for change in changes[:RATE_PREVIEW_LINES]:
+            lines.append(f"• {change.product_name} {change.label}: {change.old_price:,} ← {change.new_price:,}")
+        if len(changes) > RATE_PREVIEW_LINES:
+            lines.append(f"… و {len(changes) - RATE_PREVIEW_LINES} باقة أخرى")
+    else:
+        lines.append("📦 لن يتغير سعر أي باقة.")
+    lines += ["", "هل تريد تأكيد التغيير؟"]
+
+    context.user_data['pending_rate'] = (currency, rate)
+    await update.message.reply_text("\n".join(lines), reply_markup=Keyboards.confirm_rate_change())
+    return ConversationHandler.END
+
+
+async def confirm_rate_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    """Apply the previewed exchange rate."""
+    query = update.callback_query
+    await query.answer()
+
+    pending = context.user_data.pop('pending_rate', None)
+    if pending is None:
+        await query.edit_message_text("❌ لا يوجد تغيير معلق.", reply_markup=Keyboards.admin_rates())
+        return ConversationHandler.END
+
+    currency, rate = pending
+    try:
+        repriced = await commit_rate_change(currency, rate, query.from_user.id)
+    except Exception as e:
+        logger.error(f"Error applying {currency} rate {rate}: {e}")
+        await query.edit_message_text("❌ حدث خطأ أثناء تحديث سعر الصرف.", reply_markup=Keyboards.admin_rates())
+        return ConversationHandler.END
+
+    await query.edit_message_text(
+        f"✅ تم تحديث سعر صرف {currency} إلى {rate:,}\n"
+        f"📦 تم تحديث سعر {repriced} باقة.",
+        reply_markup=Keyboards.admin_rates()
+    )
+    return ConversationHandler.END
+
+
+async def cancel_rate_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    """Discard the previewed exchange rate."""
+    query = update.callback_query
+    await query.answer()
+    context.user_data.pop('pending_rate', None)
+    await query.edit_message_text("تم الإلغاء", reply_markup=Keyboards.admin_rates())
+    return ConversationHandler.END
+
+
+async def broadcast_menu_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    """Show the latest broadcast's progress and controls."""
+    query = update.callback_query
+    if not is_admin(query.from_user.id):
+        await query.answer("🚫 ليس لديك صلاحيات المسؤول", show_alert=True)
+        return ConversationHandler.END
+
+    await query.answer()
+    context.user_data.pop('pending_broadcast', None)
+    manager = get_broadcast_manager()
+    broadcast = await manager.latest()
+    await query.edit_message_text(
+        manager.status_text(broadcast),
+        reply_markup=Keyboards.broadcast_menu(
+            broadcast.broadcast_id if broadcast else 0, broadcast.status if broadcast else ''
+        )
+    )
+    return ConversationHandler.END
+
+
+async def new_broadcast_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    """Ask for the text of a new broadcast."""
+    query = update.callback_query
+    if not is_admin(query.from_user.id):
+        await query.answer("🚫 ليس لديك صلاحيات المسؤول", show_alert=True)
+        return ConversationHandler.END
+
+    await query.answer()
+    await query.edit_message_text(
+        "📝 أرسل نص الإذاعة:",
+        reply_markup=Keyboards.cancel_broadcast()
+    )
+    return WAITING_FOR_BROADCAST_TEXT
+
+
+async def handle_broadcast_text(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    """Preview a broadcast and ask for confirmation."""
+    if not is_admin(update.effective_user.id):
+        return ConversationHandler.END
+
+    text = update.message.text
+    recipients = await get_async_db().run_read(count_recipients)
+    context.user_data['pending_broadcast'] = text
+    await update.message.reply_text(
+        f"📢 سيتم إرسال الرسالة التالية إلى {recipients:,} مستخدم:\n\n{text}\n\nهل تريد التأكيد؟",
+        reply_markup=Keyboards.confirm_broadcast()
+    )
+    return ConversationHandler.END
+
+
+async def confirm_broadcast_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    """Start the previewed broadcast."""
+    query = update.callback_query
+    if not is_admin(query.from_user.id):
+        await query.answer("🚫 ليس لديك صلاحيات المسؤول", show_alert=True)
+        return ConversationHandler.END
+
+    text = context.user_data.pop('pending_broadcast', None)
+    if text is None:
+        await query.answer("❌ لا توجد إذاعة معلقة", show_alert=True)
+        return ConversationHandler.END
+
+    await query.answer()
+    manager = get_broadcast_manager()
+    broadcast = await manager.create(text, query.from_user.id, context.bot)
+    await query.edit_message_text(
+        manager.status_text(broadcast),
+        reply_markup=Keyboards.broadcast_menu(broadcast.broadcast_id, broadcast.status)
+    )
+    return ConversationHandler.END
+
+
+async def broadcast_control_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    """Pause, resume or cancel a broadcast (broadcast_<action>_<id>)."""
+    query = update.callback_query
+    if not is_admin(query.from_user.id):
+        await query.answer("🚫 ليس لديك صلاحيات المسؤول", show_alert=True)
+        return ConversationHandler.END
+
+    _, action, broadcast_id = query.data.split('_')
+    manager = get_broadcast_manager()
+    if action == 'pause':
+        changed = await manager.pause(int(broadcast_id))
+    elif action == 'resume':
+        changed = await manager.resume(int(broadcast_id), context.bot)
+    else:
+        changed = await manager.cancel(int(broadcast_id))
+    if not changed:
+        await query.answer("❌ لا يمكن تنفيذ هذا الإجراء على هذه الإذاعة", show_alert=True)
+        return ConversationHandler.END
 
-    return ConversationHandler.END
\ No newline at end of file
+    return await broadcast_menu_callback(update, context)
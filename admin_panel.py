@@ -1,8 +1,15 @@
+import asyncio
 import logging
 import os
 from telegram import Update, InlineKeyboardMarkup, InlineKeyboardButton
 from telegram.ext import ContextTypes, ConversationHandler
 from keyboards import Keyboards
+from backup_manager import get_backup_manager
+from membership_manager import get_membership_cache
+from send_manager import get_send_queue
+from error_manager import recent_error_groups, get_error_group, get_error_aggregator
+from database import from_ms
+from stats_manager import get_stats, format_stats, rebuild_stats
 from handlers import is_admin, EDITING_ENV_VALUE, HANDLE_SYRIATEL_NUMBERS, HANDLE_USDT_WALLETS
 
 # Logger
@@ -42,8 +49,9 @@ class AdminPanel:
         buttons = [
             [
                 InlineKeyboardButton("📝 تعديل متغيرات .env", callback_data="edit_env"),
-                InlineKeyboardButton("🔙 رجوع", callback_data="admin_panel")
-            ]
+                InlineKeyboardButton("💾 النسخ الاحتياطي", callback_data="admin_backup")
+            ],
+            [InlineKeyboardButton("🔙 رجوع", callback_data="admin_panel")]
         ]
 
         if update.message:
@@ -141,4 +149,121 @@ class AdminPanel:
                     InlineKeyboardButton("🔙 إلغاء", callback_data="admin_settings")
                 ]])
             )
-        return HANDLE_USDT_WALLETS
\ No newline at end of file
+        return HANDLE_USDT_WALLETS
+
+    async def backup_status(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Show the last backup status, optionally taking a backup first."""
+        query = update.callback_query
+        if not is_admin(query.from_user.id):
+            await query.answer("🚫 ليس لديك صلاحيات المسؤول", show_alert=True)
+            return ConversationHandler.END
+
+        backup_manager = get_backup_manager()
+        if query.data == "admin_backup_now":
+            await query.answer("⏳ جاري أخذ نسخة احتياطية...")
+            await asyncio.to_thread(backup_manager.backup_now)
+        else:
+            await query.answer()
+
+        buttons = [
+            [InlineKeyboardButton("💾 نسخة احتياطية الآن", callback_data="admin_backup_now")],
+            [InlineKeyboardButton("🔙 رجوع", callback_data="admin_settings")]
+        ]
+        await query.message.edit_text(
+            backup_manager.status_text(),
+            reply_markup=InlineKeyboardMarkup(buttons)
+        )
+        return ConversationHandler.END
+
+    async def error_log(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """List the error groups of the last 24 hours, most frequent first."""
+        query = update.callback_query
+        if not is_admin(query.from_user.id):
+            await query.answer("🚫 ليس لديك صلاحيات المسؤول", show_alert=True)
+            return ConversationHandler.END
+
+        await query.answer()
+        groups = await recent_error_groups()
+        metrics = get_error_aggregator().metrics
+        lines = [
+            "🐞 الأخطاء خلال آخر 24 ساعة\n",
+            f"منذ التشغيل: {metrics['errors']} خطأ، {metrics['alerts']} تنبيه، "
+            f"{metrics['suppressed']} في الملخصات\n"
+        ]
+        buttons = []
+        for fp, error_type, location, count, users, last_seen in groups:
+            lines.append(
+                f"• {count}× {error_type} — {location}\n"
+                f"  المستخدمون: {users}، آخر مرة: {from_ms(last_seen).strftime('%H:%M')}"
+            )
+            buttons.append([InlineKeyboardButton(f"{error_type} ({count})", callback_data=f"admin_error_{fp}")])
+        if not groups:
+            lines.append("✅ لا توجد أخطاء")
+        buttons.append([
+            InlineKeyboardButton("🔄 تحديث", callback_data="admin_errors"),
+            InlineKeyboardButton("🔙 رجوع", callback_data="admin_panel")
+        ])
+        await query.message.edit_text('\n'.join(lines), reply_markup=InlineKeyboardMarkup(buttons))
+        return ConversationHandler.END
+
+    async def error_details(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Show the stored details of one error group."""
+        query = update.callback_query
+        if not is_admin(query.from_user.id):
+            await query.answer("🚫 ليس لديك صلاحيات المسؤول", show_alert=True)
+            return ConversationHandler.END
+
+        result = await get_error_group(query.data.split('_', 2)[2])
+        if result is None:
+            await query.answer("❌ لم يعد هذا الخطأ موجوداً", show_alert=True)
+            return ConversationHandler.END
+
+        await query.answer()
+        (fp, error_type, location, message, tb, first_seen, last_seen, occurrences), users = result
+        header = (
+            f"🐞 {error_type} [{fp}]\n\n"
+            f"المكان: {location}\n"
+            f"الرسالة: {message[:300]}\n"
+            f"التكرارات: {occurrences}\n"
+            f"أول مرة: {from_ms(first_seen).strftime('%Y-%m-%d %H:%M:%S')}\n"
+            f"آخر مرة: {from_ms(last_seen).strftime('%Y-%m-%d %H:%M:%S')}\n"
+            f"آخر المستخدمين: {', '.join(str(u) for u in users) or '—'}\n\n"
+        )
+        # Keep the end of the traceback, where the failing frame is
+        tb = tb[-(4000 - len(header)):]
+        await query.message.edit_text(
+            header + tb,
+            reply_markup=InlineKeyboardMarkup([
+                [InlineKeyboardButton("🔙 رجوع", callback_data="admin_errors")]
+            ])
+        )
+        return ConversationHandler.END
+
+    async def admin_stats(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Display the statistics screen from the precomputed rollups."""
+        query = update.callback_query
+        if not is_admin(query.from_user.id):
+            await query.answer("🚫 ليس لديك صلاحيات المسؤول", show_alert=True)
+            return ConversationHandler.END
+
+        await query.answer()
+        stats = await get_stats()
+        await query.message.edit_text(
+            f"{format_stats(stats)}\n\n{get_membership_cache().status_text()}\n\n"
+            f"{get_send_queue().status_text()}",
+            reply_markup=InlineKeyboardMarkup([
+                [InlineKeyboardButton("🔄 تحديث", callback_data="admin_stats")],
+                [InlineKeyboardButton("🔙 رجوع", callback_data="admin_panel")]
+            ])
+        )
+        return ConversationHandler.END
+
+    async def rebuild_stats_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Recompute the statistics rollups from scratch (/rebuild_stats)."""
+        if not is_admin(update.effective_user.id):
+            await update.message.reply_text("🚫 ليس لديك صلاحيات المسؤول")
+            return
+
+        await update.message.reply_text("⏳ جاري إعادة بناء الإحصائيات...")
+        rows = await rebuild_stats()
+        await update.message.reply_text(f"✅ تمت إعادة بناء الإحصائيات ({rows} سجل)")
@@ -0,0 +1,112 @@
+import os
+import logging
+
+from database import get_async_db, now_ms, MS_PER_DAY
+
+# Logger
+logger = logging.getLogger(__name__)
+
+# Settings
+ARCHIVE_AFTER_DAYS = int(os.getenv('ARCHIVE_AFTER_DAYS', '30'))
+ARCHIVE_BATCH_SIZE = int(os.getenv('ARCHIVE_BATCH_SIZE', '1000'))
+
+# table -> (primary key, extra filter). Only finished orders are archived.
+ARCHIVED_TABLES = {
+    'orders': ('order_id', "AND status IN ('completed', 'rejected', 'expired')"),
+    'balance_history': ('history_id', ''),
+}
+
+
+def _select_batch(conn, table, cutoff, limit):
+    key, extra = ARCHIVED_TABLES[table]
+    rows = conn.execute(
+        f"SELECT {key} FROM main.{table} WHERE created_at < ? {extra} ORDER BY {key} LIMIT ?",
+        (cutoff, limit)
+    ).fetchall()
+    return [row[0] for row in rows]
+
+
+def _copy_batch(conn, table, ids):
+    key, _ = ARCHIVED_TABLES[table]
+    placeholders = ','.join('?' * len(ids))
+    columns = ', '.join(row[1] for row in conn.execute(f"PRAGMA archive.table_info({table})"))
+    conn.execute(
+        f"INSERT OR IGNORE INTO archive.{table} ({columns}) "
+        f"SELECT {columns} FROM main.{table} WHERE {key} IN ({placeholders})",
+        ids
+    )
+
+
+def _delete_batch(conn, table, ids):
+    key, _ = ARCHIVED_TABLES[table]
+    placeholders = ','.join('?' * len(ids))
+    conn.execute(f"DELETE FROM main.{table} WHERE {key} IN ({placeholders})", ids)
+
+
+async def archive_table(table, cutoff, batch_size=ARCHIVE_BATCH_SIZE):
+    """Move rows of `table` created before `cutoff` into the archive.
+
+    Each batch is copied and committed first, then deleted from the hot
+    database in a second transaction. SQLite does not commit attached WAL
+    databases atomically, so this order means a crash can leave a duplicate
+    (hidden by the views and cleaned up on the next run) but never loses a
+    row. Returns the number of rows moved.
+    """
+    db = get_async_db()
+    moved = 0
+    while True:
+        ids = await db.run_read(_select_batch, table, cutoff, batch_size)
+        if not ids:
+            return moved
+        await db.run_write(_copy_batch, table, ids)
+        await db.run_write(_delete_batch, table, ids)
+        moved += len(ids)
+        if len(ids) < batch_size:
+            return moved
+
+
+async def archive_old_rows(context=None):
+    """Job: move orders and balance history older than ARCHIVE_AFTER_DAYS."""
+    cutoff = now_ms() - ARCHIVE_AFTER_DAYS * MS_PER_DAY
+    try:
+        counts = {table: await archive_table(table, cutoff) for table in ARCHIVED_TABLES}
+        logger.info(f"Archived rows older than {ARCHIVE_AFTER_DAYS} days: {counts}")
+    except Exception as e:
+        logger.error(f"Error archiving old rows: {e}")
+
+
+async def get_user_orders(user_id, limit=10, before_ms=None, include_archive=False):
+    """Return a user's most recent orders, newest first.
+
+    Only the hot table is read unless include_archive is set (e.g. when the
+    user pages past their recent orders), so the common case never touches
+    the archive file.
+    """
+    source = 'all_orders' if include_archive else 'main.orders'
+    before_ms = before_ms if before_ms is not None else now_ms() + 1
+    return await get_async_db().fetchall(
+        f"""
+        SELECT order_id, product_type, product_id, amount, price, created_at, status
+        FROM {source}
+        WHERE user_id = ? AND created_at < ?
+        ORDER BY created_at DESC
+        LIMIT ?
+        """,
+        (user_id, before_ms, limit)
+    )
+
+
+async def get_balance_history(user_id, limit=20, before_ms=None, include_archive=False):
+    """Return a user's balance history entries, newest first."""
+    source = 'all_balance_history' if include_archive else 'main.balance_history'
+    before_ms = before_ms if before_ms is not None else now_ms() + 1
+    return await get_async_db().fetchall(
+        f"""
+        SELECT history_id, old_balance, new_balance, change_amount, transaction_type, created_at
+        FROM {source}
+        WHERE user_id = ? AND created_at < ?
+        ORDER BY created_at DESC
+        LIMIT ?
+        """,
+        (user_id, before_ms, limit)
+    )
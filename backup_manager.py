@@ -0,0 +1,219 @@
+import os
+import re
+import time
+import sqlite3
+import logging
+import threading
+from datetime import datetime, timedelta, timezone
+
+from database import DB_PATH, DAMASCUS_TZ, db_connection
+
+# Logger
+logger = logging.getLogger(__name__)
+
+# Settings
+BACKUP_DIR = os.getenv('BACKUP_DIR', 'backup')
+BACKUP_INTERVAL = int(os.getenv('BACKUP_INTERVAL_MINUTES', '60')) * 60
+BACKUP_PAGES_PER_STEP = int(os.getenv('BACKUP_PAGES_PER_STEP', '256'))
+BACKUP_STEP_SLEEP = float(os.getenv('BACKUP_STEP_SLEEP_MS', '20')) / 1000
+RETENTION = {
+    'hourly': int(os.getenv('BACKUP_KEEP_HOURLY', '24')),
+    'daily': int(os.getenv('BACKUP_KEEP_DAILY', '7')),
+    'weekly': int(os.getenv('BACKUP_KEEP_WEEKLY', '4')),
+}
+
+# Named by UTC start time, so names never repeat or go backwards across DST;
+# a second backup in the same second gets a _<n> suffix. Names without the Z
+# are from older versions, which used local time.
+BACKUP_NAME_FORMAT = "diamond_store_%Y%m%d_%H%M%SZ"
+BACKUP_NAME_RE = re.compile(r"^diamond_store_(\d{8}_\d{6})(Z?)(?:_(\d+))?\.db$")
+
+
+def archive_backup_path(path):
+    """Path of the archive database backup taken together with the main backup at `path`."""
+    return f"{os.path.splitext(path)[0]}_archive.db"
+
+
+class BackupManager:
+    """Takes consistent online backups of the live database in the background."""
+
+    def __init__(self, db_path=DB_PATH, backup_dir=BACKUP_DIR, interval=BACKUP_INTERVAL):
+        self.db_path = db_path
+        self.backup_dir = backup_dir
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+        self._run_lock = threading.Lock()
+        self._step_sleep = BACKUP_STEP_SLEEP
+        self.last_status = None
+
+    def start(self):
+        """Start the periodic backup thread."""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name='db-backup', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop the periodic backup thread."""
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=30)
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            self.backup_now()
+
+    def _throttle(self, status, remaining, total):
+        # Called after each step; sleeping here gives writers room
+        if remaining and self._step_sleep:
+            time.sleep(self._step_sleep)
+
+    def backup_now(self, throttled=True):
+        """Take one backup, verify it and apply the retention policy.
+
+        Returns the status dict that is also stored in last_status.
+        """
+        with self._run_lock:
+            started = datetime.now(timezone.utc)
+            status = {'started_at': started, 'ok': False, 'path': None, 'size': 0, 'error': None}
+            os.makedirs(self.backup_dir, exist_ok=True)
+            path = self._new_path(started)
+            archive_path = archive_backup_path(path)
+            partials = {'main': path + '.partial', 'archive': archive_path + '.partial'}
+            self._step_sleep = BACKUP_STEP_SLEEP if throttled else 0
+            try:
+                dests = {name: sqlite3.connect(partial) for name, partial in partials.items()}
+                try:
+                    with db_connection() as source:
+                        # Pin one WAL snapshot of each database so concurrent commits don't
+                        # restart the copy. main is pinned first: archiving commits the copy
+                        # before the delete, so a row missing from main's snapshot is
+                        # already in archive's.
+                        source.execute('BEGIN')
+                        try:
+                            for name in dests:
+                                source.execute(f'SELECT 1 FROM {name}.sqlite_master LIMIT 1').fetchall()
+                            for name, dest in dests.items():
+                                source.backup(dest, pages=BACKUP_PAGES_PER_STEP, progress=self._throttle, name=name)
+                        finally:
+                            source.rollback()
+                    for name, dest in dests.items():
+                        result = dest.execute('PRAGMA integrity_check').fetchone()[0]
+                        if result != 'ok':
+                            raise sqlite3.DatabaseError(f"integrity_check of {name} failed: {result}")
+                finally:
+                    for dest in dests.values():
+                        dest.close()
+                # The archive is renamed first so a finished main backup always has its pair
+                os.replace(partials['archive'], archive_path)
+                os.replace(partials['main'], path)
+                size = os.path.getsize(path) + os.path.getsize(archive_path)
+                status.update(ok=True, path=path, size=size)
+                self._prune()
+                logger.info(f"Backup written to {path} and {archive_path} ({status['size']} bytes)")
+            except Exception as e:
+                status['error'] = str(e)
+                logger.error(f"Backup failed: {e}")
+                for partial in partials.values():
+                    if os.path.exists(partial):
+                        os.remove(partial)
+            status['finished_at'] = datetime.now(timezone.utc)
+            self.last_status = status
+            return status
+
+    def _new_path(self, started):
+        """Path for a backup started at `started` that no earlier backup uses."""
+        base = os.path.join(self.backup_dir, started.strftime(BACKUP_NAME_FORMAT))
+        path, n = f"{base}.db", 0
+        while os.path.exists(path) or os.path.exists(archive_backup_path(path)):
+            n += 1
+            path = f"{base}_{n}.db"
+        return path
+
+    def _list_backups(self):
+        """Return (UTC timestamp, path) for every finished backup, newest first."""
+        backups = []
+        for name in os.listdir(self.backup_dir):
+            match = BACKUP_NAME_RE.match(name)
+            if match:
+                taken_at = datetime.strptime(match.group(1), "%Y%m%d_%H%M%S")
+                if match.group(2):
+                    taken_at = taken_at.replace(tzinfo=timezone.utc)
+                else:
+                    taken_at = taken_at.astimezone(timezone.utc)  # Older local-time name
+                backups.append((taken_at, int(match.group(3) or 0), os.path.join(self.backup_dir, name)))
+        backups.sort(reverse=True)
+        return [(taken_at, path) for taken_at, _, path in backups]
+
+    def _prune(self):
+        """Delete backups (with their archive pair) not kept by the hourly/daily/weekly retention policy.
+
+        Buckets are UTC hours, days and ISO weeks, so a DST change never merges
+        or splits them.
+        """
+        backups = self._list_backups()
+        keep = set()
+        buckets = {
+            'hourly': lambda ts: ts.strftime('%Y%m%d%H'),
+            'daily': lambda ts: ts.strftime('%Y%m%d'),
+            'weekly': lambda ts: ts.strftime('%G%V'),
+        }
+        for policy, bucket_of in buckets.items():
+            seen = set()
+            for taken_at, path in backups:
+                bucket = bucket_of(taken_at)
+                if bucket in seen:
+                    continue
+                if len(seen) >= RETENTION[policy]:
+                    break
+                # Newest backup in each bucket represents it
+                seen.add(bucket)
+                keep.add(path)
+        for _, path in backups:
+            if path not in keep:
+                for file_path in (path, archive_backup_path(path)):
+                    try:
+                        if os.path.exists(file_path):
+                            os.remove(file_path)
+                    except OSError as e:
+                        logger.error(f"Could not remove old backup {file_path}: {e}")
+
+    def status_text(self) -> str:
+        """Human readable summary of the last backup for the admin panel."""
+        status = self.last_status
+        if status is None:
+            backups = self._list_backups() if os.path.isdir(self.backup_dir) else []
+            if not backups:
+                return "💾 لم يتم أخذ أي نسخة احتياطية بعد"
+            taken_at, path = backups[0]
+            return (
+                "💾 آخر نسخة احتياطية (من جلسة سابقة):\n"
+                f"• الوقت: {taken_at.astimezone(DAMASCUS_TZ).strftime('%Y-%m-%d %H:%M:%S')}\n"
+                f"• الملف: {os.path.basename(path)}\n"
+                f"• عدد النسخ المحفوظة: {len(backups)}"
+            )
+        duration = (status['finished_at'] - status['started_at']).total_seconds()
+        lines = [
+            "💾 آخر نسخة احتياطية:",
+            f"• الوقت: {status['started_at'].astimezone(DAMASCUS_TZ).strftime('%Y-%m-%d %H:%M:%S')}",
+            f"• المدة: {duration:.1f} ثانية",
+        ]
+        if status['ok']:
+            lines.append("• الحالة: ✅ ناجحة (integrity_check سليم)")
+            lines.append(f"• الحجم: {status['size'] / 1024 / 1024:.2f} MB")
+            lines.append(f"• عدد النسخ المحفوظة: {len(self._list_backups())}")
+        else:
+            lines.append(f"• الحالة: ❌ فشلت ({status['error']})")
+        next_run = status['finished_at'] + timedelta(seconds=self.interval)
+        lines.append(f"• النسخة التالية: {next_run.astimezone(DAMASCUS_TZ).strftime('%H:%M')}")
+        return "\n".join(lines)
+
+
+_backup_manager = BackupManager()
+
+
+def get_backup_manager():
+    """Function to access the BackupManager instance."""
+    return _backup_manager
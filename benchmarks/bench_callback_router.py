@@ -0,0 +1,106 @@
+"""Callback routing cost: one CallbackQueryHandler per pattern vs CallbackRouter.
+
+Reads the routes registered in main.py (the conversation entry points and
+the application-level router), builds both dispatch setups from them, checks
+that they pick the same pattern for every sample callback, and reports the
+routing cost per callback update.
+
+    python benchmarks/bench_callback_router.py
+"""
+import os
+import ast
+import sys
+import time
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+from telegram import Update, CallbackQuery, User
+from telegram.ext import CallbackQueryHandler
+
+from callback_router import CallbackRouter
+from callback_codec import callback_pattern, encode_callback
+
+ROUNDS = 20000
+
+SAMPLES = [
+    'back_to_main', 'my_balance', 'game_pubg', 'app_yoho', 'buy_game_pubg_60 UC_0',
+    encode_callback('buy', 17, version=3), 'complete_order_123', 'cancel_order_77',
+    'confirm_payment_abc123', 'edit_pkg_5', 'page_app_>12.40', 'shop', 'charge', 'nomatch_x',
+]
+
+
+def _pattern(node):
+    """A route pattern from main.py: a string literal or callback_pattern('<action>')."""
+    if isinstance(node, ast.Constant) and isinstance(node.value, str):
+        return node.value
+    if isinstance(node, ast.Call) and getattr(node.func, 'id', None) == 'callback_pattern':
+        return callback_pattern(ast.literal_eval(node.args[0]))
+    raise ValueError(ast.dump(node))
+
+
+def main_py_routes():
+    """Pattern lists of the entry point router and the application-level router, in order."""
+    with open(os.path.join(REPO_DIR, 'main.py'), encoding='utf-8') as f:
+        tree = ast.parse(f.read())
+    calls = sorted(
+        (node for node in ast.walk(tree)
+         if isinstance(node, ast.Call) and getattr(node.func, 'id', None) == 'CallbackRouter'),
+        key=lambda node: node.lineno
+    )
+    routers = [[_pattern(route.elts[0]) for route in node.args[0].elts] for node in calls]
+    # The largest router is the entry points, the last one in the file the application level
+    return max(routers, key=len), routers[-1]
+
+
+async def _noop(update, context):
+    return None
+
+
+def first_match(handlers, update):
+    for handler in handlers:
+        result = handler.check_update(update)
+        if result is not None and result is not False:
+            return handler, result
+    return None, None
+
+
+def per_update_us(handlers, updates, rounds=ROUNDS):
+    started = time.perf_counter()
+    for _ in range(rounds):
+        for update in updates:
+            first_match(handlers, update)
+    return (time.perf_counter() - started) / rounds / len(updates) * 1e6
+
+
+def main():
+    entry, application = main_py_routes()
+    regex_handlers = [CallbackQueryHandler(_noop, pattern=p) for p in entry + application]
+    routers = [CallbackRouter([(p, _noop) for p in entry]), CallbackRouter([(p, _noop) for p in application])]
+    user = User(1, 'User', False)
+    updates = [
+        Update(i, callback_query=CallbackQuery(str(i), user, 'chat', data=data))
+        for i, data in enumerate(SAMPLES)
+    ]
+    print(f"{len(entry) + len(application)} patterns, {len(SAMPLES)} sample callbacks")
+
+    for data, update in zip(SAMPLES, updates):
+        handler, _ = first_match(regex_handlers, update)
+        router, result = first_match(routers, update)
+        old = handler.pattern.pattern if handler else None
+        new = result[0].pattern.pattern if router else None
+        assert old == new, f"{data!r}: {old} != {new}"
+        print(f"  {data!r:32} -> {old!s:42} {router.parse(data) if router else None}")
+
+    print(f"regex scan over CallbackQueryHandlers  {per_update_us(regex_handlers, updates):6.1f} us/update")
+    print(f"CallbackRouter, cached                 {per_update_us(routers, updates):6.1f} us/update")
+    started = time.perf_counter()
+    for data in SAMPLES:
+        for router in routers:
+            router._resolve_uncached(data)
+    cold = (time.perf_counter() - started) / len(SAMPLES) * 1e6
+    print(f"CallbackRouter, cold (trie walk)       {cold:6.1f} us/update")
+
+
+if __name__ == '__main__':
+    main()
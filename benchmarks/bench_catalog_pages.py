@@ -0,0 +1,90 @@
+"""Paged catalog menus on a generated 5,000-app catalog.
+
+Compares the old single keyboard holding every product with building one
+page from a keyset cursor (directly and through the keyboard cache), and
+checks that walking the cursors forward and back visits every product once.
+No database is needed: the snapshot is built from generated rows.
+
+    python benchmarks/bench_catalog_pages.py
+"""
+import os
+import sys
+import json
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+
+import catalog
+from keyboards import Keyboards, CATALOG_PAGE_SIZE
+
+PRODUCTS = 5000
+
+
+def generated_snapshot(n=PRODUCTS):
+    products = [(i + 1, 'app', f'app{i}', f'App {i}', '📱', '', None, i) for i in range(n)]
+    packages = [(i + 1, i + 1, '1 Month', 10000 + i) for i in range(n)]
+    return catalog.build_snapshot(1, products, packages)
+
+
+def walk(snapshot):
+    """Follow next cursors to the end, then prev cursors back; returns (forward ids, backward ids, longest callback)."""
+    forward, longest, cursor = [], 0, ''
+    while True:
+        items, prev_cursor, next_cursor = snapshot.page('app', cursor, CATALOG_PAGE_SIZE)
+        forward += [p.product_id for p in items]
+        if not next_cursor:
+            break
+        longest = max(longest, len(f"page_app_{next_cursor}".encode('utf-8')))
+        cursor = next_cursor
+    backward = [p.product_id for p in items]
+    cursor = prev_cursor
+    while cursor:
+        items, cursor, _ = snapshot.page('app', cursor, CATALOG_PAGE_SIZE)
+        backward = [p.product_id for p in items] + backward
+    return forward, backward, longest
+
+
+def whole_list(snapshot):
+    """The menu as it was before paging: every product in one keyboard."""
+    buttons = [
+        [InlineKeyboardButton(f"{p.icon} {p.name}", callback_data=f"app_{p.product_id}")]
+        for p in snapshot.ordered['app']
+    ]
+    buttons.append([InlineKeyboardButton("🔙 رجوع", callback_data="shop")])
+    return InlineKeyboardMarkup(buttons)
+
+
+def per_call_us(fn, n):
+    started = time.perf_counter()
+    for _ in range(n):
+        fn()
+    return (time.perf_counter() - started) / n * 1e6
+
+
+def markup_bytes(markup):
+    return len(json.dumps(markup.to_dict(), ensure_ascii=False).encode('utf-8'))
+
+
+def main():
+    snapshot = generated_snapshot()
+    catalog.get_catalog()._snapshot = snapshot
+
+    forward, backward, longest = walk(snapshot)
+    expected = [f'app{i}' for i in range(PRODUCTS)]
+    assert forward == expected and backward == expected, "cursor walk skipped or repeated products"
+    pages = -(-PRODUCTS // CATALOG_PAGE_SIZE)
+    print(f"{PRODUCTS} products, {pages} pages, longest page callback {longest} bytes")
+
+    middle = snapshot.page('app', '', CATALOG_PAGE_SIZE * (pages // 2))[2]
+    build = Keyboards.products_menu.__wrapped__
+    print(f"whole list in one keyboard  {per_call_us(lambda: whole_list(snapshot), 20) / 1000:8.1f} ms  "
+          f"{markup_bytes(whole_list(snapshot)) / 1024:7.1f} KiB markup")
+    print(f"one page, uncached          {per_call_us(lambda: build('app', middle), 20000) / 1000:8.2f} ms  "
+          f"{markup_bytes(build('app', middle)):7d} B markup")
+    print(f"one page, cached            {per_call_us(lambda: Keyboards.products_menu('app', middle), 200000):8.1f} us")
+
+
+if __name__ == '__main__':
+    main()
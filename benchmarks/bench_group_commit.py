@@ -0,0 +1,77 @@
+"""Write throughput: one transaction per write vs the group-commit writer queue.
+
+N asyncio writers each loop on the /start users upsert for DURATION
+seconds, once through AsyncDatabase.execute (its own BEGIN IMMEDIATE /
+COMMIT per write) and once through enqueue_execute (group commit). Run
+for 1, 10 and 100 writers on a scratch database.
+
+    python benchmarks/bench_group_commit.py
+"""
+import os
+import sys
+import time
+import shutil
+import asyncio
+import itertools
+import tempfile
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+WRITERS = (1, 10, 100)
+DURATION = 2.0
+UPSERT_SQL = '''
+    INSERT INTO users (user_id, username, first_name, joined_date, last_activity)
+    VALUES (?, ?, ?, ?, ?)
+    ON CONFLICT (user_id) DO UPDATE SET last_activity = excluded.last_activity
+'''
+
+
+def setup_database():
+    """A migrated scratch database in a temporary directory."""
+    workdir = tempfile.mkdtemp(prefix='bench_group_commit_')
+    os.chdir(workdir)
+    import database
+    database.init_db()
+    database.init_wal()
+    return workdir
+
+
+async def throughput(writers, grouped, user_ids):
+    """Writes committed per second by `writers` concurrent loops."""
+    from database import get_async_db, now_ms
+    db = get_async_db()
+    write = db.enqueue_execute if grouped else db.execute
+    deadline = time.perf_counter() + DURATION
+    done = 0
+
+    async def writer():
+        nonlocal done
+        while time.perf_counter() < deadline:
+            now = now_ms()
+            await write(UPSERT_SQL, (next(user_ids), 'bench', 'Bench', now, now))
+            done += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(writer() for _ in range(writers)))
+    return done / (time.perf_counter() - started)
+
+
+def main():
+    workdir = setup_database()
+    try:
+        user_ids = itertools.count(1)
+        print(f"{'writers':>7}  {'commit-per-write':>16}  {'group-commit':>12}")
+        for writers in WRITERS:
+            single = asyncio.run(throughput(writers, False, user_ids))
+            grouped = asyncio.run(throughput(writers, True, user_ids))
+            print(f"{writers:7}  {single:10,.0f} ops/s  {grouped:6,.0f} ops/s")
+    finally:
+        import database
+        database.close_pool()
+        os.chdir(REPO_DIR)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+"""Keyboard memoization: rebuilding menus per callback vs the keyboard cache.
+
+Rotates through the menus a typical session opens and reports the time and
+the transient allocation per callback, once calling the builders directly
+and once through keyboard_cache.
+
+    python benchmarks/bench_keyboards.py
+"""
+import os
+import sys
+import time
+import shutil
+import tempfile
+import tracemalloc
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+CALLBACKS = 20000
+ALLOC_CALLBACKS = 700
+
+
+def setup_catalog():
+    """Load products.json into a scratch database in a temporary directory."""
+    workdir = tempfile.mkdtemp(prefix='bench_keyboards_')
+    shutil.copy(os.path.join(REPO_DIR, 'products.json'), workdir)
+    os.chdir(workdir)
+    import database
+    from catalog import get_catalog
+    from config import get_config
+    database.init_db()
+    get_catalog().load()
+    get_config().store.load()
+    return workdir
+
+
+def menus(direct):
+    from keyboards import Keyboards
+    builders = [
+        (Keyboards.main_menu, (True,)),
+        (Keyboards.shop_menu, ()),
+        (Keyboards.admin_panel, ()),
+        (Keyboards.edit_prices_menu, ()),
+        (Keyboards.admin_rates, ()),
+        (Keyboards.product_packages, ('game', 'pubg')),
+        (Keyboards.products_menu, ('app',)),
+    ]
+    return [(fn.__wrapped__ if direct else fn, args) for fn, args in builders]
+
+
+def time_per_callback(calls, n=CALLBACKS):
+    started = time.perf_counter()
+    for i in range(n):
+        fn, args = calls[i % len(calls)]
+        fn(*args)
+    return (time.perf_counter() - started) / n * 1e6
+
+
+def allocation_per_callback(calls, n=ALLOC_CALLBACKS):
+    """Average peak memory allocated while serving one callback, in bytes."""
+    tracemalloc.start()
+    total = 0
+    for i in range(n):
+        current = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        fn, args = calls[i % len(calls)]
+        fn(*args)
+        total += tracemalloc.get_traced_memory()[1] - current
+    tracemalloc.stop()
+    return total / n
+
+
+def main():
+    workdir = setup_catalog()
+    try:
+        from keyboards import keyboard_cache
+        for label, direct in (('rebuild per callback', True), ('cached', False)):
+            calls = menus(direct)
+            calls[0][0](*calls[0][1])  # Warm up imports
+            us = time_per_callback(calls)
+            allocated = allocation_per_callback(calls)
+            print(f"{label:22} {us:8.1f} us/callback  {allocated / 1024:6.2f} KiB allocated/callback")
+        print(f"cache hits={keyboard_cache.hits} misses={keyboard_cache.misses}")
+    finally:
+        import database
+        database.close_pool()
+        os.chdir(REPO_DIR)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+"""Per-request connection overhead: a fresh sqlite3.connect vs a pool checkout.
+
+Each request is the /start user upsert (INSERT OR IGNORE into users) on a
+scratch database, run REQUESTS times per variant:
+
+- fresh, bare: sqlite3.connect + commit + close, as handlers did before the
+  pool (this also commits with the default synchronous=FULL)
+- fresh, configured: a new connection with the standard PRAGMAs and the
+  archive attached (what a pool checkout saves today)
+- pooled: db_connection() checkout
+
+    python benchmarks/bench_pool.py
+"""
+import os
+import sys
+import time
+import shutil
+import sqlite3
+import tempfile
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+REQUESTS = 5000
+UPSERT_SQL = '''
+    INSERT OR IGNORE INTO users (user_id, username, first_name, joined_date, last_activity)
+    VALUES (?, ?, ?, ?, ?)
+'''
+
+
+def setup_database():
+    """A migrated scratch database in a temporary directory."""
+    workdir = tempfile.mkdtemp(prefix='bench_pool_')
+    os.chdir(workdir)
+    import database
+    database.init_db()
+    database.init_wal()
+    return workdir
+
+
+def fresh_bare(user_id, now):
+    import database
+    conn = sqlite3.connect(database.DB_PATH)
+    try:
+        conn.execute(UPSERT_SQL, (user_id, 'bench', 'Bench', now, now))
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def fresh_configured(user_id, now):
+    import database
+    conn = database._open_connection()
+    try:
+        conn.execute(UPSERT_SQL, (user_id, 'bench', 'Bench', now, now))
+    finally:
+        conn.close()
+
+
+def pooled(user_id, now):
+    import database
+    with database.db_connection() as conn:
+        conn.execute(UPSERT_SQL, (user_id, 'bench', 'Bench', now, now))
+
+
+def time_per_request(request, first_id, n=REQUESTS):
+    from database import now_ms
+    now = now_ms()
+    started = time.perf_counter()
+    for user_id in range(first_id, first_id + n):
+        request(user_id, now)
+    return (time.perf_counter() - started) / n * 1e6
+
+
+def main():
+    workdir = setup_database()
+    try:
+        variants = (('fresh, bare', fresh_bare), ('fresh, configured', fresh_configured), ('pooled', pooled))
+        results = {}
+        for i, (label, request) in enumerate(variants):
+            request(0, 0)  # Warm up imports (and the pool)
+            results[label] = time_per_request(request, (i + 1) * REQUESTS)
+        for label, us in results.items():
+            speedup = us / results['pooled']
+            print(f"{label:18} {us:8.1f} us/request  ({speedup:5.1f}x the pooled time)")
+    finally:
+        import database
+        database.close_pool()
+        os.chdir(REPO_DIR)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,162 @@
+"""Webhook with the update inbox vs long polling, against a local fake Bot API.
+
+Both modes run the same application with one echo handler. Reply latency
+is measured from the moment an update is available (POSTed to the webhook,
+or handed to getUpdates) to the bot's sendMessage for it.
+
+- light: one update every 20 ms
+- burst: BURST updates at once; the webhook gets them over 40 connections
+
+    python benchmarks/bench_webhook.py
+"""
+import os
+import sys
+import time
+import shutil
+import asyncio
+import logging
+import tempfile
+from statistics import median, quantiles
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+sys.path.insert(0, os.path.join(REPO_DIR, 'tests'))
+
+LIGHT = 200
+LIGHT_INTERVAL = 0.02
+BURST = 2000
+CONNECTIONS = 40
+SECRET = 'bench-secret'
+
+
+def setup_database():
+    """A migrated scratch database in a temporary directory."""
+    workdir = tempfile.mkdtemp(prefix='bench_webhook_')
+    os.chdir(workdir)
+    import database
+    database.init_db()
+    database.init_wal()
+    return workdir
+
+
+async def _reply(update, context):
+    await update.message.reply_text(f"got {update.message.text}")
+
+
+async def _application(api, polling):
+    from telegram.ext import Application, MessageHandler, filters
+    from fake_bot_api import BOT_TOKEN
+    builder = Application.builder().token(BOT_TOKEN).base_url(api.base_url)
+    if not polling:
+        builder.updater(None)
+    application = builder.build()
+    application.add_handler(MessageHandler(filters.TEXT, _reply))
+    await application.initialize()
+    await application.start()
+    return application
+
+
+def _updates(first_id, count):
+    from fake_bot_api import make_update
+    return [make_update(update_id) for update_id in range(first_id, first_id + count)]
+
+
+async def _deliver_webhook(api, updates, burst):
+    """Deliver through the webhook; returns ({chat_id: time available}, seconds to ack a burst)."""
+    from webhook_manager import WebhookServer, InboxConsumer, WEBHOOK_PATH
+    from fake_bot_api import WebhookClient
+    application = await _application(api, polling=False)
+    consumer = InboxConsumer(application)
+    await consumer.start()
+    server = WebhookServer(SECRET, on_stored=consumer.wake)
+    port = (await server.start('127.0.0.1', 0)).sockets[0].getsockname()[1]
+    client = WebhookClient(port, WEBHOOK_PATH, SECRET)
+    available = {}
+    try:
+        if burst:
+            started = time.monotonic()
+            available = {u['message']['chat']['id']: started for u in updates}
+            await client.post_all(updates, connections=CONNECTIONS)
+            acked = time.monotonic() - started
+        else:
+            reader, writer = await asyncio.open_connection('127.0.0.1', port)
+            for update in updates:
+                available[update['message']['chat']['id']] = time.monotonic()
+                await client.post(reader, writer, update)
+                await asyncio.sleep(LIGHT_INTERVAL)
+            writer.close()
+            acked = None
+        await api.wait_for_sent(len(updates), timeout=120)
+    finally:
+        await server.stop()
+        await consumer.stop()
+        await application.stop()
+        await application.shutdown()
+    return available, acked
+
+
+async def _deliver_polling(api, updates, burst):
+    """Deliver through long polling; returns ({chat_id: time available}, None)."""
+    application = await _application(api, polling=True)
+    await application.updater.start_polling(poll_interval=0, timeout=10)
+    available = {}
+    try:
+        if burst:
+            started = time.monotonic()
+            available = {u['message']['chat']['id']: started for u in updates}
+            api.push_updates(updates)
+        else:
+            for update in updates:
+                available[update['message']['chat']['id']] = time.monotonic()
+                api.push_updates([update])
+                await asyncio.sleep(LIGHT_INTERVAL)
+        await api.wait_for_sent(len(updates), timeout=120)
+    finally:
+        await application.updater.stop()
+        await application.stop()
+        await application.shutdown()
+    return available, None
+
+
+async def run(mode, burst, count):
+    from fake_bot_api import FakeBotApi
+    api = FakeBotApi()
+    await api.start()
+    try:
+        deliver = _deliver_webhook if mode == 'webhook' else _deliver_polling
+        available, acked = await deliver(api, _updates(1, count), burst)
+        latencies = [api.sent_at[chat_id] - at for chat_id, at in available.items() if chat_id in api.sent_at]
+        finished = max(api.sent_at.values()) - min(available.values())
+    finally:
+        await api.stop()
+    return len(latencies), latencies, finished, acked
+
+
+def report(label, mode, result, count):
+    answered, latencies, finished, acked = result
+    p50 = median(latencies) * 1000
+    p95 = quantiles(latencies, n=20)[-1] * 1000
+    line = f"{label:6} {mode:8} answered {answered}/{count}  reply p50 {p50:8.1f} ms  p95 {p95:8.1f} ms"
+    if acked is not None:
+        line += f"  acked in {acked:.2f} s ({count / acked:.0f}/s)"
+    if label == 'burst':
+        line += f"  answered in {finished:.2f} s ({answered / finished:.0f}/s)"
+    print(line)
+
+
+def main():
+    logging.basicConfig(level=logging.WARNING)
+    workdir = setup_database()
+    try:
+        for label, burst, count in (('light', False, LIGHT), ('burst', True, BURST)):
+            for mode in ('webhook', 'polling'):
+                report(label, mode, asyncio.run(run(mode, burst, count)), count)
+    finally:
+        import database
+        database.close_pool()
+        os.chdir(REPO_DIR)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
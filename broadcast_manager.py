@@ -0,0 +1,245 @@
+import os
+import time
+import asyncio
+import logging
+from typing import NamedTuple, Optional
+
+from telegram.error import Forbidden
+
+from database import get_async_db, now_ms
+from send_manager import get_send_queue, TokenBucket, BULK
+
+# Logger
+logger = logging.getLogger(__name__)
+
+# Settings
+BROADCAST_RATE = float(os.getenv('BROADCAST_PER_SECOND', '20'))  # Leaves room under the global limit
+BROADCAST_BATCH_SIZE = int(os.getenv('BROADCAST_BATCH_SIZE', '100'))
+
+# Users a broadcast goes to
+RECIPIENT_FILTER = "COALESCE(status, 'active') = 'active' AND blocked_bot = 0"
+
+
+class Broadcast(NamedTuple):
+    """A broadcasts row."""
+    broadcast_id: int
+    text: str
+    status: str
+    cursor: int
+    total: int
+    sent: int
+    failed: int
+    blocked: int
+    created_by: int
+    created_at: int
+    updated_at: int
+    finished_at: Optional[int]
+
+    @property
+    def done(self):
+        return self.sent + self.failed + self.blocked
+
+
+BROADCAST_COLUMNS = ', '.join(Broadcast._fields)
+
+
+def count_recipients(conn):
+    return conn.execute(f"SELECT COUNT(*) FROM users WHERE {RECIPIENT_FILTER}").fetchone()[0]
+
+
+def _next_recipients(conn, cursor, limit):
+    """The next user_ids after `cursor`; a primary key range scan, whatever the table size."""
+    return [row[0] for row in conn.execute(
+        f"SELECT user_id FROM users WHERE user_id > ? AND {RECIPIENT_FILTER} ORDER BY user_id LIMIT ?",
+        (cursor, limit)
+    )]
+
+
+def _create(conn, text, admin_id):
+    now = now_ms()
+    return conn.execute(
+        f"INSERT INTO broadcasts (text, total, created_by, created_at, updated_at) VALUES (?, ?, ?, ?, ?) "
+        f"RETURNING {BROADCAST_COLUMNS}",
+        (text, count_recipients(conn), admin_id, now, now)
+    ).fetchone()
+
+
+def _record_batch(conn, broadcast_id, cursor, sent, failed, blocked_ids):
+    if blocked_ids:
+        conn.executemany("UPDATE users SET blocked_bot = 1 WHERE user_id = ?", [(u,) for u in blocked_ids])
+    conn.execute('''
+        UPDATE broadcasts SET cursor = ?, sent = sent + ?, failed = failed + ?, blocked = blocked + ?,
+            updated_at = ?
+        WHERE broadcast_id = ?
+    ''', (cursor, sent, failed, len(blocked_ids), now_ms(), broadcast_id))
+
+
+def _set_status(conn, broadcast_id, status, from_statuses):
+    placeholders = ','.join('?' * len(from_statuses))
+    now = now_ms()
+    finished = now if status in ('completed', 'cancelled') else None
+    return conn.execute(
+        f"UPDATE broadcasts SET status = ?, updated_at = ?, finished_at = ? "
+        f"WHERE broadcast_id = ? AND status IN ({placeholders})",
+        (status, now, finished, broadcast_id, *from_statuses)
+    ).rowcount
+
+
+def _get(conn, broadcast_id):
+    row = conn.execute(
+        f"SELECT {BROADCAST_COLUMNS} FROM broadcasts WHERE broadcast_id = ?", (broadcast_id,)
+    ).fetchone()
+    return Broadcast(*row) if row else None
+
+
+def _latest(conn):
+    row = conn.execute(
+        f"SELECT {BROADCAST_COLUMNS} FROM broadcasts ORDER BY broadcast_id DESC LIMIT 1"
+    ).fetchone()
+    return Broadcast(*row) if row else None
+
+
+class BroadcastManager:
+    """Sends admin broadcasts to every active user, resumably.
+
+    Recipients are read BROADCAST_BATCH_SIZE at a time with a keyset cursor
+    on user_id, so memory does not grow with the user count. Each batch goes
+    through the send queue at BULK priority (customer replies overtake it)
+    and at most BROADCAST_RATE messages per second. When a batch is done its
+    counts and the cursor are committed together, so after a restart the
+    broadcast resumes at the first unfinished batch. A user whose send is
+    Forbidden (blocked the bot, deactivated) is marked blocked_bot and
+    skipped by later broadcasts until they /start again.
+    """
+
+    def __init__(self):
+        self._tasks = {}  # broadcast_id -> asyncio.Task
+        self._progress = {}  # broadcast_id -> (monotonic start, messages done in this run)
+
+    def is_running(self, broadcast_id):
+        task = self._tasks.get(broadcast_id)
+        return task is not None and not task.done()
+
+    async def create(self, text, admin_id, bot):
+        """Start a new broadcast to all current recipients."""
+        broadcast = Broadcast(*await get_async_db().enqueue_write(_create, text, admin_id))
+        logger.info(f"Broadcast {broadcast.broadcast_id} started by {admin_id} to {broadcast.total} users")
+        self._launch(broadcast.broadcast_id, bot)
+        return broadcast
+
+    def _launch(self, broadcast_id, bot):
+        if not self.is_running(broadcast_id):
+            self._tasks[broadcast_id] = asyncio.get_running_loop().create_task(self._run(broadcast_id, bot))
+
+    async def _run(self, broadcast_id, bot):
+        db = get_async_db()
+        queue = get_send_queue()
+        bucket = TokenBucket(BROADCAST_RATE, 1)
+        started = time.monotonic()
+        self._progress[broadcast_id] = (started, 0)
+        try:
+            while True:
+                broadcast = await db.run_read(_get, broadcast_id)
+                if broadcast is None or broadcast.status != 'running':
+                    return
+                user_ids = await db.run_read(_next_recipients, broadcast.cursor, BROADCAST_BATCH_SIZE)
+                if not user_ids:
+                    await db.enqueue_write(_set_status, broadcast_id, 'completed', ('running',))
+                    logger.info(f"Broadcast {broadcast_id} completed")
+                    return
+
+                futures = []
+                for user_id in user_ids:
+                    wait = bucket.delay(time.monotonic())
+                    if wait > 0:
+                        await asyncio.sleep(wait)
+                        bucket.delay(time.monotonic())
+                    bucket.take()
+                    futures.append(queue.send_message(bot, user_id, broadcast.text, priority=BULK))
+                results = await asyncio.gather(*futures, return_exceptions=True)
+
+                blocked = [u for u, r in zip(user_ids, results) if isinstance(r, Forbidden)]
+                failed = sum(1 for r in results if isinstance(r, Exception)) - len(blocked)
+                sent = len(results) - failed - len(blocked)
+                await db.enqueue_write(_record_batch, broadcast_id, user_ids[-1], sent, failed, blocked)
+                self._progress[broadcast_id] = (started, self._progress[broadcast_id][1] + len(results))
+        except Exception as e:
+            logger.error(f"Broadcast {broadcast_id} stopped: {e}")
+            await db.enqueue_write(_set_status, broadcast_id, 'paused', ('running',))
+        finally:
+            self._tasks.pop(broadcast_id, None)
+
+    async def pause(self, broadcast_id):
+        """Stop after the batch in flight; resume() continues from there."""
+        return await get_async_db().enqueue_write(_set_status, broadcast_id, 'paused', ('running',)) > 0
+
+    async def resume(self, broadcast_id, bot):
+        changed = await get_async_db().enqueue_write(_set_status, broadcast_id, 'running', ('paused', 'running'))
+        if changed:
+            self._launch(broadcast_id, bot)
+        return changed > 0
+
+    async def cancel(self, broadcast_id):
+        return await get_async_db().enqueue_write(
+            _set_status, broadcast_id, 'cancelled', ('running', 'paused')
+        ) > 0
+
+    async def resume_all(self, bot):
+        """Restart every broadcast that was running when the bot stopped."""
+        rows = await get_async_db().fetchall("SELECT broadcast_id FROM broadcasts WHERE status = 'running'")
+        for (broadcast_id,) in rows:
+            logger.info(f"Resuming broadcast {broadcast_id}")
+            self._launch(broadcast_id, bot)
+        return len(rows)
+
+    async def latest(self):
+        return await get_async_db().run_read(_latest)
+
+    def status_text(self, broadcast) -> str:
+        """Progress and ETA of a broadcast for the admin panel."""
+        if broadcast is None:
+            return "📢 لا توجد إذاعات سابقة"
+        labels = {
+            'running': '🟢 جارية', 'paused': '⏸ متوقفة مؤقتاً',
+            'completed': '✅ مكتملة', 'cancelled': '🚫 ملغاة',
+        }
+        done = broadcast.done
+        percent = done / broadcast.total * 100 if broadcast.total else 100
+        lines = [
+            f"📢 الإذاعة #{broadcast.broadcast_id}: {labels[broadcast.status]}",
+            f"• التقدم: {done:,} / {broadcast.total:,} ({min(percent, 100):.1f}%)",
+            f"• أُرسلت: {broadcast.sent:,}، فشلت: {broadcast.failed:,}، حظروا البوت: {broadcast.blocked:,}",
+        ]
+        started, processed = self._progress.get(broadcast.broadcast_id, (None, 0))
+        if broadcast.status == 'running' and started is not None and processed:
+            rate = processed / max(time.monotonic() - started, 1e-9)
+            remaining = max(broadcast.total - done, 0)
+            lines.append(f"• السرعة: {rate:.1f} رسالة/ث، الوقت المتبقي: ~{_format_duration(remaining / rate)}")
+        lines += ["", f"📝 {broadcast.text[:200]}"]
+        return '\n'.join(lines)
+
+
+def _format_duration(seconds):
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    if hours:
+        return f"{hours} س {minutes} د"
+    if minutes:
+        return f"{minutes} د {seconds} ث"
+    return f"{seconds} ث"
+
+
+async def resume_broadcasts(context):
+    """Job: resume broadcasts interrupted by a restart."""
+    try:
+        await get_broadcast_manager().resume_all(context.bot)
+    except Exception as e:
+        logger.error(f"Error resuming broadcasts: {e}")
+
+
+_broadcast_manager = BroadcastManager()
+
+
+def get_broadcast_manager():
+    """Function to access the BroadcastManager instance."""
+    return _broadcast_manager
@@ -0,0 +1,76 @@
+import base64
+import binascii
+from typing import NamedTuple, Optional
+
+# Compact callback_data: '~' + one action character + base64url (unpadded) of
+#   [format byte][varint catalog version][varint id]...
+# e.g. a buy button for package 1234 at catalog version 5678 is '~bAa4s0gk' (9 bytes),
+# well inside Telegram's 64-byte limit whatever the product is called.
+PREFIX = '~'
+FORMAT = 1
+
+ACTIONS = {
+    'buy': 'b',           # ids: package_id
+    'edit_product': 'e',  # ids: product_pk
+    'edit_package': 'p',  # ids: package_id
+}
+_ACTION_NAMES = {code: name for name, code in ACTIONS.items()}
+
+
+class CallbackPayload(NamedTuple):
+    """A decoded compact callback."""
+    action: str
+    version: int
+    ids: tuple
+
+
+def _varint(value, out):
+    if value < 0:
+        raise ValueError(f"Callback values must be non-negative, got {value!r}")
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def encode_callback(action, *ids, version=0) -> str:
+    """Encode an action, catalog version and numeric ids as callback_data."""
+    out = bytearray([FORMAT])
+    _varint(version, out)
+    for value in ids:
+        _varint(value, out)
+    return PREFIX + ACTIONS[action] + base64.urlsafe_b64encode(out).rstrip(b'=').decode('ascii')
+
+
+def decode_callback(data) -> Optional[CallbackPayload]:
+    """Decode callback_data from encode_callback; None if it is not a valid compact callback."""
+    if not isinstance(data, str) or len(data) < 3 or data[0] != PREFIX:
+        return None
+    action = _ACTION_NAMES.get(data[1])
+    if action is None:
+        return None
+    body = data[2:]
+    try:
+        raw = base64.b64decode(body + '=' * (-len(body) % 4), altchars=b'-_', validate=True)
+    except (binascii.Error, ValueError):
+        return None
+    if not raw or raw[0] != FORMAT:
+        return None
+
+    values = []
+    value = shift = 0
+    for byte in raw[1:]:
+        value |= (byte & 0x7F) << shift
+        if byte & 0x80:
+            shift += 7
+            continue
+        values.append(value)
+        value = shift = 0
+    if shift or not values:
+        return None  # Truncated varint
+    return CallbackPayload(action, values[0], tuple(values[1:]))
+
+
+def callback_pattern(action) -> str:
+    """Router pattern matching compact callbacks of one action."""
+    return f"^{PREFIX}{ACTIONS[action]}"
@@ -0,0 +1,136 @@
+import re
+import functools
+from typing import NamedTuple
+
+from telegram import Update
+from telegram.ext import CallbackQueryHandler
+
+# Characters that end the literal part of a pattern
+_REGEX_META = set('.^$*+?{}[]\\|()')
+
+
+class Route(NamedTuple):
+    """One registered pattern and its callback, in registration order."""
+    order: int
+    pattern: re.Pattern
+    callback: object
+    prefix: str
+
+
+class Action(NamedTuple):
+    """callback_data parsed once: the route's literal prefix and the remaining fields."""
+    name: str
+    args: tuple
+
+
+def literal_prefixes(pattern):
+    """Literal strings every match of an anchored pattern starts with.
+
+    '^shop$' -> ['shop'], '^edit_(game|app)_[^_]+$' -> ['edit_game_', 'edit_app_'].
+    A leading group of plain alternatives is expanded; anything else ends the
+    prefix. Unanchored patterns get [''], i.e. they are tried for every update.
+    """
+    if not pattern.startswith('^'):
+        return ['']
+    prefixes = ['']
+    i = 1
+    while i < len(pattern):
+        char = pattern[i]
+        if char == '\\' and i + 1 < len(pattern) and not pattern[i + 1].isalnum():
+            prefixes = [p + pattern[i + 1] for p in prefixes]
+            i += 2
+            continue
+        if char == '(':
+            end = pattern.find(')', i)
+            options = pattern[i + 1:end].split('|') if end != -1 else None
+            quantified = end != -1 and end + 1 < len(pattern) and pattern[end + 1] in '?*{'
+            if not options or quantified or any(set(o) & _REGEX_META for o in options):
+                break
+            prefixes = [p + o for p in prefixes for o in options]
+            i = end + 1
+            continue
+        if char in _REGEX_META:
+            # A quantifier makes the previous character optional or repeated
+            if char in '?*{':
+                prefixes = [p[:-1] for p in prefixes]
+            break
+        prefixes = [p + char for p in prefixes]
+        i += 1
+    return prefixes
+
+
+class CallbackRouter(CallbackQueryHandler):
+    """A single CallbackQueryHandler that dispatches to many (pattern, callback) routes.
+
+    Routes are stored in a character trie keyed by each pattern's literal
+    prefix. An update walks the trie once along its callback_data and only the
+    patterns found on that path are matched, in registration order, so the
+    first registered matching pattern wins exactly as it did with one handler
+    per pattern. Resolutions are cached per callback_data string.
+
+    Works as an entry point, state handler or fallback of a ConversationHandler:
+    the routed callback's return value is passed through.
+    """
+
+    def __init__(self, routes=(), block=True, cache_size=4096):
+        super().__init__(self._unrouted, block=block)
+        self._routes = []
+        self._trie = {}
+        self._resolve = functools.lru_cache(maxsize=cache_size)(self._resolve_uncached)
+        for pattern, callback in routes:
+            self.add(pattern, callback)
+
+    def add(self, pattern, callback):
+        """Register a route; same pattern syntax as CallbackQueryHandler."""
+        compiled = re.compile(pattern)
+        order = len(self._routes)
+        self._routes.append((compiled, callback))
+        for prefix in literal_prefixes(compiled.pattern):
+            route = Route(order, compiled, callback, prefix.rstrip('_'))
+            node = self._trie
+            for char in prefix:
+                node = node.setdefault(char, {})
+            node.setdefault(None, []).append(route)
+        self._resolve.cache_clear()
+        return self
+
+    def _resolve_uncached(self, data):
+        candidates = list(self._trie.get(None, ()))
+        node = self._trie
+        for char in data:
+            node = node.get(char)
+            if node is None:
+                break
+            candidates.extend(node.get(None, ()))
+        candidates.sort()
+        for route in candidates:
+            match = route.pattern.match(data)
+            if match:
+                rest = data[len(route.prefix):].lstrip('_')
+                return route, match, Action(route.prefix, tuple(rest.split('_')) if rest else ())
+        return None
+
+    def check_update(self, update):
+        if not isinstance(update, Update) or not update.callback_query:
+            return None
+        data = update.callback_query.data
+        if not isinstance(data, str):
+            return None
+        return self._resolve(data)
+
+    def collect_additional_context(self, context, update, application, check_result):
+        _, match, _ = check_result
+        context.matches = [match]
+
+    async def handle_update(self, update, application, check_result, context):
+        self.collect_additional_context(context, update, application, check_result)
+        route, _, _ = check_result
+        return await route.callback(update, context)
+
+    def parse(self, data):
+        """Return the Action callback_data is dispatched as, or None."""
+        resolved = self._resolve(data)
+        return resolved[2] if resolved else None
+
+    async def _unrouted(self, update, context):
+        return None
@@ -0,0 +1,419 @@
+import os
+import json
+import asyncio
+import logging
+import tempfile
+from bisect import bisect_left, bisect_right
+from dataclasses import dataclass
+from typing import NamedTuple
+from types import MappingProxyType
+from collections.abc import Mapping
+
+from database import db_connection, get_async_db
+from migrations import import_products_data, set_package_costs, PRODUCTS_JSON_PATH
+
+# Logger
+logger = logging.getLogger(__name__)
+
+# Settings
+CHECK_INTERVAL = 1.0  # Seconds between catalog version checks
+
+PRODUCT_TYPES = {'game': 'games', 'app': 'apps'}
+
+
+@dataclass(frozen=True)
+class Package:
+    """One purchasable package of a product."""
+    package_id: int
+    product_type: str
+    product_id: str
+    index: int
+    label: str
+    price: int
+
+    @property
+    def key(self):
+        return f"{self.product_type}:{self.product_id}:{self.index}"
+
+
+@dataclass(frozen=True)
+class Product:
+    """A game or app with its active packages."""
+    product_pk: int
+    product_type: str
+    product_id: str
+    name: str
+    icon: str
+    note: str
+    sort_order: int
+    packages: tuple
+
+    @property
+    def sort_key(self):
+        return (self.sort_order, self.product_pk)
+
+
+class PriceRow(NamedTuple):
+    """A package price in every currency customers can pay in."""
+    syp: int
+    usd: float
+    usdt: float
+
+
+@dataclass(frozen=True)
+class CatalogSnapshot:
+    """Immutable view of the catalog at one version."""
+    version: int
+    games: Mapping
+    apps: Mapping
+    products: Mapping
+    products_by_pk: Mapping
+    packages: Mapping
+    rates: Mapping  # currency -> SYP per unit
+    prices: Mapping  # package_id -> PriceRow at these rates
+    ordered: Mapping  # product_type -> tuple of Product in display order
+    sort_keys: Mapping  # product_type -> tuple of Product.sort_key, for bisect
+
+    def section(self, product_type):
+        """products.json-shaped mapping for 'game' or 'app'."""
+        return self.games if product_type == 'game' else self.apps
+
+    def product(self, product_type, product_id):
+        """Look up a product, or None."""
+        return self.products.get((product_type, product_id))
+
+    def product_by_pk(self, product_pk):
+        """Look up a product by its database id, or None."""
+        return self.products_by_pk.get(product_pk)
+
+    def package(self, product_type, product_id, index):
+        """Look up a package by its position in the product, or None."""
+        product = self.products.get((product_type, product_id))
+        if product is None or not 0 <= index < len(product.packages):
+            return None
+        return product.packages[index]
+
+    def package_by_id(self, package_id):
+        """Look up a package by its database id, or None."""
+        return self.packages.get(package_id)
+
+    def page(self, product_type, cursor, size):
+        """Return (products, prev_cursor, next_cursor) for one page.
+
+        Cursors are keyset positions (see encode_cursor), so a page stays
+        anchored to its neighbours when products are added or removed.
+        Missing neighbours are returned as None.
+        """
+        products = self.ordered.get(product_type, ())
+        start, end = self.page_range(product_type, cursor, size)
+        items = products[start:end]
+        prev_cursor = encode_cursor('<', items[0]) if items and start > 0 else None
+        next_cursor = encode_cursor('>', items[-1]) if items and end < len(products) else None
+        return items, prev_cursor, next_cursor
+
+    def page_range(self, product_type, cursor, size):
+        """Return the (start, end) slice of the display order that a cursor's page covers."""
+        keys = self.sort_keys.get(product_type, ())
+        direction, key = decode_cursor(cursor)
+        if direction == '<':
+            end = bisect_left(keys, key)
+            start = max(0, end - size)
+            if start == 0:
+                end = min(size, len(keys))
+        else:
+            start = bisect_right(keys, key) if direction == '>' else 0
+            end = start + size
+        return start, end
+
+
+def encode_cursor(direction, product):
+    """Encode a keyset cursor: '>' pages after the product, '<' before it."""
+    sort_order, product_pk = product.sort_key
+    return f"{direction}{sort_order}.{product_pk}"
+
+
+def decode_cursor(cursor):
+    """Decode a cursor from encode_cursor; anything else means the first page."""
+    if cursor and cursor[0] in '<>':
+        sort_order, _, product_pk = cursor[1:].partition('.')
+        try:
+            return cursor[0], (int(sort_order), int(product_pk))
+        except ValueError:
+            pass
+    return None, None
+
+
+def _freeze(value):
+    """Recursively convert JSON data into read-only containers."""
+    if isinstance(value, dict):
+        return MappingProxyType({k: _freeze(v) for k, v in value.items()})
+    if isinstance(value, list):
+        return tuple(_freeze(v) for v in value)
+    return value
+
+
+def _read_catalog(conn):
+    """Read the catalog version and active rows in one read transaction."""
+    conn.execute('BEGIN')
+    try:
+        version = conn.execute("SELECT version FROM catalog_meta WHERE id = 1").fetchone()[0]
+        products = conn.execute("""
+            SELECT product_pk, product_type, product_id, name, icon, note, package_size, sort_order
+            FROM products WHERE active = 1
+            ORDER BY product_type, sort_order, product_pk
+        """).fetchall()
+        packages = conn.execute("""
+            SELECT package_id, product_pk, label, price
+            FROM packages WHERE active = 1
+            ORDER BY product_pk, sort_order, package_id
+        """).fetchall()
+        rates = conn.execute("""
+            SELECT currency, rate FROM rate_history
+            WHERE rate_id IN (SELECT MAX(rate_id) FROM rate_history GROUP BY currency)
+        """).fetchall()
+    finally:
+        conn.rollback()
+    return version, products, packages, rates
+
+
+def build_snapshot(version, product_rows, package_rows, rate_rows=()):
+    """Build a snapshot from catalog rows."""
+    packages_by_product = {}
+    for package_id, product_pk, label, price in package_rows:
+        packages_by_product.setdefault(product_pk, []).append((package_id, label, price))
+
+    products = {}
+    packages = {}
+    ordered = {'game': [], 'app': []}
+    sections = {'games': {}, 'apps': {}}
+    for product_pk, product_type, product_id, name, icon, note, package_size, sort_order in product_rows:
+        rows = packages_by_product.get(product_pk, [])
+        product_packages = tuple(
+            Package(package_id, product_type, product_id, i, label, price)
+            for i, (package_id, label, price) in enumerate(rows)
+        )
+        product = Product(
+            product_pk, product_type, product_id, name, icon, note, sort_order, product_packages
+        )
+        products[(product_type, product_id)] = product
+        ordered[product_type].append(product)
+        for package in product_packages:
+            packages[package.package_id] = package
+
+        # Same shape as products.json for code that still reads raw sections
+        raw = {'name': name, 'icon': icon}
+        if note:
+            raw['note'] = note
+        if product_type == 'app' and package_size is not None and product_packages:
+            raw['package_size'] = package_size
+            raw['price'] = product_packages[0].price
+        else:
+            raw['packages'] = [[package.label, package.price] for package in product_packages]
+        sections[PRODUCT_TYPES[product_type]][product_id] = raw
+
+    # Price table: every package in SYP, USD and USDT at the current rates
+    rates = dict(rate_rows)
+    usd_rate = rates.get('USD')
+    usdt_rate = rates.get('USDT')
+    prices = {
+        package_id: PriceRow(
+            package.price,
+            round(package.price / usd_rate, 2) if usd_rate else None,
+            round(package.price / usdt_rate, 2) if usdt_rate else None,
+        )
+        for package_id, package in packages.items()
+    }
+
+    return CatalogSnapshot(
+        version=version,
+        games=_freeze(sections['games']),
+        apps=_freeze(sections['apps']),
+        products=MappingProxyType(products),
+        products_by_pk=MappingProxyType({p.product_pk: p for p in products.values()}),
+        packages=MappingProxyType(packages),
+        rates=MappingProxyType(rates),
+        prices=MappingProxyType(prices),
+        ordered=MappingProxyType({t: tuple(items) for t, items in ordered.items()}),
+        sort_keys=MappingProxyType({t: tuple(p.sort_key for p in items) for t, items in ordered.items()}),
+    )
+
+
+class _LiveSection(Mapping):
+    """Read-only mapping that always reflects the current snapshot."""
+
+    def __init__(self, catalog, product_type):
+        self._catalog = catalog
+        self._product_type = product_type
+
+    def _current(self):
+        return self._catalog.snapshot().section(self._product_type)
+
+    def __getitem__(self, key):
+        return self._current()[key]
+
+    def __iter__(self):
+        return iter(self._current())
+
+    def __len__(self):
+        return len(self._current())
+
+
+def _read_if_changed(conn, version):
+    """Build a new snapshot if the catalog version is not `version`, else return None."""
+    row = conn.execute("SELECT version FROM catalog_meta WHERE id = 1").fetchone()
+    if row is None or row[0] == version:
+        return None
+    return build_snapshot(*_read_catalog(conn))
+
+
+class Catalog:
+    """In-memory product catalog backed by the products/packages tables.
+
+    snapshot() never touches the database. A background task started with
+    start() checks the catalog version every CHECK_INTERVAL on a reader
+    thread (a single-row primary key lookup) and swaps in a new snapshot
+    only when it moved; code that just changed the catalog awaits reload().
+    """
+
+    def __init__(self):
+        self._snapshot = build_snapshot(0, [], [])
+        self._task = None
+
+    def snapshot(self) -> CatalogSnapshot:
+        """Return the current snapshot."""
+        return self._snapshot
+
+    def load(self) -> CatalogSnapshot:
+        """Read the catalog synchronously; for startup, before the event loop runs."""
+        with db_connection() as conn:
+            self._swap(_read_if_changed(conn, self._snapshot.version))
+        return self._snapshot
+
+    async def reload(self) -> CatalogSnapshot:
+        """Check the catalog version now, without waiting for the next background check."""
+        try:
+            snapshot = await get_async_db().run_read(_read_if_changed, self._snapshot.version)
+        except Exception as e:
+            # Keep serving the last good snapshot
+            logger.error(f"Error loading products: {e}")
+        else:
+            self._swap(snapshot)
+        return self._snapshot
+
+    def _swap(self, snapshot):
+        # A slower check that read an older version must not undo a newer one
+        if snapshot is None or snapshot.version <= self._snapshot.version:
+            return
+        self._snapshot = snapshot  # Atomic swap; readers never see a partial catalog
+        logger.info(f"Product catalog loaded (version {snapshot.version})")
+
+    def start(self):
+        """Start checking the catalog version in the background."""
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._watch())
+
+    async def stop(self):
+        """Stop the background version check."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _watch(self):
+        while True:
+            await asyncio.sleep(CHECK_INTERVAL)
+            await self.reload()
+
+    def games_view(self) -> Mapping:
+        """Live read-only mapping of game products."""
+        return _LiveSection(self, 'game')
+
+    def apps_view(self) -> Mapping:
+        """Live read-only mapping of app products."""
+        return _LiveSection(self, 'app')
+
+
+_catalog = Catalog()
+
+
+def get_catalog():
+    """Function to access the Catalog instance."""
+    return _catalog
+
+
+def _set_package_price(conn, package_id, price):
+    changed = conn.execute(
+        "UPDATE packages SET price = ? WHERE package_id = ? AND active = 1 AND price IS NOT ?",
+        (price, package_id, price)
+    ).rowcount
+    if changed:
+        # Keep the USD cost in step, or the next rate change would undo the edit
+        set_package_costs(conn, [package_id])
+    return changed
+
+
+async def update_package_price(package_id: int, price: int) -> bool:
+    """Change the price of one package (a single-row update).
+
+    Returns False if the package does not exist, is inactive or already has
+    this price.
+    """
+    if price < 0:
+        raise ValueError(f"Price must not be negative, got {price!r}")
+    changed = await get_async_db().enqueue_write(_set_package_price, package_id, price)
+    if changed:
+        await export_products_json()
+    return bool(changed)
+
+
+def _import_products(conn, data):
+    set_package_costs(conn, import_products_data(conn, data))
+
+
+async def import_products_json(path=PRODUCTS_JSON_PATH):
+    """Import (upsert) products from a products.json file."""
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    await get_async_db().run_write(_import_products, data)
+    await get_catalog().reload()
+
+
+def _write_json(path, data):
+    # A temp file of its own per export, so concurrent exports never rename
+    # each other's half-written file into place
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or '.', suffix='.tmp')
+    try:
+        with open(fd, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=4)
+        # mkstemp creates the file 0600; keep the mode readers of the mirror had
+        os.chmod(tmp_path, os.stat(path).st_mode if os.path.exists(path) else 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+async def export_products_json(path=PRODUCTS_JSON_PATH):
+    """Write the current catalog to products.json atomically.
+
+    The database is the source of truth; the file is kept as a mirror for
+    tools and code that still read it.
+    """
+    snapshot = await get_catalog().reload()
+    data = {
+        section: {
+            product_id: {
+                key: [list(p) for p in value] if key == 'packages' else value
+                for key, value in raw.items()
+            }
+            for product_id, raw in snapshot.section(product_type).items()
+        }
+        for product_type, section in PRODUCT_TYPES.items()
+    }
+    try:
+        await asyncio.to_thread(_write_json, path, data)
+    except OSError as e:
+        logger.error(f"Error exporting products: {e}")
@@ -1,9 +1,147 @@
 import os
+import time
+import logging
+import asyncio
+import sqlite3
+from dataclasses import dataclass
+from types import MappingProxyType
+from collections.abc import Mapping
 from dotenv import load_dotenv
 
 # Load environment variables
 load_dotenv()
 
+# Logger
+logger = logging.getLogger(__name__)
+
+# Settings
+CHECK_INTERVAL = 1.0  # Seconds between settings version checks
+
+
+@dataclass(frozen=True)
+class ConfigSnapshot:
+    """Immutable view of the settings table at one version."""
+    version: int
+    values: Mapping
+    admins: frozenset
+
+
+def _read_settings(conn, version):
+    """Return (version, values) if settings_meta.version is not `version`, else None."""
+    conn.execute('BEGIN')
+    try:
+        current = conn.execute("SELECT version FROM settings_meta WHERE id = 1").fetchone()[0]
+        if current == version:
+            return None
+        values = dict(conn.execute("SELECT key, value FROM settings"))
+    finally:
+        conn.rollback()
+    return current, values
+
+
+def _write_settings(conn, changes, updated_at):
+    before = conn.total_changes
+    conn.executemany('''
+        INSERT INTO settings (key, value, updated_at) VALUES (?, ?, ?)
+        ON CONFLICT (key) DO UPDATE SET value = excluded.value, updated_at = excluded.updated_at
+        WHERE value IS NOT excluded.value
+    ''', [(key, str(value), updated_at) for key, value in changes.items()])
+    if conn.total_changes != before:
+        conn.execute("UPDATE settings_meta SET version = version + 1 WHERE id = 1")
+
+
+class ConfigStore:
+    """Settings table with an in-memory snapshot shared by every bot process.
+
+    Reads never touch the database: they use the current snapshot. A
+    background task started with start() reads settings_meta.version every
+    CHECK_INTERVAL on a reader thread, so changes committed by another
+    process show up within that interval; the table is re-read only if the
+    version moved. Writes go through the group-commit writer.
+    """
+
+    def __init__(self, owner_id):
+        self._owner_id = owner_id
+        self._task = None
+        self._snapshot = self._build(0, {})
+
+    def _build(self, version, values):
+        admins = values.get('ADMINS', os.getenv('ADMINS', str(self._owner_id)))
+        return ConfigSnapshot(
+            version=version,
+            values=MappingProxyType(values),
+            admins=frozenset(int(x) for x in admins.split(',') if x.strip()),
+        )
+
+    def snapshot(self) -> ConfigSnapshot:
+        """Return the current snapshot."""
+        return self._snapshot
+
+    def load(self) -> ConfigSnapshot:
+        """Read settings synchronously; for startup, before the event loop runs."""
+        from database import db_connection  # Import here to avoid circular dependencies
+        try:
+            with db_connection() as conn:
+                self._swap(_read_settings(conn, self._snapshot.version))
+        except sqlite3.Error as e:
+            # Before init_db has created the table; keep the .env defaults
+            logger.debug(f"Settings not loaded: {e}")
+        return self._snapshot
+
+    async def reload(self) -> ConfigSnapshot:
+        """Check the settings version now, without waiting for the next background check."""
+        from database import get_async_db  # Import here to avoid circular dependencies
+        try:
+            loaded = await get_async_db().run_read(_read_settings, self._snapshot.version)
+        except Exception as e:
+            logger.error(f"Error loading settings: {e}")
+        else:
+            self._swap(loaded)
+        return self._snapshot
+
+    def _swap(self, loaded):
+        # A slower check that read an older version must not undo a newer one
+        if loaded is None or loaded[0] <= self._snapshot.version:
+            return
+        version, values = loaded
+        self._snapshot = self._build(version, values)  # Atomic swap
+        logger.info(f"Settings loaded (version {version})")
+
+    def start(self):
+        """Start checking the settings version in the background."""
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._watch())
+
+    async def stop(self):
+        """Stop the background version check."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _watch(self):
+        while True:
+            await asyncio.sleep(CHECK_INTERVAL)
+            await self.reload()
+
+    async def update_many(self, changes: dict) -> bool:
+        """Set several keys in one transaction; the version moves once if anything changed.
+
+        Returns True if the transaction committed.
+        """
+        from database import get_async_db  # Import here to avoid circular dependencies
+        try:
+            await get_async_db().enqueue_write(_write_settings, changes, int(time.time() * 1000))
+        except Exception as e:
+            logger.error(f"Error updating settings {sorted(changes)}: {e}")
+            return False
+        await self.reload()
+        return True
+
+
 class Config:
     """Configuration settings for the bot."""
 
@@ -22,84 +160,78 @@ class Config:
         self.BOT_TOKEN = os.getenv('BOT_TOKEN')
         self.SUPPORT_USERNAME = os.getenv('SUPPORT_USERNAME')
         self.OWNER_ID = int(os.getenv('OWNER_ID', '1631827811'))
-        self.ADMINS = [int(x) for x in os.getenv('ADMINS', str(self.OWNER_ID)).split(',')]
         self.FORCED_CHANNEL_ID = int(os.getenv('FORCED_CHANNEL_ID', '-1001234567890'))
         self.FORCED_CHANNEL_USERNAME = os.getenv('FORCED_CHANNEL_USERNAME', 'example_channel')
         self.RECHARGE_GROUP_ID = int(os.getenv('RECHARGE_GROUP_ID', '-1001234567890'))
         self.PURCHASE_GROUP_ID = int(os.getenv('PURCHASE_GROUP_ID', '-1001234567890'))
-        self.USD_RATE = os.getenv('USD_RATE', '10000')
-        self.USDT_RATE = os.getenv('USDT_RATE', '10000')
         self.DB_PATH = "diamond_store.db"  # Define DB_PATH here
-        self.SYRIATEL_CASH_NUMBERS = [num.strip() for num in os.getenv('SYRIATEL_CASH_NUMBERS', '').split(',')]
-        self.USDT_WALLET_COINEX = os.getenv('USDT_WALLET_COINEX')
-        self.USDT_WALLET_CWALLET = os.getenv('USDT_WALLET_CWALLET')
-        self.USD_WALLET_PAYEER = os.getenv('USD_WALLET_PAYEER')
-        self.USDT_WALLET_PEB20 = os.getenv('USDT_WALLET_PEB20')
         self.BOT_USERNAME = os.getenv('BOT_USERNAME', 'diamond_store_sy_bot')
-
-    def update_usd_rate(self, new_rate: str) -> bool:
-        """Update the USD rate in the .env file."""
-        return self._update_env_variable('USD_RATE', new_rate)
-
-    def update_usdt_rate(self, new_rate: str) -> bool:
-        """Update the USDT rate in the .env file."""
-        return self._update_env_variable('USDT_RATE', new_rate)
-
-    def update_syriatel_numbers(self, numbers: list[str]) -> bool:
-        """Update the Syriatel Cash numbers in the .env file."""
-        numbers_str = ','.join(numbers)
-        return self._update_env_variable('SYRIATEL_CASH_NUMBERS', numbers_str)
-
-    def update_usdt_wallets(self, wallets: dict) -> bool:
-        """Update the USDT wallets in the .env file."""
-        success = True
-        success &= self._update_env_variable('USDT_WALLET_COINEX', wallets.get('coinex', ''))
-        success &= self._update_env_variable('USDT_WALLET_CWALLET', wallets.get('cwallet', ''))
-        success &= self._update_env_variable('USD_WALLET_PAYEER', wallets.get('payeer', ''))
-        success &= self._update_env_variable('USDT_WALLET_PEB20', wallets.get('peb20', ''))
-        return success
-
-    def _update_env_variable(self, variable_name: str, new_value: str) -> bool:
-        """Helper function to update a variable in the .env file."""
-        try:
-            dotenv_path = '.env'
-            with open(dotenv_path, 'r', encoding='utf-8') as f:
-                lines = f.readlines()
-
-            updated = False
-            with open(dotenv_path, 'w', encoding='utf-8') as f:
-                for line in lines:
-                    if line.startswith(f"{variable_name}="):
-                        f.write(f"{variable_name}={new_value}\n")
-                        updated = True
-                    else:
-                        f.write(line)
-
-                if not updated:
-                    f.write(f"{variable_name}={new_value}\n")
-
-            os.environ[variable_name] = new_value  # Update the environment variable
-
-            # Update the Config object's attribute
-            if variable_name == 'USD_RATE':
-                self.USD_RATE = new_value
-            elif variable_name == 'USDT_RATE':
-                self.USDT_RATE = new_value
-            elif variable_name == 'SYRIATEL_CASH_NUMBERS':
-                self.SYRIATEL_CASH_NUMBERS = [num.strip() for num in new_value.split(',')]
-            elif variable_name == 'USDT_WALLET_COINEX':
-                self.USDT_WALLET_COINEX = new_value
-            elif variable_name == 'USDT_WALLET_CWALLET':
-                self.USDT_WALLET_CWALLET = new_value
-            elif variable_name == 'USD_WALLET_PAYEER':
-                self.USD_WALLET_PAYEER = new_value
-            elif variable_name == 'USD_WALLET_PEB20':
-                self.USDT_WALLET_PEB20 = new_value
-
-            return True
-        except Exception as e:
-            print(f"Error updating {variable_name} in .env: {e}")
-            return False
+        self.store = ConfigStore(self.OWNER_ID)
+
+    def _get(self, key, default=None):
+        """Current value of a runtime setting: settings table, then .env, then default."""
+        value = self.store.snapshot().values.get(key)
+        return value if value is not None else os.getenv(key, default)
+
+    @property
+    def version(self):
+        """Settings version; changes whenever a setting does."""
+        return self.store.snapshot().version
+
+    @property
+    def ADMINS(self):
+        return self.store.snapshot().admins
+
+    @property
+    def USD_RATE(self):
+        return self._get('USD_RATE', '10000')
+
+    @property
+    def USDT_RATE(self):
+        return self._get('USDT_RATE', '10000')
+
+    @property
+    def PRICE_MARGIN_BP(self):
+        """Default margin over USD cost, in basis points."""
+        return self._get('PRICE_MARGIN_BP', '0')
+
+    @property
+    def PRICE_ROUND_TO(self):
+        """Computed prices are rounded to a multiple of this many SYP."""
+        return self._get('PRICE_ROUND_TO', '100')
+
+    @property
+    def SYRIATEL_CASH_NUMBERS(self):
+        return [num.strip() for num in self._get('SYRIATEL_CASH_NUMBERS', '').split(',')]
+
+    @property
+    def USDT_WALLET_COINEX(self):
+        return self._get('USDT_WALLET_COINEX')
+
+    @property
+    def USDT_WALLET_CWALLET(self):
+        return self._get('USDT_WALLET_CWALLET')
+
+    @property
+    def USD_WALLET_PAYEER(self):
+        return self._get('USD_WALLET_PAYEER')
+
+    @property
+    def USDT_WALLET_PEB20(self):
+        return self._get('USDT_WALLET_PEB20')
+
+    async def update_syriatel_numbers(self, numbers: list[str]) -> bool:
+        """Update the Syriatel Cash numbers."""
+        return await self.store.update_many({'SYRIATEL_CASH_NUMBERS': ','.join(numbers)})
+
+    async def update_usdt_wallets(self, wallets: dict) -> bool:
+        """Update the USDT wallets in one transaction."""
+        return await self.store.update_many({
+            'USDT_WALLET_COINEX': wallets.get('coinex', ''),
+            'USDT_WALLET_CWALLET': wallets.get('cwallet', ''),
+            'USD_WALLET_PAYEER': wallets.get('payeer', ''),
+            'USDT_WALLET_PEB20': wallets.get('peb20', ''),
+        })
 
 
 _config = Config()  # Create a single instance
@@ -1,11 +1,19 @@
 import os
 import time
+import asyncio
 import sqlite3
 import logging
-import shutil
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone, timedelta
 from dotenv import load_dotenv
 
+from migrations import (
+    migrate, get_schema_version, run_script,
+    LATEST_VERSION, SYP_MINOR_UNITS, ARCHIVE_SCHEMA, ARCHIVE_VIEWS
+)
+
 # Load environment variables
 load_dotenv()
 
@@ -16,158 +24,557 @@ DAMASCUS_TZ = timezone(timedelta(hours=3))
 # Logger
 logger = logging.getLogger(__name__)
 
+# Timestamps are stored as integer epoch milliseconds (UTC)
+MS_PER_HOUR = 3600 * 1000
+MS_PER_DAY = 24 * MS_PER_HOUR
+
+def to_ms(dt):
+    """Convert a datetime to epoch milliseconds (naive values are server local time)."""
+    return int(dt.timestamp() * 1000)
+
+def from_ms(ms, tz=DAMASCUS_TZ):
+    """Convert epoch milliseconds to an aware datetime in `tz`."""
+    return datetime.fromtimestamp(ms / 1000, tz)
+
+def now_ms():
+    """Current time in epoch milliseconds."""
+    return int(time.time() * 1000)
+
+def damascus_day_range(day):
+    """Return [start_ms, end_ms) covering a Damascus calendar day."""
+    start = datetime(day.year, day.month, day.day, tzinfo=DAMASCUS_TZ)
+    start_ms = to_ms(start)
+    return start_ms, start_ms + MS_PER_DAY
+
+def damascus_hour_range(ms):
+    """Return [start_ms, end_ms) of the Damascus clock hour containing `ms`."""
+    start_ms = ms - ms % MS_PER_HOUR  # Damascus is a whole-hour offset from UTC
+    return start_ms, start_ms + MS_PER_HOUR
+
+def damascus_today_range():
+    """Return [start_ms, end_ms) of the current Damascus day."""
+    return damascus_day_range(datetime.now(DAMASCUS_TZ).date())
+
 # Date and time adapters for SQLite
 def adapt_datetime(dt):
-    """Convert datetime to a SQLite-compatible format."""
-    return dt.isoformat()
+    """Convert datetime to a SQLite-compatible format (epoch milliseconds)."""
+    return to_ms(dt)
 
-def convert_datetime(text):
-    """Convert text from SQLite to datetime."""
-    return datetime.fromisoformat(text)
+def convert_datetime(value):
+    """Convert a stored epoch-millisecond value to datetime."""
+    return from_ms(int(value))
 
 sqlite3.register_adapter(datetime, adapt_datetime)
 sqlite3.register_converter("timestamp", convert_datetime)
 
+# Connection settings applied once per connection
+CONNECTION_TIMEOUT = 30.0
+BUSY_TIMEOUT_MS = 30000
+POOL_SIZE = int(os.getenv('DB_POOL_SIZE', '16'))
+HEALTH_CHECK_INTERVAL = 60.0  # Seconds a connection may sit idle before it is pinged
+
+CONNECTION_PRAGMAS = (
+    'PRAGMA journal_mode=WAL',
+    f'PRAGMA busy_timeout={BUSY_TIMEOUT_MS}',
+    'PRAGMA foreign_keys=ON',
+    'PRAGMA synchronous=NORMAL',
+    'PRAGMA cache_size=-2000',
+)
+
+def archive_path_for(db_path):
+    """Path of the archive database that belongs to `db_path`."""
+    return os.getenv('ARCHIVE_DB_PATH') or f"{os.path.splitext(db_path)[0]}_archive.db"
+
+def _attach_archive(conn, db_path):
+    """Attach the archive database and create the unified views."""
+    conn.execute("ATTACH DATABASE ? AS archive", (archive_path_for(db_path),))
+    conn.execute('PRAGMA archive.journal_mode=WAL')
+    conn.execute('PRAGMA archive.synchronous=NORMAL')
+    run_script(conn, ARCHIVE_SCHEMA)
+    run_script(conn, ARCHIVE_VIEWS)
+
+def _open_connection(db_path=DB_PATH, check_same_thread=True):
+    """Open a connection, apply the standard PRAGMAs and attach the archive."""
+    conn = sqlite3.connect(
+        db_path,
+        timeout=CONNECTION_TIMEOUT,
+        isolation_level=None,  # Enable manual transaction control
+        detect_types=sqlite3.PARSE_DECLTYPES | sqlite3.PARSE_COLNAMES,
+        check_same_thread=check_same_thread
+    )
+    for pragma in CONNECTION_PRAGMAS:
+        conn.execute(pragma)
+    _attach_archive(conn, db_path)
+    return conn
+
 # Database connection function
 def get_connection():
     """Create a database connection with improved settings."""
     for i in range(5):  # Retry connection 5 times
         try:
-            conn = sqlite3.connect(
-                DB_PATH,
-                timeout=30.0,  # Increased timeout
-                isolation_level=None,  # Enable manual transaction control
-                detect_types=sqlite3.PARSE_DECLTYPES | sqlite3.PARSE_COLNAMES
-            )
-            conn.execute('PRAGMA journal_mode=WAL')  # Use WAL mode
-            conn.execute('PRAGMA busy_timeout=30000')  # Set busy timeout
-            return conn
+            return _open_connection()
         except sqlite3.OperationalError as e:
             if i == 4:  # If all attempts failed
                 raise e
             time.sleep(1)  # Wait a second before retrying
 
+class ConnectionPool:
+    """Bounded pool of pre-configured connections, one per thread."""
+
+    def __init__(self, db_path=DB_PATH, max_connections=POOL_SIZE):
+        self.db_path = db_path
+        self.max_connections = max_connections
+        self._slots = threading.BoundedSemaphore(max_connections)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._connections = set()
+
+    def _create(self):
+        """Open a new connection for the calling thread."""
+        for i in range(5):
+            try:
+                # Only the owning thread uses it; close_all() may run elsewhere
+                conn = _open_connection(self.db_path, check_same_thread=False)
+                break
+            except sqlite3.OperationalError:
+                if i == 4:
+                    raise
+                time.sleep(1)
+        with self._lock:
+            self._connections.add(conn)
+        self._local.conn = conn
+        self._local.last_used = time.monotonic()
+        return conn
+
+    def _discard(self, conn):
+        """Close a connection and forget about it."""
+        with self._lock:
+            self._connections.discard(conn)
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+        self._local.conn = None
+
+    @staticmethod
+    def _is_healthy(conn):
+        """Check that a connection still answers queries."""
+        try:
+            conn.execute('SELECT 1').fetchone()
+            return True
+        except sqlite3.Error:
+            return False
+
+    def _checkout(self):
+        """Return this thread's connection, replacing it if it went bad."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            return self._create()
+        if time.monotonic() - self._local.last_used > HEALTH_CHECK_INTERVAL and not self._is_healthy(conn):
+            logger.warning("Discarding unhealthy database connection")
+            self._discard(conn)
+            return self._create()
+        return conn
+
+    @contextmanager
+    def connection(self):
+        """Check out the calling thread's connection.
+
+        Nested checkouts on the same thread reuse the connection without
+        taking another slot.
+        """
+        depth = getattr(self._local, 'depth', 0)
+        if depth:
+            self._local.depth = depth + 1
+            try:
+                yield self._local.conn
+            finally:
+                self._local.depth = depth
+            return
+
+        if not self._slots.acquire(timeout=CONNECTION_TIMEOUT):
+            raise sqlite3.OperationalError("Timed out waiting for a database connection")
+        try:
+            conn = self._checkout()
+            self._local.depth = 1
+            try:
+                yield conn
+            finally:
+                self._local.depth = 0
+                self._local.last_used = time.monotonic()
+                if conn.in_transaction:
+                    # Never hand out a connection with a dangling transaction
+                    try:
+                        conn.rollback()
+                    except sqlite3.Error:
+                        self._discard(conn)
+        finally:
+            self._slots.release()
+
+    def close_all(self):
+        """Close every connection opened by the pool."""
+        with self._lock:
+            connections = list(self._connections)
+            self._connections.clear()
+        for conn in connections:
+            try:
+                conn.close()
+            except sqlite3.Error:
+                pass
+        self._local = threading.local()
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_pool():
+    """Return the process-wide connection pool."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool()
+    return _pool
+
+def db_connection():
+    """Context manager yielding a pooled connection.
+
+    Usage:
+        with db_connection() as conn:
+            conn.execute(...)
+    """
+    return get_pool().connection()
+
+READER_THREADS = int(os.getenv('DB_READER_THREADS', '4'))
+WRITE_BATCH_MAX_OPS = int(os.getenv('DB_WRITE_BATCH_MAX_OPS', '256'))
+# Extra linger time per batch; 0 relies on intents piling up while the previous commit runs
+WRITE_BATCH_WINDOW = float(os.getenv('DB_WRITE_BATCH_WINDOW_MS', '0')) / 1000
+
+class WriteBatcher:
+    """Group commit for small write intents.
+
+    Callers enqueue fn(conn, *args) and await the result. A single task
+    collects whatever is queued (up to max_ops, optionally lingering `window`
+    seconds for stragglers) and runs the whole batch in one transaction on
+    the writer thread. Each intent gets its own savepoint, so one failing
+    intent only fails its own caller.
+    """
+
+    def __init__(self, db, max_ops=WRITE_BATCH_MAX_OPS, window=WRITE_BATCH_WINDOW):
+        self._db = db
+        self.max_ops = max_ops
+        self.window = window
+        self._queue = None
+        self._task = None
+        self._loop = None
+        self.batches = 0
+        self.intents = 0
+
+    def _ensure_started(self):
+        loop = asyncio.get_running_loop()
+        if self._task is None or self._loop is not loop or self._task.done():
+            self._loop = loop
+            self._queue = asyncio.Queue()
+            self._task = loop.create_task(self._run())
+
+    async def submit(self, fn, *args):
+        """Queue a write intent and wait until its batch has committed."""
+        self._ensure_started()
+        future = self._loop.create_future()
+        self._queue.put_nowait((fn, args, future))
+        return await future
+
+    def _drain(self, batch):
+        while len(batch) < self.max_ops and not self._queue.empty():
+            batch.append(self._queue.get_nowait())
+
+    async def _run(self):
+        while True:
+            batch = [await self._queue.get()]
+            self._drain(batch)
+            if len(batch) < self.max_ops and self.window > 0:
+                await asyncio.sleep(self.window)
+                self._drain(batch)
+            try:
+                results = await self._loop.run_in_executor(self._db._writer, self._commit_batch, batch)
+            except Exception as e:
+                results = [(False, e)] * len(batch)
+            for (_, _, future), (ok, value) in zip(batch, results):
+                if future.done():
+                    continue
+                if ok:
+                    future.set_result(value)
+                else:
+                    future.set_exception(value)
+            self.batches += 1
+            self.intents += len(batch)
+
+    def _commit_batch(self, batch):
+        """Run a batch of intents in one transaction (writer thread)."""
+        results = []
+        with self._db._pool.connection() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                for fn, args, _ in batch:
+                    conn.execute('SAVEPOINT intent')
+                    try:
+                        results.append((True, fn(conn, *args)))
+                        conn.execute('RELEASE intent')
+                    except Exception as e:
+                        conn.execute('ROLLBACK TO intent')
+                        conn.execute('RELEASE intent')
+                        results.append((False, e))
+                conn.commit()
+            except BaseException:
+                conn.rollback()
+                raise
+        return results
+
+    async def flush(self):
+        """Wait until everything queued so far has been committed."""
+        if self._task is None or self._task.done():
+            return
+        await self.submit(lambda conn: None)
+
+
+class AsyncDatabase:
+    """Awaitable database access that never blocks the event loop.
+
+    Reads run on a small pool of reader threads; all writes are serialized on
+    a single writer thread so they never wait on each other for the lock.
+    """
+
+    def __init__(self, pool=None, readers=READER_THREADS):
+        self._pool = pool or get_pool()
+        self._readers = ThreadPoolExecutor(max_workers=readers, thread_name_prefix='db-reader')
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix='db-writer')
+        self._batcher = WriteBatcher(self)
+
+    def _read_call(self, fn, args):
+        with self._pool.connection() as conn:
+            return fn(conn, *args)
+
+    def _write_call(self, fn, args):
+        with self._pool.connection() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                result = fn(conn, *args)
+            except BaseException:
+                conn.rollback()
+                raise
+            conn.commit()
+            return result
+
+    async def run_read(self, fn, *args):
+        """Run fn(conn, *args) on a reader thread."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._readers, self._read_call, fn, args)
+
+    async def run_write(self, fn, *args):
+        """Run fn(conn, *args) in a transaction on the writer thread."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._writer, self._write_call, fn, args)
+
+    async def fetchone(self, sql, params=()):
+        """Execute a query and return the first row."""
+        return await self.run_read(lambda conn: conn.execute(sql, params).fetchone())
+
+    async def fetchall(self, sql, params=()):
+        """Execute a query and return all rows."""
+        return await self.run_read(lambda conn: conn.execute(sql, params).fetchall())
+
+    async def execute(self, sql, params=()):
+        """Execute a write statement and return the affected row count."""
+        return await self.run_write(lambda conn: conn.execute(sql, params).rowcount)
+
+    async def executemany(self, sql, seq_of_params):
+        """Execute a write statement for each parameter set."""
+        return await self.run_write(lambda conn: conn.executemany(sql, seq_of_params).rowcount)
+
+    async def enqueue_write(self, fn, *args):
+        """Run fn(conn, *args) as part of the next group commit."""
+        return await self._batcher.submit(fn, *args)
+
+    async def enqueue_execute(self, sql, params=()):
+        """Execute a small write statement as part of the next group commit."""
+        return await self._batcher.submit(lambda conn: conn.execute(sql, params).rowcount)
+
+    async def flush_writes(self):
+        """Wait for all queued write intents to commit."""
+        await self._batcher.flush()
+
+    def shutdown(self):
+        """Wait for queued work and stop the executor threads."""
+        self._writer.shutdown(wait=True)
+        self._readers.shutdown(wait=True)
+
+# Expiry of stale pending rows
+EXPIRABLE_TABLES = ('transactions', 'orders')
+EXPIRY_CHUNK_SIZE = 500
+EXPIRY_SLICE_SECONDS = 0.05  # Target time the write lock is held per chunk
+
+def _expire_chunk(conn, table, cutoff, limit):
+    """Expire up to `limit` pending rows of `table` created before `cutoff`."""
+    cursor = conn.execute(f'''
+        UPDATE {table} SET status = 'expired'
+        WHERE rowid IN (
+            SELECT rowid FROM {table}
+            WHERE status = 'pending' AND created_at < ?
+            LIMIT ?
+        )
+    ''', (cutoff, limit))
+    return cursor.rowcount
+
+async def expire_pending(db, table, cutoff):
+    """Expire stale pending rows in short transactions.
+
+    Each chunk is its own write transaction, so queued writes get the lock
+    between chunks. The chunk size adapts to keep each slice near
+    EXPIRY_SLICE_SECONDS. Returns the number of rows expired.
+    """
+    if table not in EXPIRABLE_TABLES:
+        raise ValueError(f"Table {table} does not support expiry")
+    total = 0
+    chunk = EXPIRY_CHUNK_SIZE
+    while True:
+        started = time.monotonic()
+        expired = await db.run_write(_expire_chunk, table, cutoff, chunk)
+        elapsed = time.monotonic() - started
+        total += expired
+        if expired < chunk:
+            return total
+        if elapsed > EXPIRY_SLICE_SECONDS:
+            chunk = max(50, chunk // 2)
+        elif elapsed < EXPIRY_SLICE_SECONDS / 2:
+            chunk = min(EXPIRY_CHUNK_SIZE * 8, chunk * 2)
+
+# Ledger: balances are integers in SYP minor units
+def to_minor(amount_syp):
+    """Convert an SYP amount to integer minor units (rounded half up)."""
+    return int(round(float(amount_syp) * SYP_MINOR_UNITS + 1e-9))
+
+def from_minor(units):
+    """Convert integer minor units back to SYP."""
+    if SYP_MINOR_UNITS == 1:
+        return units
+    return units / SYP_MINOR_UNITS
+
+def apply_balance_change(conn, user_id, change, transaction_type):
+    """Apply a signed balance change and record it in balance_history.
+
+    The balance is read and written by a single conditional UPDATE, so
+    concurrent changes cannot overwrite each other. Returns the new balance,
+    or None if the user does not exist or a debit exceeds the balance.
+    Run inside a transaction so both rows commit together.
+    """
+    if not isinstance(change, int) or change == 0:
+        raise ValueError(f"Balance change must be a non-zero integer of minor units, got {change!r}")
+    now = now_ms()
+    if change < 0:
+        rows = conn.execute('''
+            UPDATE users SET balance = balance + ?, updated_at = ?
+            WHERE user_id = ? AND balance >= ?
+            RETURNING balance
+        ''', (change, now, user_id, -change)).fetchall()
+    else:
+        rows = conn.execute('''
+            UPDATE users SET balance = balance + ?, updated_at = ?
+            WHERE user_id = ?
+            RETURNING balance
+        ''', (change, now, user_id)).fetchall()
+    if not rows:
+        return None
+    new_balance = rows[0][0]
+    conn.execute('''
+        INSERT INTO balance_history
+        (user_id, old_balance, new_balance, change_amount, transaction_type, created_at)
+        VALUES (?, ?, ?, ?, ?, ?)
+    ''', (user_id, new_balance - change, new_balance, change, transaction_type, now))
+    return new_balance
+
+async def debit_balance(user_id, amount, transaction_type):
+    """Atomically take `amount` minor units from a user's balance.
+
+    Returns the new balance, or None if the balance is insufficient.
+    """
+    if amount <= 0:
+        raise ValueError(f"Debit amount must be positive, got {amount!r}")
+    return await get_async_db().enqueue_write(apply_balance_change, user_id, -amount, transaction_type)
+
+async def credit_balance(user_id, amount, transaction_type):
+    """Atomically add `amount` minor units to a user's balance.
+
+    Returns the new balance, or None if the user does not exist.
+    """
+    if amount <= 0:
+        raise ValueError(f"Credit amount must be positive, got {amount!r}")
+    return await get_async_db().enqueue_write(apply_balance_change, user_id, amount, transaction_type)
+
+async def get_balance(user_id):
+    """Return a user's balance in minor units, or None for unknown users."""
+    row = await get_async_db().fetchone("SELECT balance FROM users WHERE user_id = ?", (user_id,))
+    return row[0] if row else None
+
+# Orders: price and label always come from the catalog row, never the callback
+def insert_order(conn, user_id, package_id):
+    """Create a pending order for an active package.
+
+    Returns (order_id, price), or None if the package is unknown or inactive.
+    """
+    row = conn.execute('''
+        INSERT INTO orders (user_id, product_type, product_id, amount, price, created_at, package_id)
+        SELECT ?, p.product_type, p.product_id, pk.label, pk.price, ?, pk.package_id
+        FROM packages pk JOIN products p ON p.product_pk = pk.product_pk
+        WHERE pk.package_id = ? AND pk.active = 1 AND p.active = 1
+        RETURNING order_id, price
+    ''', (user_id, now_ms(), package_id)).fetchone()
+    return tuple(row) if row else None
+
+async def create_order(user_id, package_id):
+    """Queue creation of a pending order; see insert_order."""
+    return await get_async_db().enqueue_write(insert_order, user_id, package_id)
+
+_async_db = None
+
+def get_async_db():
+    """Return the process-wide async database facade."""
+    global _async_db
+    if _async_db is None:
+        with _pool_lock:
+            if _async_db is None:
+                _async_db = AsyncDatabase()
+    return _async_db
+
+def close_pool():
+    """Stop the async executors and close all pooled connections (call on shutdown)."""
+    global _async_db
+    if _async_db is not None:
+        _async_db.shutdown()
+        _async_db = None
+    if _pool is not None:
+        _pool.close_all()
+
 def init_wal():
     """Initialize WAL mode for the database."""
-    conn = None
     try:
-        conn = sqlite3.connect(DB_PATH)
-        conn.execute('PRAGMA journal_mode=WAL')
-        conn.commit()
+        with db_connection() as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
     except Exception as e:
         logger.error(f"Error initializing WAL: {e}")
-    finally:
-        if conn:
-            conn.close()
 
 # Database initialization function
 def init_db():
     """Initialize the database with security, performance, and backup improvements."""
     try:
-        # Create a backup before any changes
-        if os.path.exists(DB_PATH):
-            backup_path = f'backup/diamond_store_{datetime.now().strftime("%Y%m%d_%H%M%S")}.db'
-            os.makedirs('backup', exist_ok=True)
-            shutil.copy2(DB_PATH, backup_path)
-
-        # Create a connection to the database with improved settings
-        conn = get_connection()
-        c = conn.cursor()
-
-        # Enable advanced settings for performance and security
-        c.executescript('''
-            -- Enable foreign key constraints
-            PRAGMA foreign_keys = ON;
-
-            -- Improve write performance
-            PRAGMA journal_mode = WAL;
-
-            -- Improve concurrency
-            PRAGMA synchronous = NORMAL;
-
-            -- Improve cache size
-            PRAGMA cache_size = -2000;
-
-            -- User table with improvements
-            CREATE TABLE IF NOT EXISTS users (
-                user_id INTEGER PRIMARY KEY,
-                username TEXT,
-                first_name TEXT,
-                balance REAL DEFAULT 0.0 CHECK (balance >= 0),
-                joined_date TEXT NOT NULL,
-                last_activity TEXT NOT NULL,
-                status TEXT DEFAULT 'active' CHECK (status IN ('active', 'banned', 'suspended')),
-                account_data TEXT,
-                created_at TEXT DEFAULT CURRENT_TIMESTAMP,
-                updated_at TEXT DEFAULT CURRENT_TIMESTAMP
-            );
-
-            -- Balance history table
-            CREATE TABLE IF NOT EXISTS balance_history (
-                history_id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER NOT NULL,
-                old_balance REAL NOT NULL,
-                new_balance REAL NOT NULL,
-                change_amount REAL NOT NULL,  -- Renamed amount to change_amount
-                transaction_type TEXT NOT NULL,
-                created_at TEXT DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (user_id) REFERENCES users(user_id) ON DELETE CASCADE
-            );
-
-            -- Improved orders table
-            CREATE TABLE IF NOT EXISTS orders (
-                order_id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER NOT NULL,
-                product_type TEXT NOT NULL CHECK (product_type IN ('game', 'app')),
-                product_id TEXT NOT NULL,
-                amount TEXT NOT NULL,
-                price REAL NOT NULL,
-                created_at TEXT NOT NULL,
-                status TEXT DEFAULT 'pending' CHECK (status IN ('pending', 'completed', 'rejected', 'expired')),
-                FOREIGN KEY (user_id) REFERENCES users(user_id) ON DELETE CASCADE
-            );
-
-            -- Transactions table
-            CREATE TABLE IF NOT EXISTS transactions (
-                tx_id TEXT PRIMARY KEY,
-                user_id INTEGER NOT NULL,
-                amount REAL NOT NULL,
-                type TEXT NOT NULL CHECK (type IN ('deposit', 'withdrawal')),
-                payment_method TEXT NOT NULL,
-                payment_details TEXT,
-                original_amount REAL,
-                original_currency TEXT,
-                created_at TEXT NOT NULL,
-                status TEXT DEFAULT 'pending' CHECK (status IN ('pending', 'completed', 'rejected', 'expired')),
-                reject_reason TEXT,
-                FOREIGN KEY (user_id) REFERENCES users(user_id) ON DELETE CASCADE
-            );
-
-            -- Admin logs table
-            CREATE TABLE IF NOT EXISTS admin_logs (
-                log_id INTEGER PRIMARY KEY AUTOINCREMENT,
-                admin_id INTEGER NOT NULL,
-                action TEXT NOT NULL,
-                details TEXT,
-                created_at TEXT DEFAULT CURRENT_TIMESTAMP
-            );
-
-            -- Create index for faster user lookups
-            CREATE INDEX IF NOT EXISTS idx_users_user_id ON users (user_id);
-
-            -- Create index for order status lookups
-            CREATE INDEX IF NOT EXISTS idx_orders_status ON orders (status);
-
-            -- Create index for transaction status lookups
-            CREATE INDEX IF NOT EXISTS idx_transactions_status ON transactions (status);
-        ''')
-
-        conn.commit()
-        logger.info("Database initialized successfully.")
+        with db_connection() as conn:
+            # Back up an existing database before changing its schema
+            has_tables = conn.execute("SELECT 1 FROM sqlite_master LIMIT 1").fetchone()
+            if has_tables and get_schema_version(conn) < LATEST_VERSION:
+                from backup_manager import get_backup_manager  # Import here to avoid circular dependencies
+                get_backup_manager().backup_now(throttled=False)
+
+            # Apply pending schema migrations (no-op when the schema is current)
+            version = migrate(conn)
+        logger.info(f"Database initialized successfully (schema version {version}).")
 
     except sqlite3.Error as e:
         logger.error(f"Database initialization error: {e}")
-
-    finally:
-        if conn:
-            conn.close()
\ No newline at end of file
@@ -1,11 +1,13 @@
 import logging
-from telegram import Update, InlineKeyboardMarkup, InlineKeyboardButton
+from telegram import Update
 from telegram.ext import ContextTypes, ConversationHandler
 
 # Import local modules
 from keyboards import Keyboards
 from config import Config
-import json
+from catalog import get_catalog, update_package_price
+from callback_codec import decode_callback
+from handlers import is_admin
 
 # Initialize Config
 config = Config()
@@ -16,6 +18,10 @@ logger = logging.getLogger(__name__)
 async def edit_prices_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle the edit prices callback."""
     query = update.callback_query
+    if not is_admin(query.from_user.id):
+        await query.answer("🚫 ليس لديك صلاحيات المسؤول", show_alert=True)
+        return ConversationHandler.END
+
     await query.answer()
 
     await query.message.edit_text(
@@ -27,73 +33,147 @@ async def edit_prices_callback(update: Update, context: ContextTypes.DEFAULT_TYP
 async def edit_games_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle the edit games callback."""
     query = update.callback_query
-    await query.answer()
-
-    with open('products.json', 'r', encoding='utf-8') as f:
-        data = json.load(f)
-        GAME_PRODUCTS = data.get('games', {})
+    if not is_admin(query.from_user.id):
+        await query.answer("🚫 ليس لديك صلاحيات المسؤول", show_alert=True)
+        return ConversationHandler.END
 
-    buttons = []
-    for product_id, product in GAME_PRODUCTS.items():
-        buttons.append([InlineKeyboardButton(f"{product['icon']} {product['name']}", callback_data=f"edit_game_{product_id}")])
-    buttons.append([InlineKeyboardButton("➕ إضافة منتج", callback_data="add_game")])
-    buttons.append([InlineKeyboardButton("🔙 رجوع", callback_data="edit_prices")])
+    await query.answer()
 
     await query.message.edit_text(
         "🎮 اختر اللعبة لتعديل أسعارها:",
-        reply_markup=InlineKeyboardMarkup(buttons)
+        reply_markup=Keyboards.edit_products_menu('game')
     )
     return ConversationHandler.END
 
 async def edit_apps_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle the edit apps callback."""
     query = update.callback_query
-    await query.answer()
-
-    with open('products.json', 'r', encoding='utf-8') as f:
-        data = json.load(f)
-        APP_PRODUCTS = data.get('apps', {})
+    if not is_admin(query.from_user.id):
+        await query.answer("🚫 ليس لديك صلاحيات المسؤول", show_alert=True)
+        return ConversationHandler.END
 
-    buttons = []
-    for product_id, product in APP_PRODUCTS.items():
-        buttons.append([InlineKeyboardButton(f"{product['icon']} {product['name']}", callback_data=f"edit_app_{product_id}")])
-    buttons.append([InlineKeyboardButton("➕ إضافة منتج", callback_data="add_app")])
-    buttons.append([InlineKeyboardButton("🔙 رجوع", callback_data="edit_prices")])
+    await query.answer()
 
     await query.message.edit_text(
         "📱 اختر التطبيق لتعديل سعره:",
-        reply_markup=InlineKeyboardMarkup(buttons)
+        reply_markup=Keyboards.edit_products_menu('app')
     )
     return ConversationHandler.END
 
-async def edit_product_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Handle the edit product callback."""
+async def edit_products_page_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Show another page of the games or apps being edited."""
     query = update.callback_query
+    if not is_admin(query.from_user.id):
+        await query.answer("🚫 ليس لديك صلاحيات المسؤول", show_alert=True)
+        return ConversationHandler.END
+
     await query.answer()
 
-    product_type = query.data.split('_')[1]
-    product_id = query.data.split('_')[2]
+    _, _, product_type, cursor = query.data.split('_', 3)
+    await query.message.edit_reply_markup(
+        reply_markup=Keyboards.edit_products_menu(product_type, cursor)
+    )
+    return ConversationHandler.END
 
-    with open('products.json', 'r', encoding='utf-8') as f:
-        data = json.load(f)
-        GAME_PRODUCTS = data.get('games', {})
-        APP_PRODUCTS = data.get('apps', {})
+async def edit_product_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Handle the edit product callback."""
+    query = update.callback_query
+    if not is_admin(query.from_user.id):
+        await query.answer("🚫 ليس لديك صلاحيات المسؤول", show_alert=True)
+        return ConversationHandler.END
+
+    await query.answer()
 
-    if product_type == 'game':
-        product = GAME_PRODUCTS[product_id]
-        product_name = product['name']
-    elif product_type == 'app':
-        product = APP_PRODUCTS[product_id]
-        product_name = product['name']
+    snapshot = get_catalog().snapshot()
+    payload = decode_callback(query.data)
+    if payload:
+        product = snapshot.product_by_pk(payload.ids[0]) if payload.ids else None
     else:
+        # Legacy edit_<type>_<id> buttons; the id may itself contain '_'
+        _, product_type, product_id = query.data.split('_', 2)
+        product = snapshot.product(product_type, product_id)
+    if product is None:
         await query.message.edit_text("❌ نوع المنتج غير صحيح")
         return ConversationHandler.END
 
+    if len(product.packages) == 1:
+        # Apps sell a single package: ask for its price directly
+        return await _ask_package_price(query.message, context, product, product.packages[0])
+
     await query.message.edit_text(
-        f"✏️ تعديل {product_name}\n\n"
+        f"✏️ تعديل {product.name}\n\n"
+        "اختر الباقة لتعديل سعرها:",
+        reply_markup=Keyboards.edit_product_packages(product.product_type, product.product_id)
+    )
+    return ConversationHandler.END
+
+async def edit_package_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Handle the edit package callback."""
+    query = update.callback_query
+    if not is_admin(query.from_user.id):
+        await query.answer("🚫 ليس لديك صلاحيات المسؤول", show_alert=True)
+        return ConversationHandler.END
+
+    await query.answer()
+
+    payload = decode_callback(query.data)
+    if payload:
+        package_id = payload.ids[0] if payload.ids else None
+    else:
+        package_id = int(query.data.split('_')[2])  # Legacy edit_pkg_<id>
+    snapshot = get_catalog().snapshot()
+    package = snapshot.package_by_id(package_id)
+    if package is None:
+        await query.message.edit_text("❌ الباقة غير موجودة")
+        return ConversationHandler.END
+    product = snapshot.product(package.product_type, package.product_id)
+    return await _ask_package_price(query.message, context, product, package)
+
+async def _ask_package_price(message, context, product, package):
+    await message.edit_text(
+        f"✏️ تعديل {product.name} - {package.label}\n"
+        f"السعر الحالي: {package.price:,} ل.س\n\n"
         "أرسل السعر الجديد"
     )
-    context.user_data['product_type'] = product_type
-    context.user_data['product_id'] = product_id
+    context.user_data['product_type'] = package.product_type
+    context.user_data['product_id'] = package.product_id
+    context.user_data['package_id'] = package.package_id
     from handlers import WAITING_FOR_PRICE_UPDATE
-    return WAITING_FOR_PRICE_UPDATE
\ No newline at end of file
+    return WAITING_FOR_PRICE_UPDATE
+
+async def handle_package_price_update(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Save the new price of the package being edited."""
+    if not is_admin(update.effective_user.id):
+        return ConversationHandler.END
+
+    package_id = context.user_data.pop('package_id', None)
+    if package_id is None:
+        await update.message.reply_text("❌ لم يتم تحديد الباقة")
+        return ConversationHandler.END
+
+    text = update.message.text.strip().replace(',', '')
+    if not text.isdigit():
+        context.user_data['package_id'] = package_id
+        await update.message.reply_text("❌ الرجاء إدخال سعر صحيح (رقم صحيح موجب)")
+        from handlers import WAITING_FOR_PRICE_UPDATE
+        return WAITING_FOR_PRICE_UPDATE
+
+    price = int(text)
+    try:
+        changed = await update_package_price(package_id, price)
+    except Exception as e:
+        logger.error(f"Error updating price of package {package_id}: {e}")
+        await update.message.reply_text("❌ حدث خطأ أثناء تحديث السعر")
+        return ConversationHandler.END
+
+    product_type = context.user_data.get('product_type', 'game')
+    reply_markup = Keyboards.edit_product_packages(product_type, context.user_data.get('product_id', ''))
+    if changed:
+        await update.message.reply_text(f"✅ تم تحديث السعر إلى {price:,} ل.س", reply_markup=reply_markup)
+    elif get_catalog().snapshot().package_by_id(package_id) is None:
+        await update.message.reply_text("❌ الباقة غير موجودة أو غير مفعلة", reply_markup=reply_markup)
+    else:
+        await update.message.reply_text(
+            f"ℹ️ السعر الحالي هو {price:,} ل.س بالفعل، لم يتم تغيير شيء", reply_markup=reply_markup
+        )
+    return ConversationHandler.END
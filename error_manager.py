@@ -0,0 +1,229 @@
+import os
+import hashlib
+import logging
+import traceback
+
+from database import get_async_db, now_ms, from_ms, MS_PER_DAY
+from send_manager import get_send_queue, ADMIN
+from config import get_config
+
+# Logger
+logger = logging.getLogger(__name__)
+
+# Settings
+DIGEST_INTERVAL_MINUTES = int(os.getenv('ERROR_DIGEST_MINUTES', '10'))
+ERROR_RETENTION_DAYS = int(os.getenv('ERROR_RETENTION_DAYS', '30'))
+DIGEST_MAX_GROUPS = 15
+DIGEST_MAX_USERS = 10
+MESSAGE_PREVIEW_CHARS = 200
+MAX_MESSAGE_CHARS = 4096  # Telegram's limit for one message
+
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def _project_frames(frames):
+    """Frames in this bot's own files (not the library or the standard library)."""
+    own = [f for f in frames if os.path.abspath(f.filename).startswith(PROJECT_DIR + os.sep)]
+    return own or frames
+
+
+def fingerprint(error):
+    """Group key of an exception: its type plus the (file, function) of each of our frames.
+
+    Line numbers and the message are left out so the same failure keeps its
+    fingerprint across edits elsewhere in the file and across users, ids and
+    amounts in the message. Returns (fingerprint, error type, location).
+    """
+    error_type = type(error).__qualname__
+    frames = _project_frames(traceback.extract_tb(error.__traceback__))
+    key = [error_type] + [f"{os.path.basename(f.filename)}:{f.name}" for f in frames]
+    digest = hashlib.sha1('|'.join(key).encode('utf-8')).hexdigest()[:12]
+    if frames:
+        last = frames[-1]
+        location = f"{os.path.basename(last.filename)}:{last.lineno} ({last.name})"
+    else:
+        location = 'غير معروف'
+    return digest, error_type, location
+
+
+def _record(conn, fp, error_type, location, message, tb, user_id, now):
+    conn.execute('''
+        INSERT INTO error_groups
+            (fingerprint, error_type, location, message, traceback, first_seen, last_seen, occurrences)
+        VALUES (?, ?, ?, ?, ?, ?, ?, 1)
+        ON CONFLICT (fingerprint) DO UPDATE SET
+            location = excluded.location, message = excluded.message, traceback = excluded.traceback,
+            last_seen = excluded.last_seen, occurrences = occurrences + 1
+    ''', (fp, error_type, location, message, tb, now, now))
+    conn.execute(
+        "INSERT INTO error_events (fingerprint, user_id, created_at) VALUES (?, ?, ?)",
+        (fp, user_id, now)
+    )
+
+
+def _prune(conn, cutoff):
+    deleted = conn.execute("DELETE FROM error_events WHERE created_at < ?", (cutoff,)).rowcount
+    conn.execute("DELETE FROM error_groups WHERE last_seen < ?", (cutoff,))
+    return deleted
+
+
+class _Window:
+    """Occurrences of one fingerprint since the last digest."""
+
+    __slots__ = ('error_type', 'location', 'message', 'count', 'users')
+
+    def __init__(self, error_type, location, message):
+        self.error_type = error_type
+        self.location = location
+        self.message = message
+        self.count = 0
+        self.users = set()
+
+
+class ErrorAggregator:
+    """Groups exceptions by fingerprint and reports them to the owner without flooding.
+
+    The first occurrence of a fingerprint is sent immediately. Repeats are
+    only counted (with the affected user ids) and summarised in one digest
+    message every DIGEST_INTERVAL_MINUTES. A fingerprint that stays quiet for
+    a whole digest interval is alerted immediately again when it comes back.
+    Every occurrence is kept in the error store (error_groups/error_events)
+    for the admin panel.
+    """
+
+    def __init__(self, owner_id):
+        self.owner_id = owner_id
+        self._windows = {}  # fingerprint -> _Window of repeats not yet in a digest
+        self._active = set()  # Fingerprints alerted or seen during this interval
+        self._previous = set()  # ... during the previous interval
+        self.metrics = dict.fromkeys(('errors', 'alerts', 'digests', 'suppressed'), 0)
+
+    async def report(self, error, user_id, bot):
+        """Record one exception; alert now if it is new, otherwise leave it for the digest."""
+        fp, error_type, location = fingerprint(error)
+        message = str(error)
+        tb = ''.join(traceback.format_exception(type(error), error, error.__traceback__))
+        self.metrics['errors'] += 1
+
+        try:
+            await get_async_db().enqueue_write(
+                _record, fp, error_type, location, message, tb, user_id, now_ms()
+            )
+        except Exception as e:
+            logger.error(f"Could not store error {fp}: {e}")
+
+        if fp not in self._active and fp not in self._previous:
+            self._active.add(fp)
+            self.metrics['alerts'] += 1
+            get_send_queue().send_message(
+                bot, self.owner_id, self._alert_text(fp, error_type, location, message, user_id),
+                priority=ADMIN
+            )
+            return
+
+        self._active.add(fp)
+        self.metrics['suppressed'] += 1
+        window = self._windows.get(fp)
+        if window is None:
+            window = self._windows[fp] = _Window(error_type, location, message)
+        window.count += 1
+        window.message = message
+        if user_id is not None:
+            window.users.add(user_id)
+
+    @staticmethod
+    def _alert_text(fp, error_type, location, message, user_id):
+        return (
+            "⚠️ تنبيه: حدث خطأ في البوت\n\n"
+            f"الخطأ: {error_type}: {message[:MESSAGE_PREVIEW_CHARS]}\n"
+            f"المكان: {location}\n"
+            f"المستخدم: {user_id if user_id is not None else 'غير معروف'}\n"
+            f"المعرف: {fp}\n"
+            f"الوقت: {from_ms(now_ms()).strftime('%Y-%m-%d %H:%M:%S')}\n\n"
+            f"التكرارات ستصل في ملخص كل {DIGEST_INTERVAL_MINUTES} دقائق"
+        )
+
+    def digest_text(self):
+        """Summary of the repeats collected since the last digest, or None if there were none."""
+        if not self._windows:
+            return None
+        groups = sorted(self._windows.items(), key=lambda item: item[1].count, reverse=True)
+        total = sum(window.count for _, window in groups)
+        lines = [f"📋 ملخص الأخطاء (آخر {DIGEST_INTERVAL_MINUTES} دقائق): {total} تكرار\n"]
+        for fp, window in groups[:DIGEST_MAX_GROUPS]:
+            users = sorted(window.users)
+            shown = ', '.join(str(u) for u in users[:DIGEST_MAX_USERS])
+            if len(users) > DIGEST_MAX_USERS:
+                shown += f" (+{len(users) - DIGEST_MAX_USERS})"
+            lines.append(
+                f"• {window.count}× {window.error_type} — {window.location} [{fp}]\n"
+                f"  {window.message[:MESSAGE_PREVIEW_CHARS]}\n"
+                f"  المستخدمون ({len(users)}): {shown or '—'}"
+            )
+        if len(groups) > DIGEST_MAX_GROUPS:
+            lines.append(f"… و {len(groups) - DIGEST_MAX_GROUPS} أخطاء أخرى")
+        return '\n'.join(lines)[:MAX_MESSAGE_CHARS]
+
+    def flush_digest(self, bot):
+        """Queue the digest (if any) and start a new interval."""
+        text = self.digest_text()
+        self._windows = {}
+        self._previous, self._active = self._active, set()
+        if text is None:
+            return False
+        self.metrics['digests'] += 1
+        get_send_queue().send_message(bot, self.owner_id, text, priority=ADMIN)
+        return True
+
+
+async def recent_error_groups(days=1, limit=10):
+    """Error groups seen in the last `days`, most frequent first: (fingerprint, type, location, count, users, last_seen)."""
+    since = now_ms() - days * MS_PER_DAY
+    return await get_async_db().fetchall('''
+        SELECT g.fingerprint, g.error_type, g.location,
+               COUNT(*) AS count, COUNT(DISTINCT e.user_id) AS users, g.last_seen
+        FROM error_events e JOIN error_groups g ON g.fingerprint = e.fingerprint
+        WHERE e.created_at >= ?
+        GROUP BY g.fingerprint
+        ORDER BY count DESC, g.last_seen DESC
+        LIMIT ?
+    ''', (since, limit))
+
+
+async def get_error_group(fp):
+    """Full stored details of one error group plus its most recent user ids, or None."""
+    def read(conn):
+        group = conn.execute('''
+            SELECT fingerprint, error_type, location, message, traceback, first_seen, last_seen, occurrences
+            FROM error_groups WHERE fingerprint = ?
+        ''', (fp,)).fetchone()
+        if group is None:
+            return None
+        users = [row[0] for row in conn.execute('''
+            SELECT user_id FROM error_events
+            WHERE fingerprint = ? AND user_id IS NOT NULL
+            GROUP BY user_id ORDER BY MAX(created_at) DESC LIMIT ?
+        ''', (fp, DIGEST_MAX_USERS))]
+        return group, users
+    return await get_async_db().run_read(read)
+
+
+async def send_error_digest(context):
+    """Job: send the error digest and drop stored errors older than ERROR_RETENTION_DAYS."""
+    get_error_aggregator().flush_digest(context.bot)
+    try:
+        cutoff = now_ms() - ERROR_RETENTION_DAYS * MS_PER_DAY
+        await get_async_db().enqueue_write(_prune, cutoff)
+    except Exception as e:
+        logger.error(f"Error pruning the error store: {e}")
+
+
+_error_aggregator = None
+
+
+def get_error_aggregator():
+    """Function to access the ErrorAggregator instance."""
+    global _error_aggregator
+    if _error_aggregator is None:
+        _error_aggregator = ErrorAggregator(get_config().OWNER_ID)
+    return _error_aggregator
@@ -1,13 +1,20 @@
 import logging
 import sqlite3
 import os
-from datetime import datetime
-from telegram import Update, ChatMember
+from telegram import (
+    Update, InlineQueryResultArticle, InputTextMessageContent,
+    InlineKeyboardMarkup, InlineKeyboardButton
+)
 from telegram.ext import (
     ContextTypes, ConversationHandler,
     CallbackQueryHandler, MessageHandler, filters
 )
 from config import get_config
+from database import get_async_db, now_ms
+from catalog import get_catalog
+from search_manager import get_search_index
+from callback_codec import decode_callback
+from membership_manager import get_membership_cache
 import sys
 from keyboards import Keyboards
 from utils import format_currency
@@ -20,7 +27,10 @@ OWNER_ID = config.OWNER_ID
 FORCED_CHANNEL_ID = config.FORCED_CHANNEL_ID
 FORCED_CHANNEL_USERNAME = config.FORCED_CHANNEL_USERNAME
 SUPPORT_USERNAME = config.SUPPORT_USERNAME
-DB_PATH = "diamond_store.db"
+
+# Live read-only views of the product catalog
+GAME_PRODUCTS = get_catalog().games_view()
+APP_PRODUCTS = get_catalog().apps_view()
 
 # States for ConversationHandler
 (
@@ -41,7 +51,8 @@ DB_PATH = "diamond_store.db"
     EDITING_ENV_VALUE,
     HANDLE_SYRIATEL_NUMBERS,
     HANDLE_USDT_WALLETS,
-) = range(17)
+    WAITING_FOR_BROADCAST_TEXT,
+) = range(18)
 
 # Logger
 logger = logging.getLogger(__name__)
@@ -60,18 +71,16 @@ async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         )
         return
 
-    conn = None
     try:
-        conn = sqlite3.connect(DB_PATH)
-        c = conn.cursor()
-        now = datetime.now()
-        c.execute('''
-            INSERT OR IGNORE INTO users 
+        now = now_ms()
+        await get_async_db().enqueue_execute('''
+            INSERT INTO users 
             (user_id, username, first_name, joined_date, last_activity)
             VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT (user_id) DO UPDATE SET blocked_bot = 0 WHERE blocked_bot != 0
         ''', (user.id, user.username, user.first_name, now, now))
-        conn.commit()
 
+        rates = get_catalog().snapshot().rates
         welcome_text = (
             f"👋 مرحباً {user.first_name}\n\n"
             "💎 أهلاً بك في متجر الدايموند\n"
@@ -86,8 +95,8 @@ async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
             "• USD (PAYEER) 💰\n"
             "• سيرياتيل كاش 📱\n\n"
             "💱 أسعار الصرف:\n"
-            f"• الدولار: {format_currency(float(config.USD_RATE))}\n"
-            f"• USDT: {format_currency(float(config.USDT_RATE))}\n\n"
+            f"• الدولار: {format_currency(rates.get('USD', 0))}\n"
+            f"• USDT: {format_currency(rates.get('USDT', 0))}\n\n"
             "اختر من القائمة:"
         )
         await update.message.reply_text(
@@ -95,14 +104,45 @@ async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
             reply_markup=Keyboards.main_menu(is_admin(user.id))
         )
 
+        # Deep link from an inline search result: open that product
+        if context.args and context.args[0].startswith('pkg_') and context.args[0][4:].isdigit():
+            package = get_catalog().snapshot().package_by_id(int(context.args[0][4:]))
+            if package:
+                product = get_catalog().snapshot().product(package.product_type, package.product_id)
+                await update.message.reply_text(
+                    f"{product.icon} {product.name}\n\nاختر الباقة:",
+                    reply_markup=Keyboards.product_packages(package.product_type, package.product_id)
+                )
+
     except sqlite3.Error as e:
         logger.error(f"Database error in start_command: {e}")
         await update.message.reply_text(
             "❌ حدث خطأ أثناء معالجة طلبك. يرجى المحاولة مرة أخرى لاحقًا."
         )
-    finally:
-        if conn:
-            conn.close()
+
+async def inline_query_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Answer inline searches (@bot pubg 660) from the catalog search index."""
+    query = update.inline_query
+    packages = get_search_index().search(query.query)
+    snapshot = get_catalog().snapshot()
+    results = []
+    for package in packages:
+        product = snapshot.product(package.product_type, package.product_id)
+        if product is None:
+            continue
+        deep_link = f"https://t.me/{context.bot.username}?start=pkg_{package.package_id}"
+        results.append(InlineQueryResultArticle(
+            id=str(package.package_id),
+            title=f"{product.icon} {product.name} - {package.label}",
+            description=format_currency(package.price),
+            input_message_content=InputTextMessageContent(
+                f"{product.icon} {product.name}\n"
+                f"📦 {package.label}\n"
+                f"💰 {format_currency(package.price)}"
+            ),
+            reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("🛒 شراء", url=deep_link)]])
+        ))
+    await query.answer(results, cache_time=30)
 
 async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle the /help command."""
@@ -129,25 +169,11 @@ async def cancel_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 async def check_subscription(user_id: int, bot) -> bool:
     """Check if the user is subscribed to the required channel."""
-    try:
-        member = await bot.get_chat_member(FORCED_CHANNEL_ID, user_id)
-        return member.status in [ChatMember.MEMBER, ChatMember.OWNER, ChatMember.ADMINISTRATOR]
-    except Exception as e:
-        logger.error(f"Error checking subscription: {e}")
-        return False
-
-def load_products():
-    """Load products from the products.json file."""
-    try:
-        import json
-        if os.path.exists('products.json'):
-            with open('products.json', 'r', encoding='utf-8') as f:
-                data = json.load(f)
-                global GAME_PRODUCTS, APP_PRODUCTS
-                GAME_PRODUCTS = data.get('games', GAME_PRODUCTS)
-                APP_PRODUCTS = data.get('apps', APP_PRODUCTS)
-    except Exception as e:
-        logger.error(f"Error loading products: {e}")
+    return await get_membership_cache().is_member(user_id, bot)
+
+async def channel_member_update(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Keep the subscription cache in step with joins and leaves in the forced channel."""
+    get_membership_cache().on_chat_member(update.chat_member)
 
 async def back_to_main_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Return to main menu."""
@@ -159,6 +185,51 @@ async def back_to_main_callback(update: Update, context: ContextTypes.DEFAULT_TY
     )
     return ConversationHandler.END
 
+async def products_page_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Show another page of the games or apps list."""
+    query = update.callback_query
+    await query.answer()
+    _, product_type, cursor = query.data.split('_', 2)
+    await query.message.edit_reply_markup(
+        reply_markup=Keyboards.products_menu(product_type, cursor)
+    )
+
+async def compact_buy_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Start a purchase from a compact buy button.
+
+    The button carries the package id and the catalog version it was drawn
+    at. Buttons from an older catalog are re-rendered with current prices
+    instead of being bought.
+    """
+    query = update.callback_query
+    payload = decode_callback(query.data)
+    snapshot = get_catalog().snapshot()
+    package = snapshot.package_by_id(payload.ids[0]) if payload and payload.ids else None
+
+    if package is None or payload.version != snapshot.version:
+        await query.answer("⚠️ تم تحديث الأسعار، يرجى اختيار الباقة من جديد", show_alert=True)
+        if package is not None:
+            await query.message.edit_reply_markup(
+                reply_markup=Keyboards.product_packages(package.product_type, package.product_id)
+            )
+        return ConversationHandler.END
+
+    await query.answer()
+    product = snapshot.product(package.product_type, package.product_id)
+    context.user_data['product_type'] = package.product_type
+    context.user_data['product_id'] = package.product_id
+    context.user_data['package_id'] = package.package_id
+    context.user_data['package_index'] = package.index
+    context.user_data['amount'] = package.label
+    context.user_data['price'] = package.price
+    await query.message.edit_text(
+        f"🛒 {product.icon} {product.name}\n"
+        f"📦 {package.label}\n"
+        f"💰 السعر: {format_currency(package.price)}\n\n"
+        "أرسل معرف الحساب (ID):"
+    )
+    return WAITING_FOR_GAME_ID
+
 async def cancel_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Cancel current operation."""
     query = update.callback_query
@@ -181,7 +252,7 @@ async def handle_env_value(update: Update, context: ContextTypes.DEFAULT_TYPE):
         syriatel_numbers = [num.strip() for num in user_input.split(',')]
         from config import Config # Import here to avoid circular dependencies
         config = get_config()
-        success = config.update_syriatel_numbers(syriatel_numbers)
+        success = await config.update_syriatel_numbers(syriatel_numbers)
 
         if success:
             await update.message.reply_text(
@@ -206,7 +277,7 @@ async def handle_env_value(update: Update, context: ContextTypes.DEFAULT_TYPE):
         from config import Config # Import here to avoid circular dependencies
         config = get_config()
 
-        success = config.update_usdt_wallets({
+        success = await config.update_usdt_wallets({
             "coinex": usdt_wallets[0],
             "cwallet": usdt_wallets[1],
             "payeer": usdt_wallets[2],
@@ -234,8 +305,7 @@ async def handle_env_value(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 def is_admin(user_id: int) -> bool:
     """Check if a user is an admin."""
-    ADMINS = [int(x) for x in os.getenv('ADMINS', str(OWNER_ID)).split(',')]
-    return user_id in ADMINS
+    return user_id in config.ADMINS
 
 
 async def restart_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -244,8 +314,10 @@ async def restart_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.message.from_user.id
     if user_id in config.ADMINS:
         await update.message.reply_text("جاري إعادة تشغيل البوت...")
-        # Properly disconnect the bot
-        await context.application.shutdown()
+        # Save conversation states and user data; the new process restores them.
+        # (Application.shutdown() refuses to run while the application is running.)
+        await context.application.update_persistence()
+        await get_async_db().flush_writes()
         # Restart the process
         os.execl(sys.executable, sys.executable, *sys.argv)
     else:
@@ -1,7 +1,111 @@
+import os
+import functools
+import threading
+from collections import OrderedDict
+
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup
 
+from catalog import get_catalog
+from callback_codec import encode_callback
+from config import get_config
+
+# Settings
+KEYBOARD_CACHE_SIZE = int(os.getenv('KEYBOARD_CACHE_SIZE', '512'))
+
+
+class KeyboardCache:
+    """Prebuilt markups keyed by (menu, args), valid for one catalog/config version.
+
+    Markups are immutable Telegram objects, so one instance can be shared by
+    every callback. The whole cache is dropped when either version changes,
+    and at most max_size markups are kept, least recently used dropped first,
+    since some arguments come from callback_data a client can choose.
+    """
+
+    def __init__(self, max_size=KEYBOARD_CACHE_SIZE):
+        self._lock = threading.Lock()
+        self._markups = OrderedDict()
+        self._versions = None
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, build, args=(), kwargs=None):
+        """Return the markup cached under key, calling build(*args, **kwargs) on a miss."""
+        versions = (get_catalog().snapshot().version, get_config().version)
+        if versions != self._versions:
+            with self._lock:
+                if versions != self._versions:
+                    self._markups = OrderedDict()
+                    self._versions = versions
+        with self._lock:
+            markup = self._markups.get(key)
+            if markup is not None:
+                self._markups.move_to_end(key)
+        if markup is None:
+            self.misses += 1
+            markup = build(*args, **(kwargs or {}))
+            with self._lock:
+                self._markups[key] = markup
+                if len(self._markups) > self.max_size:
+                    self._markups.popitem(last=False)
+        else:
+            self.hits += 1
+        return markup
+
+    def clear(self):
+        with self._lock:
+            self._markups = OrderedDict()
+            self._versions = None
+
+
+keyboard_cache = KeyboardCache()
+
+# Products per catalog page: fits a phone screen without scrolling, with
+# room for the navigation and back rows.
+CATALOG_PAGE_SIZE = 8
+
+
+def cached_keyboard(build=None, *, key=None):
+    """Serve a keyboard builder's result from keyboard_cache.
+
+    The cache key is the builder's name plus its arguments (which must be
+    hashable), keyword arguments included. `key`, if given, maps the
+    arguments to the cache key instead, so arguments that select the same
+    keyboard share one entry.
+    """
+    if build is None:
+        return functools.partial(cached_keyboard, key=key)
+
+    @functools.wraps(build)
+    def wrapper(*args, **kwargs):
+        if key is not None:
+            cache_key = key(*args, **kwargs)
+        else:
+            cache_key = (args, tuple(sorted(kwargs.items()))) if kwargs else args
+        return keyboard_cache.get((build.__name__, cache_key), build, args, kwargs)
+    return wrapper
+
+
+def _page_key(product_type, cursor=''):
+    # Cursors come from callback_data; keying by the page they resolve to
+    # keeps forged or stale cursors from adding entries
+    return product_type, get_catalog().snapshot().page_range(product_type, cursor, CATALOG_PAGE_SIZE)
+
+
+def _page_nav(prefix, prev_cursor, next_cursor):
+    """Previous/next row for a paged list, or None on a single page."""
+    nav = []
+    if prev_cursor:
+        nav.append(InlineKeyboardButton("◀️ السابق", callback_data=f"{prefix}_{prev_cursor}"))
+    if next_cursor:
+        nav.append(InlineKeyboardButton("التالي ▶️", callback_data=f"{prefix}_{next_cursor}"))
+    return nav or None
+
+
 class Keyboards:
     @staticmethod
+    @cached_keyboard
     def main_menu(is_admin=False):
         """Main menu keyboard."""
         buttons = [
@@ -15,6 +119,7 @@ class Keyboards:
         return InlineKeyboardMarkup(buttons)
 
     @staticmethod
+    @cached_keyboard
     def shop_menu():
         """Shop menu keyboard."""
         buttons = [
@@ -25,6 +130,7 @@ class Keyboards:
         return InlineKeyboardMarkup(buttons)
 
     @staticmethod
+    @cached_keyboard
     def payment_methods():
         """Payment methods keyboard."""
         from recharge_manager import PAYMENT_METHODS
@@ -49,10 +155,14 @@ class Keyboards:
         return InlineKeyboardMarkup(buttons)
 
     @staticmethod
+    @cached_keyboard
     def admin_panel():
         """Admin panel keyboard."""
         buttons = [
-            [InlineKeyboardButton("📊 الإحصائيات", callback_data="admin_stats")],
+            [
+                InlineKeyboardButton("📊 الإحصائيات", callback_data="admin_stats"),
+                InlineKeyboardButton("🐞 الأخطاء", callback_data="admin_errors")
+            ],
             [
                 InlineKeyboardButton("👥 إدارة المستخدمين", callback_data="manage_users"),
                 InlineKeyboardButton("💰 تعديل الأسعار", callback_data="edit_prices")
@@ -65,11 +175,13 @@ class Keyboards:
                 InlineKeyboardButton("⚙️ إعدادات عامة", callback_data="admin_settings"),
                 InlineKeyboardButton("💱 أسعار الصرف", callback_data="admin_rates")
             ],
+            [InlineKeyboardButton("📢 إذاعة", callback_data="admin_broadcast")],
             [InlineKeyboardButton("🔙 رجوع", callback_data="back_to_main")]
         ]
         return InlineKeyboardMarkup(buttons)
 
     @staticmethod
+    @cached_keyboard
     def manage_users_menu():
         """Manage users keyboard."""
         buttons = [
@@ -82,6 +194,7 @@ class Keyboards:
         return InlineKeyboardMarkup(buttons)
 
     @staticmethod
+    @cached_keyboard
     def edit_prices_menu():
         """Edit prices keyboard."""
         buttons = [
@@ -98,6 +211,7 @@ class Keyboards:
         return InlineKeyboardMarkup(buttons)
 
     @staticmethod
+    @cached_keyboard
     def admin_rates():
         """Admin rates keyboard."""
         buttons = [
@@ -107,6 +221,122 @@ class Keyboards:
         ]
         return InlineKeyboardMarkup(buttons)
 
+    @staticmethod
+    @cached_keyboard
+    def confirm_rate_change():
+        """Confirm/cancel a previewed exchange rate change."""
+        buttons = [
+            [
+                InlineKeyboardButton("✅ تأكيد", callback_data="confirm_rate"),
+                InlineKeyboardButton("❌ إلغاء", callback_data="cancel_rate")
+            ]
+        ]
+        return InlineKeyboardMarkup(buttons)
+
+    @staticmethod
+    @cached_keyboard
+    def broadcast_menu(broadcast_id: int = 0, status: str = ''):
+        """Broadcast screen: controls for the latest broadcast, or start a new one."""
+        if status == 'running':
+            buttons = [[
+                InlineKeyboardButton("⏸ إيقاف مؤقت", callback_data=f"broadcast_pause_{broadcast_id}"),
+                InlineKeyboardButton("🚫 إلغاء", callback_data=f"broadcast_cancel_{broadcast_id}")
+            ]]
+        elif status == 'paused':
+            buttons = [[
+                InlineKeyboardButton("▶️ استئناف", callback_data=f"broadcast_resume_{broadcast_id}"),
+                InlineKeyboardButton("🚫 إلغاء", callback_data=f"broadcast_cancel_{broadcast_id}")
+            ]]
+        else:
+            buttons = [[InlineKeyboardButton("📝 إذاعة جديدة", callback_data="broadcast_new")]]
+        buttons.append([
+            InlineKeyboardButton("🔄 تحديث", callback_data="admin_broadcast"),
+            InlineKeyboardButton("🔙 رجوع", callback_data="admin_panel")
+        ])
+        return InlineKeyboardMarkup(buttons)
+
+    @staticmethod
+    @cached_keyboard
+    def cancel_broadcast():
+        """Back out of writing a broadcast."""
+        return InlineKeyboardMarkup([[InlineKeyboardButton("❌ إلغاء", callback_data="admin_broadcast")]])
+
+    @staticmethod
+    @cached_keyboard
+    def confirm_broadcast():
+        """Confirm/cancel a previewed broadcast."""
+        buttons = [
+            [
+                InlineKeyboardButton("✅ إرسال", callback_data="confirm_broadcast"),
+                InlineKeyboardButton("❌ إلغاء", callback_data="admin_broadcast")
+            ]
+        ]
+        return InlineKeyboardMarkup(buttons)
+
+    @staticmethod
+    @cached_keyboard(key=_page_key)
+    def products_menu(product_type: str, cursor: str = ''):
+        """Customer list of games or apps, one page at a time."""
+        products, prev_cursor, next_cursor = get_catalog().snapshot().page(product_type, cursor, CATALOG_PAGE_SIZE)
+        buttons = [
+            [InlineKeyboardButton(f"{product.icon} {product.name}", callback_data=f"{product_type}_{product.product_id}")]
+            for product in products
+        ]
+        nav = _page_nav(f"page_{product_type}", prev_cursor, next_cursor)
+        if nav:
+            buttons.append(nav)
+        buttons.append([InlineKeyboardButton("🔙 رجوع", callback_data="shop")])
+        return InlineKeyboardMarkup(buttons)
+
+    @staticmethod
+    @cached_keyboard
+    def product_packages(product_type: str, product_id: str):
+        """Package list of one product with buy buttons."""
+        snapshot = get_catalog().snapshot()
+        product = snapshot.product(product_type, product_id)
+        buttons = []
+        if product:
+            for package in product.packages:
+                buttons.append([InlineKeyboardButton(
+                    f"{package.label} - {package.price:,} ل.س",
+                    callback_data=encode_callback('buy', package.package_id, version=snapshot.version)
+                )])
+        back = "games" if product_type == "game" else "apps"
+        buttons.append([InlineKeyboardButton("🔙 رجوع", callback_data=back)])
+        return InlineKeyboardMarkup(buttons)
+
+    @staticmethod
+    @cached_keyboard(key=_page_key)
+    def edit_products_menu(product_type: str, cursor: str = ''):
+        """Admin list of games or apps to edit, one page at a time."""
+        products, prev_cursor, next_cursor = get_catalog().snapshot().page(product_type, cursor, CATALOG_PAGE_SIZE)
+        buttons = [
+            [InlineKeyboardButton(f"{product.icon} {product.name}", callback_data=encode_callback('edit_product', product.product_pk))]
+            for product in products
+        ]
+        nav = _page_nav(f"edit_page_{product_type}", prev_cursor, next_cursor)
+        if nav:
+            buttons.append(nav)
+        buttons.append([InlineKeyboardButton("➕ إضافة منتج", callback_data=f"add_{product_type}")])
+        buttons.append([InlineKeyboardButton("🔙 رجوع", callback_data="edit_prices")])
+        return InlineKeyboardMarkup(buttons)
+
+    @staticmethod
+    @cached_keyboard
+    def edit_product_packages(product_type: str, product_id: str):
+        """Admin list of one product's packages to reprice."""
+        product = get_catalog().snapshot().product(product_type, product_id)
+        buttons = []
+        if product:
+            for package in product.packages:
+                buttons.append([InlineKeyboardButton(
+                    f"✏️ {package.label} - {package.price:,} ل.س",
+                    callback_data=encode_callback('edit_package', package.package_id)
+                )])
+        back = "edit_games" if product_type == "game" else "edit_apps"
+        buttons.append([InlineKeyboardButton("🔙 رجوع", callback_data=back)])
+        return InlineKeyboardMarkup(buttons)
+
     @staticmethod
     def confirm_cancel_order(order_id: int):
         """Confirm/cancel order buttons."""
@@ -3,12 +3,13 @@ import os
 import sys  # Import the sys module
 from datetime import timedelta, datetime
 import sqlite3
-import json  # استيراد json
+import asyncio
 from telegram import Update
 from telegram.ext import (
     Application,
     CommandHandler,
-    CallbackQueryHandler,
+    InlineQueryHandler,
+    ChatMemberHandler,
     MessageHandler,
     filters,
     ConversationHandler,
@@ -20,7 +21,7 @@ current_dir = os.path.dirname(os.path.abspath(__file__))
 sys.path.insert(0, current_dir)
 
 # Import local modules
-from database import init_db, init_wal
+from database import init_db, init_wal, get_async_db, close_pool, expire_pending, now_ms, MS_PER_HOUR
 from handlers import (
     start_command,
     help_command,
@@ -29,6 +30,7 @@ from handlers import (
     WAITING_FOR_PAYMENT_PROOF,
     WAITING_FOR_TXID,
     WAITING_FOR_RATE,
+    WAITING_FOR_BROADCAST_TEXT,
     WAITING_FOR_GAME_ID,
     WAITING_FOR_USER_INPUT,
     WAITING_FOR_EMAIL,
@@ -41,13 +43,27 @@ from handlers import (
     HANDLE_USDT_WALLETS,
     back_to_main_callback,
     cancel_callback,
+    products_page_callback,
+    compact_buy_callback,
+    inline_query_handler,
+    channel_member_update,
     handle_env_value,
     is_admin,
 )
 from admin_panel import AdminPanel
+from backup_manager import get_backup_manager
+from catalog import get_catalog
+from send_manager import get_send_queue, CUSTOMER
+from error_manager import get_error_aggregator, send_error_digest, DIGEST_INTERVAL_MINUTES
+from webhook_manager import run_webhook, WEBHOOK_URL
+from broadcast_manager import resume_broadcasts
+from persistence import SQLitePersistence
+from archive_manager import archive_old_rows
 from recharge_manager import RechargeManager
 from purchase_manager import PurchaseManager
 # from products import GAME_PRODUCTS, APP_PRODUCTS # تم التعليق لأننا سنقوم بتحميلها من JSON
+from callback_router import CallbackRouter
+from callback_codec import callback_pattern
 from keyboards import Keyboards
 from log_manager import LogManager
 from config import Config
@@ -60,6 +76,13 @@ from admin_handlers import (
     modify_balance_callback,
     edit_rate_callback,
     handle_rate_update,
+    confirm_rate_callback,
+    broadcast_menu_callback,
+    new_broadcast_callback,
+    handle_broadcast_text,
+    confirm_broadcast_callback,
+    broadcast_control_callback,
+    cancel_rate_callback,
     handle_user_input,
 )
 from purchase_handlers import (
@@ -73,7 +96,6 @@ from product_handlers import (
     apps_callback,
     game_packages_callback,
     app_packages_callback,
-    handle_price_update,
     show_balance,  # Import the function
     show_orders,   # Import the function
 )
@@ -89,7 +111,10 @@ from edit_products_handlers import (
     edit_prices_callback,
     edit_games_callback,
     edit_apps_callback,
+    edit_products_page_callback,
     edit_product_callback,
+    edit_package_callback,
+    handle_package_price_update,
 )
 
 import os
@@ -105,6 +130,7 @@ config = Config()
 BOT_TOKEN = config.BOT_TOKEN
 SUPPORT_USERNAME = config.SUPPORT_USERNAME
 OWNER_ID = config.OWNER_ID
+BOT_API_BASE_URL = os.getenv('BOT_API_BASE_URL', '')
 
 # Logging setup
 logging.basicConfig(
@@ -114,9 +140,9 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# Global variables to store products
-GAME_PRODUCTS = {}
-APP_PRODUCTS = {}
+# Live read-only views of the product catalog
+GAME_PRODUCTS = get_catalog().games_view()
+APP_PRODUCTS = get_catalog().apps_view()
 
 
 async def error_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -125,87 +151,60 @@ async def error_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
         error_text = f"⚠️ خطأ في البوت: {str(context.error)}"
         logger.error(error_text)
 
-        # Try sending a message to the user
+        # Queue a message to the user; the send queue applies Telegram's rate
+        # limits, so errors in a burst do not trip flood control.
         if update and update.effective_message:
-            try:
-                await update.effective_message.reply_text(
-                    "❌ عذراً، حدث خطأ غير متوقع\n"
-                    "🔄 يرجى المحاولة مرة أخرى"
-                )
-            except Exception as e:
-                logger.error(f"Could not send error message to user: {e}")
-
-        # Send error details to the admin
-        admin_text = (
-            "⚠️ تنبيه: حدث خطأ في البوت\n\n"
-            f"الخطأ: {str(context.error)}\n"
-            f"المستخدم: {update.effective_user.id if update and update.effective_user else 'غير معروف'}\n"
-            f"نوع التحديث: {update.update_id if update and update.effective_user else 'غير معروف'}\n"
-            f"الوقت: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"
-        )
-
-        try:
-            await context.bot.send_message(
-                chat_id=OWNER_ID,
-                text=admin_text
+            get_send_queue().enqueue(
+                update.effective_message.chat_id,
+                update.effective_message.reply_text,
+                "❌ عذراً، حدث خطأ غير متوقع\n"
+                "🔄 يرجى المحاولة مرة أخرى",
+                priority=CUSTOMER
             )
-        except Exception as e:
-            logger.error(f"Could not send error message to admin: {e}")
 
-    except Exception as e:
-        logger.error(f"Error in error handler: {e}")
+        # Store the error and alert the admin once per fingerprint; repeats
+        # go into the periodic digest
+        user_id = update.effective_user.id if update and update.effective_user else None
+        await get_error_aggregator().report(context.error, user_id, context.bot)
 
-
-def load_products():
-    """Load products from the products.json file."""
-    try:
-        with open('products.json', 'r', encoding='utf-8') as f:
-            data = json.load(f)
-            global GAME_PRODUCTS, APP_PRODUCTS
-            GAME_PRODUCTS = data.get('games', {})
-            APP_PRODUCTS = data.get('apps', {})
     except Exception as e:
-        logger.error(f"Error loading products: {e}")
+        logger.error(f"Error in error handler: {e}")
 
 
 async def cleanup_expired_transactions(context: ContextTypes.DEFAULT_TYPE):
-    """Clean up expired transactions."""
-    conn = None
+    """Expire pending transactions and orders older than 24 hours."""
     try:
-        conn = sqlite3.connect("diamond_store.db")
-        c = conn.cursor()
-
         # Calculate the expiry time (e.g., 24 hours ago)
-        expiry_time = datetime.now() - timedelta(hours=24)
-        expiry_time_str = expiry_time.isoformat()
-
-        # Fetch expired transaction IDs
-        c.execute("SELECT tx_id FROM transactions WHERE status = 'pending' AND created_at < ?", (expiry_time_str,))
-        expired_transactions = c.fetchall()
-
-        if expired_transactions:
-            logger.info(f"Found {len(expired_transactions)} expired transactions. Processing...")
-            for (tx_id,) in expired_transactions:
-                try:
-                    # Update the transaction status to 'expired'
-                    c.execute("UPDATE transactions SET status = 'expired' WHERE tx_id = ?", (tx_id,))
-                    logger.info(f"Transaction {tx_id} marked as expired.")
-
-                    # Log the action
-                    logger.info(f"Expired transaction {tx_id} cleanup completed.")
-                except sqlite3.Error as e:
-                    logger.error(f"Error processing expired transaction {tx_id}: {e}")
-                    conn.rollback()
-
-            conn.commit()
-            logger.info("Expired transactions cleanup completed successfully.")
-        else:
-            logger.info("No expired transactions found.")
+        cutoff = now_ms() - 24 * MS_PER_HOUR
+        db = get_async_db()
+        expired_transactions = await expire_pending(db, 'transactions', cutoff)
+        expired_orders = await expire_pending(db, 'orders', cutoff)
+        logger.info(
+            f"Expiry cleanup: {expired_transactions} transactions, {expired_orders} orders expired."
+        )
     except sqlite3.Error as e:
         logger.error(f"Database error during cleanup: {e}")
-    finally:
-        if conn:
-            conn.close()
+
+
+async def post_init(application: Application):
+    """Start the background refresh of the in-memory catalog and settings."""
+    get_catalog().start()
+    config.store.start()
+
+
+async def post_stop(application: Application):
+    """Deliver queued messages while the bot can still send them."""
+    await get_catalog().stop()
+    await config.store.stop()
+    get_error_aggregator().flush_digest(application.bot)
+    if not await get_send_queue().drain():
+        logger.warning(f"Send queue not drained on shutdown: {get_send_queue().depth()} messages dropped")
+
+
+async def post_shutdown(application: Application):
+    """Commit queued database writes before the process exits."""
+    await get_async_db().flush_writes()
+    get_backup_manager().stop()
 
 
 def main():
@@ -218,13 +217,23 @@ def main():
         # Database initialization
         init_db()
         init_wal()
-        load_products()
+        get_catalog().load()
+        config.store.load()
+        get_backup_manager().start()
 
         # Application builder
+        builder = Application.builder()
+        if BOT_API_BASE_URL:
+            # e.g. a local Bot API server: http://localhost:8081/bot
+            builder.base_url(BOT_API_BASE_URL)
         application = (
-            Application.builder()
+            builder
                 .token(BOT_TOKEN)
                 .concurrent_updates(True)
+                .persistence(SQLitePersistence())
+                .post_init(post_init)
+                .post_stop(post_stop)
+                .post_shutdown(post_shutdown)
                 .build()
         )
 
@@ -234,72 +243,89 @@ def main():
         purchase_manager = PurchaseManager(GAME_PRODUCTS, APP_PRODUCTS)
         log_manager = LogManager()
 
+        # Callbacks available in every conversation state
+        nav_router = CallbackRouter([
+            (r"^shop$", shop_callback),
+            (r"^games$", games_callback),
+        ])
+
         # Define conversation handler
         conv_handler = ConversationHandler(
-            entry_points=[
-                CallbackQueryHandler(admin_panel.admin_panel, pattern=r"^admin_panel$"),
-                CallbackQueryHandler(ban_user_callback, pattern=r"^ban_user$"),
-                CallbackQueryHandler(unban_user_callback, pattern=r"^unban_user$"),
-                CallbackQueryHandler(modify_balance_callback, pattern=r"^modify_balance$"),
-                CallbackQueryHandler(edit_rate_callback, pattern=r"^edit_rate_[a-zA-Z]+$"),
-                CallbackQueryHandler(admin_panel.admin_settings, pattern=r"^admin_settings$"),
-                CallbackQueryHandler(admin_panel.edit_env_settings, pattern=r"^edit_env$"),
-                CallbackQueryHandler(admin_panel.edit_syriatel_numbers, pattern=r"^edit_syriatel_numbers$"),
-                CallbackQueryHandler(admin_panel.edit_usdt_wallets, pattern=r"^edit_usdt_wallets$"),
-                CallbackQueryHandler(crypto_payment_callback, pattern=r"^pay_crypto_[a-zA-Z0-9_]+$"),
-                CallbackQueryHandler(syriatel_payment_callback, pattern=r"^pay_syriatel$"),
-                CallbackQueryHandler(buy_callback, pattern=r"^buy_(game|app)_[^_]+_[^_]+_[0-9]+$"),
-                CallbackQueryHandler(edit_prices_callback, pattern=r"^edit_prices$"),
-                CallbackQueryHandler(edit_games_callback, pattern=r"^edit_games$"),
-                CallbackQueryHandler(edit_apps_callback, pattern=r"^edit_apps$"),
-                CallbackQueryHandler(edit_product_callback, pattern=r"^edit_(game|app)_[^_]+$"),
-                CallbackQueryHandler(shop_callback, pattern=r"^shop$"),  # Keep shop_callback here
-                CallbackQueryHandler(recharge_manager.confirm_payment, pattern=r"^confirm_payment_"),
-                CallbackQueryHandler(recharge_manager.reject_payment, pattern=r"^reject_payment_")
-            ],
+            entry_points=[CallbackRouter([
+                (r"^admin_panel$", admin_panel.admin_panel),
+                (r"^ban_user$", ban_user_callback),
+                (r"^unban_user$", unban_user_callback),
+                (r"^modify_balance$", modify_balance_callback),
+                (r"^edit_rate_[a-zA-Z]+$", edit_rate_callback),
+                (r"^confirm_rate$", confirm_rate_callback),
+                (r"^cancel_rate$", cancel_rate_callback),
+                (r"^admin_settings$", admin_panel.admin_settings),
+                (r"^admin_backup(_now)?$", admin_panel.backup_status),
+                (r"^admin_stats$", admin_panel.admin_stats),
+                (r"^admin_errors$", admin_panel.error_log),
+                (r"^admin_error_[0-9a-f]+$", admin_panel.error_details),
+                (r"^admin_broadcast$", broadcast_menu_callback),
+                (r"^broadcast_new$", new_broadcast_callback),
+                (r"^confirm_broadcast$", confirm_broadcast_callback),
+                (r"^broadcast_(pause|resume|cancel)_[0-9]+$", broadcast_control_callback),
+                (r"^edit_env$", admin_panel.edit_env_settings),
+                (r"^edit_syriatel_numbers$", admin_panel.edit_syriatel_numbers),
+                (r"^edit_usdt_wallets$", admin_panel.edit_usdt_wallets),
+                (r"^pay_crypto_[a-zA-Z0-9_]+$", crypto_payment_callback),
+                (r"^pay_syriatel$", syriatel_payment_callback),
+                (r"^buy_(game|app)_[^_]+_[^_]+_[0-9]+$", buy_callback),
+                (callback_pattern('buy'), compact_buy_callback),
+                (r"^edit_prices$", edit_prices_callback),
+                (r"^edit_games$", edit_games_callback),
+                (r"^edit_apps$", edit_apps_callback),
+                (r"^edit_page_(game|app)_[<>][0-9.]+$", edit_products_page_callback),
+                (r"^edit_(game|app)_.+$", edit_product_callback),
+                (r"^edit_pkg_[0-9]+$", edit_package_callback),
+                (callback_pattern('edit_product'), edit_product_callback),
+                (callback_pattern('edit_package'), edit_package_callback),
+                (r"^shop$", shop_callback),  # Keep shop_callback here
+                (r"^confirm_payment_", recharge_manager.confirm_payment),
+                (r"^reject_payment_", recharge_manager.reject_payment),
+            ])],
             states={
                 ADMIN_BAN_USER: [
                     MessageHandler(filters.TEXT & ~filters.COMMAND, handle_user_input),
-                    CallbackQueryHandler(shop_callback, pattern=r"^shop$"),
-                    CallbackQueryHandler(games_callback, pattern=r"^games$"),
+                    nav_router,
                 ],
                 ADMIN_UNBAN_USER: [
                     MessageHandler(filters.TEXT & ~filters.COMMAND, handle_user_input),
-                    CallbackQueryHandler(shop_callback, pattern=r"^shop$"),
-                    CallbackQueryHandler(games_callback, pattern=r"^games$"),
+                    nav_router,
                 ],
                 ADMIN_MODIFY_BALANCE: [
                     MessageHandler(filters.TEXT & ~filters.COMMAND, handle_user_input),
-                    CallbackQueryHandler(shop_callback, pattern=r"^shop$"),
-                    CallbackQueryHandler(games_callback, pattern=r"^games$"),
+                    nav_router,
                 ],
                 WAITING_FOR_AMOUNT: [
                     MessageHandler(filters.TEXT & ~filters.COMMAND, handle_amount),
-                    CallbackQueryHandler(shop_callback, pattern=r"^shop$"),
-                    CallbackQueryHandler(games_callback, pattern=r"^games$"),
+                    nav_router,
                 ],
                 WAITING_FOR_PAYMENT_PROOF: [
                     MessageHandler(filters.TEXT & ~filters.COMMAND, handle_photo),
-                    CallbackQueryHandler(shop_callback, pattern=r"^shop$"),
-                    CallbackQueryHandler(games_callback, pattern=r"^games$"),
+                    nav_router,
                 ],
                 WAITING_FOR_TXID: [
                     MessageHandler(filters.TEXT & ~filters.COMMAND, handle_txid),
-                    CallbackQueryHandler(shop_callback, pattern=r"^shop$"),
-                    CallbackQueryHandler(games_callback, pattern=r"^games$"),
+                    nav_router,
                 ],
                 WAITING_FOR_GAME_ID: [
                     MessageHandler(filters.TEXT & ~filters.COMMAND, handle_game_id),
                 ],
                 WAITING_FOR_RATE: [
                     MessageHandler(filters.TEXT & ~filters.COMMAND, handle_rate_update),
-                    CallbackQueryHandler(shop_callback, pattern=r"^shop$"),
-                    CallbackQueryHandler(games_callback, pattern=r"^games$"),
+                    nav_router,
+                ],
+                WAITING_FOR_BROADCAST_TEXT: [
+                    MessageHandler(filters.TEXT & ~filters.COMMAND, handle_broadcast_text),
+                    nav_router,
                 ],
                 WAITING_FOR_PRICE_UPDATE: [
-                    MessageHandler(filters.TEXT & ~filters.COMMAND, handle_price_update),
-                    CallbackQueryHandler(shop_callback, pattern=r"^shop$"),
-                    CallbackQueryHandler(games_callback, pattern=r"^games$"),
+                    MessageHandler(filters.TEXT & ~filters.COMMAND, handle_package_price_update),
+                    nav_router,
                 ],
                 EDITING_ENV_VALUE: [
                     MessageHandler(filters.TEXT & ~filters.COMMAND, handle_env_value),
@@ -316,40 +342,46 @@ def main():
             },
             fallbacks=[
                 CommandHandler("cancel", cancel_command),
-                CallbackQueryHandler(shop_callback, pattern=r"^shop$"),
-                CallbackQueryHandler(games_callback, pattern=r"^games$"),
-                CallbackQueryHandler(cancel_callback, pattern=r"^cancel_reject$"),
-                CallbackQueryHandler(back_to_main_callback, pattern=r"^back_to_main$"),
+                CallbackRouter([
+                    (r"^shop$", shop_callback),
+                    (r"^games$", games_callback),
+                    (r"^cancel_reject$", cancel_callback),
+                    (r"^back_to_main$", back_to_main_callback),
+                    (r"^admin_broadcast$", broadcast_menu_callback),
+                ]),
             ],
             per_message=False,
             per_chat=True,
             per_user=True,
             allow_reentry=True,
-            name="diamond_store_bot"
+            name="diamond_store_bot",
+            persistent=True
         )
 
         # Add handlers
         application.add_handler(CommandHandler("start", start_command))
         application.add_handler(CommandHandler("help", help_command))
         application.add_handler(conv_handler)  # Add the conversation handler
-        application.add_handler(CallbackQueryHandler(show_balance, pattern=r"^my_balance$"))
-        application.add_handler(CallbackQueryHandler(show_orders, pattern=r"^my_orders$"))
-        application.add_handler(CallbackQueryHandler(shop_callback, pattern=r"^shop$"))
-        application.add_handler(CallbackQueryHandler(games_callback, pattern=r"^games$"))
-        application.add_handler(CallbackQueryHandler(apps_callback, pattern=r"^apps$"))
-        application.add_handler(CallbackQueryHandler(game_packages_callback, pattern=r"^game_"))
-        application.add_handler(CallbackQueryHandler(app_packages_callback, pattern=r"^app_"))
-        application.add_handler(CallbackQueryHandler(charge_callback, pattern=r"^charge$"))
-
-        # Add handlers for recharge_manager and purchase_manager using CallbackQueryHandler
-        #application.add_handler(CallbackQueryHandler(recharge_manager.confirm_payment, pattern=r"^confirm_payment_"))
-        #application.add_handler(CallbackQueryHandler(recharge_manager.reject_payment, pattern=r"^reject_payment_"))
-        application.add_handler(CallbackQueryHandler(purchase_manager.accept_order, pattern=r"^complete_order_"))
-        application.add_handler(CallbackQueryHandler(purchase_manager.reject_order, pattern=r"^cancel_order_"))
-
-        application.add_handler(CallbackQueryHandler(back_to_main_callback, pattern=r"^back_to_main$"))
+        application.add_handler(InlineQueryHandler(inline_query_handler))
+        application.add_handler(ChatMemberHandler(channel_member_update, ChatMemberHandler.CHAT_MEMBER))
+        application.add_handler(CallbackRouter([
+            (r"^my_balance$", show_balance),
+            (r"^my_orders$", show_orders),
+            (r"^shop$", shop_callback),
+            (r"^games$", games_callback),
+            (r"^apps$", apps_callback),
+            (r"^page_(game|app)_[<>][0-9.]+$", products_page_callback),
+            (r"^game_", game_packages_callback),
+            (r"^app_", app_packages_callback),
+            (r"^charge$", charge_callback),
+            # Recharge confirm/reject are routed by the conversation handler above
+            (r"^complete_order_", purchase_manager.accept_order),
+            (r"^cancel_order_", purchase_manager.reject_order),
+            (r"^back_to_main$", back_to_main_callback),
+        ]))
 
         application.add_handler(CommandHandler("admin", admin_panel.admin_panel))
+        application.add_handler(CommandHandler("rebuild_stats", admin_panel.rebuild_stats_command))
 
         application.add_error_handler(error_handler)
 
@@ -359,6 +391,16 @@ def main():
             cleanup_expired_transactions,
             interval=timedelta(hours=1)
         )
+        job_queue.run_repeating(
+            archive_old_rows,
+            interval=timedelta(hours=24),
+            first=timedelta(minutes=10)
+        )
+        job_queue.run_once(resume_broadcasts, when=timedelta(seconds=5))
+        job_queue.run_repeating(
+            send_error_digest,
+            interval=timedelta(minutes=DIGEST_INTERVAL_MINUTES)
+        )
 
         # Bot start info
         print("\n" + "=" * 50)
@@ -370,10 +412,13 @@ def main():
         print("=" * 50 + "\n")
 
         # Run the bot
-        application.run_polling(
-            allowed_updates=Update.ALL_TYPES,
-            drop_pending_updates=True
-        )
+        if WEBHOOK_URL:
+            asyncio.run(run_webhook(application))
+        else:
+            application.run_polling(
+                allowed_updates=Update.ALL_TYPES,
+                drop_pending_updates=True
+            )
 
     except Exception as e:
         logger.error(f"Critical error: {e}")
@@ -382,6 +427,7 @@ def main():
         import traceback
         print(traceback.format_exc())
     finally:
+        close_pool()
         print("\n⚠️ تم إيقاف البوت")
 
 
@@ -0,0 +1,121 @@
+import os
+import time
+import asyncio
+import logging
+from collections import OrderedDict
+
+from telegram import ChatMember
+
+from config import get_config
+
+# Logger
+logger = logging.getLogger(__name__)
+
+# Settings
+MEMBER_TTL = int(os.getenv('MEMBERSHIP_TTL_SECONDS', '600'))
+NON_MEMBER_TTL = int(os.getenv('MEMBERSHIP_NEGATIVE_TTL_SECONDS', '30'))
+MAX_ENTRIES = int(os.getenv('MEMBERSHIP_CACHE_SIZE', '50000'))
+
+MEMBER_STATUSES = frozenset({ChatMember.MEMBER, ChatMember.OWNER, ChatMember.ADMINISTRATOR})
+
+
+class MembershipCache:
+    """Forced-channel membership per user, cached with separate TTLs.
+
+    Members are cached for MEMBER_TTL; non-members only for NON_MEMBER_TTL so
+    a user who just joined is let in quickly even if the bot misses the
+    chat_member update. Concurrent lookups for the same user share one Bot
+    API call. Failed lookups are not cached: the last known answer is used
+    if there is one, otherwise the user counts as not subscribed.
+    """
+
+    def __init__(self, chat_id):
+        self.chat_id = chat_id
+        self._entries = OrderedDict()  # user_id -> (is_member, expires_at), LRU order
+        self._inflight = {}  # user_id -> asyncio.Task of the pending lookup
+        self.metrics = dict.fromkeys(
+            ('hits', 'misses', 'coalesced', 'errors', 'stale_served', 'updates'), 0
+        )
+
+    async def is_member(self, user_id, bot) -> bool:
+        """Whether the user is subscribed to the forced channel."""
+        entry = self._entries.get(user_id)
+        if entry is not None and entry[1] > time.monotonic():
+            self.metrics['hits'] += 1
+            self._entries.move_to_end(user_id)
+            return entry[0]
+
+        task = self._inflight.get(user_id)
+        if task is not None:
+            self.metrics['coalesced'] += 1
+        else:
+            self.metrics['misses'] += 1
+            task = asyncio.ensure_future(self._lookup(user_id, bot))
+            self._inflight[user_id] = task
+        # Shield so one caller being cancelled does not cancel the shared lookup
+        return await asyncio.shield(task)
+
+    async def _lookup(self, user_id, bot):
+        try:
+            member = await bot.get_chat_member(self.chat_id, user_id)
+            is_member = member.status in MEMBER_STATUSES
+            self.record(user_id, is_member)
+            return is_member
+        except Exception as e:
+            self.metrics['errors'] += 1
+            logger.error(f"Error checking subscription: {e}")
+            entry = self._entries.get(user_id)
+            if entry is not None:
+                self.metrics['stale_served'] += 1
+                return entry[0]
+            return False
+        finally:
+            self._inflight.pop(user_id, None)
+
+    def record(self, user_id, is_member):
+        """Store a known membership state (from a lookup or a chat_member update)."""
+        ttl = MEMBER_TTL if is_member else NON_MEMBER_TTL
+        self._entries[user_id] = (is_member, time.monotonic() + ttl)
+        self._entries.move_to_end(user_id)
+        while len(self._entries) > MAX_ENTRIES:
+            self._entries.popitem(last=False)
+
+    def on_chat_member(self, chat_member_update) -> bool:
+        """Apply a chat_member update; returns False if it is not for the forced channel."""
+        if chat_member_update.chat.id != self.chat_id:
+            return False
+        new = chat_member_update.new_chat_member
+        self.metrics['updates'] += 1
+        self.record(new.user.id, new.status in MEMBER_STATUSES)
+        return True
+
+    def invalidate(self, user_id=None):
+        """Forget one user, or everyone."""
+        if user_id is None:
+            self._entries.clear()
+        else:
+            self._entries.pop(user_id, None)
+
+    def status_text(self) -> str:
+        """Cache metrics for the admin panel."""
+        m = self.metrics
+        lookups = m['hits'] + m['misses'] + m['coalesced']
+        hit_rate = (m['hits'] + m['coalesced']) / lookups * 100 if lookups else 0
+        return (
+            "📡 ذاكرة التحقق من الاشتراك:\n"
+            f"• نسبة الإصابة: {hit_rate:.1f}% ({m['hits']} إصابة، {m['misses']} طلب API، {m['coalesced']} مدمج)\n"
+            f"• الأخطاء: {m['errors']} (قيمة سابقة: {m['stale_served']})\n"
+            f"• تحديثات القناة: {m['updates']}\n"
+            f"• المستخدمون المخزنون: {len(self._entries)}"
+        )
+
+
+_membership_cache = None
+
+
+def get_membership_cache():
+    """Function to access the MembershipCache instance."""
+    global _membership_cache
+    if _membership_cache is None:
+        _membership_cache = MembershipCache(get_config().FORCED_CHANNEL_ID)
+    return _membership_cache
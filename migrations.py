@@ -0,0 +1,931 @@
+import os
+import json
+import logging
+import sqlite3
+from datetime import datetime, timezone
+
+# Logger
+logger = logging.getLogger(__name__)
+
+# Schema as it existed before versioning (user_version 0). Every statement is
+# idempotent so it can run against databases created by older releases.
+BASELINE_SCHEMA = '''
+    -- User table with improvements
+    CREATE TABLE IF NOT EXISTS users (
+        user_id INTEGER PRIMARY KEY,
+        username TEXT,
+        first_name TEXT,
+        balance REAL DEFAULT 0.0 CHECK (balance >= 0),
+        joined_date TEXT NOT NULL,
+        last_activity TEXT NOT NULL,
+        status TEXT DEFAULT 'active' CHECK (status IN ('active', 'banned', 'suspended')),
+        account_data TEXT,
+        created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+        updated_at TEXT DEFAULT CURRENT_TIMESTAMP
+    );
+
+    -- Balance history table
+    CREATE TABLE IF NOT EXISTS balance_history (
+        history_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL,
+        old_balance REAL NOT NULL,
+        new_balance REAL NOT NULL,
+        change_amount REAL NOT NULL,  -- Renamed amount to change_amount
+        transaction_type TEXT NOT NULL,
+        created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (user_id) REFERENCES users(user_id) ON DELETE CASCADE
+    );
+
+    -- Improved orders table
+    CREATE TABLE IF NOT EXISTS orders (
+        order_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL,
+        product_type TEXT NOT NULL CHECK (product_type IN ('game', 'app')),
+        product_id TEXT NOT NULL,
+        amount TEXT NOT NULL,
+        price REAL NOT NULL,
+        created_at TEXT NOT NULL,
+        status TEXT DEFAULT 'pending' CHECK (status IN ('pending', 'completed', 'rejected', 'expired')),
+        FOREIGN KEY (user_id) REFERENCES users(user_id) ON DELETE CASCADE
+    );
+
+    -- Transactions table
+    CREATE TABLE IF NOT EXISTS transactions (
+        tx_id TEXT PRIMARY KEY,
+        user_id INTEGER NOT NULL,
+        amount REAL NOT NULL,
+        type TEXT NOT NULL CHECK (type IN ('deposit', 'withdrawal')),
+        payment_method TEXT NOT NULL,
+        payment_details TEXT,
+        original_amount REAL,
+        original_currency TEXT,
+        created_at TEXT NOT NULL,
+        status TEXT DEFAULT 'pending' CHECK (status IN ('pending', 'completed', 'rejected', 'expired')),
+        reject_reason TEXT,
+        FOREIGN KEY (user_id) REFERENCES users(user_id) ON DELETE CASCADE
+    );
+
+    -- Admin logs table
+    CREATE TABLE IF NOT EXISTS admin_logs (
+        log_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        admin_id INTEGER NOT NULL,
+        action TEXT NOT NULL,
+        details TEXT,
+        created_at TEXT DEFAULT CURRENT_TIMESTAMP
+    );
+
+    -- Status + age lookups (also serve plain status filters)
+    CREATE INDEX IF NOT EXISTS idx_orders_status_created ON orders (status, created_at);
+    CREATE INDEX IF NOT EXISTS idx_transactions_status_created ON transactions (status, created_at);
+
+    -- Superseded by the composite indexes above
+    DROP INDEX IF EXISTS idx_orders_status;
+    DROP INDEX IF EXISTS idx_transactions_status;
+'''
+
+
+# Cold storage for old orders and balance history, ATTACHed as `archive` on
+# every pooled connection. Columns mirror the hot tables without foreign keys.
+ARCHIVE_SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS archive.orders (
+        order_id INTEGER PRIMARY KEY,
+        user_id INTEGER NOT NULL,
+        product_type TEXT NOT NULL,
+        product_id TEXT NOT NULL,
+        amount TEXT NOT NULL,
+        price REAL NOT NULL,
+        created_at INTEGER NOT NULL,
+        status TEXT,
+        package_id INTEGER
+    );
+    CREATE INDEX IF NOT EXISTS archive.idx_archive_orders_user_created ON orders (user_id, created_at);
+
+    CREATE TABLE IF NOT EXISTS archive.balance_history (
+        history_id INTEGER PRIMARY KEY,
+        user_id INTEGER NOT NULL,
+        old_balance INTEGER NOT NULL,
+        new_balance INTEGER NOT NULL,
+        change_amount INTEGER NOT NULL,
+        transaction_type TEXT NOT NULL,
+        created_at INTEGER NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS archive.idx_archive_balance_history_user_created ON balance_history (user_id, created_at);
+'''
+
+# Hot and archived rows as one relation. A row can briefly exist in both
+# after a crash mid-move, so archived copies of hot rows are skipped.
+ARCHIVE_VIEWS = '''
+    CREATE TEMP VIEW IF NOT EXISTS all_orders AS
+        SELECT order_id, user_id, product_type, product_id, amount, price, created_at, status, package_id
+        FROM main.orders
+        UNION ALL
+        SELECT order_id, user_id, product_type, product_id, amount, price, created_at, status, package_id
+        FROM archive.orders a
+        WHERE NOT EXISTS (SELECT 1 FROM main.orders m WHERE m.order_id = a.order_id);
+
+    CREATE TEMP VIEW IF NOT EXISTS all_balance_history AS
+        SELECT history_id, user_id, old_balance, new_balance, change_amount, transaction_type, created_at
+        FROM main.balance_history
+        UNION ALL
+        SELECT history_id, user_id, old_balance, new_balance, change_amount, transaction_type, created_at
+        FROM archive.balance_history a
+        WHERE NOT EXISTS (SELECT 1 FROM main.balance_history m WHERE m.history_id = a.history_id);
+'''
+
+
+def run_script(conn, script):
+    """Execute a multi-statement script inside the current transaction.
+
+    Unlike executescript() this does not commit first, so a migration step
+    stays atomic.
+    """
+    statement = ''
+    for line in script.splitlines(keepends=True):
+        statement += line
+        if sqlite3.complete_statement(statement):
+            conn.execute(statement)
+            statement = ''
+    if statement.strip():
+        raise sqlite3.ProgrammingError(f"Incomplete SQL statement: {statement.strip()[:80]}")
+
+
+def _baseline(conn):
+    run_script(conn, BASELINE_SCHEMA)
+
+
+def _index_orders_user(conn):
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_orders_user_created ON orders (user_id, created_at)')
+
+
+def _index_transactions_user(conn):
+    conn.execute(
+        'CREATE INDEX IF NOT EXISTS idx_transactions_user_status_created '
+        'ON transactions (user_id, status, created_at)'
+    )
+
+
+def _index_balance_history_user(conn):
+    conn.execute(
+        'CREATE INDEX IF NOT EXISTS idx_balance_history_user_created '
+        'ON balance_history (user_id, created_at)'
+    )
+
+
+def _drop_redundant_user_index(conn):
+    # users.user_id is the INTEGER PRIMARY KEY (the rowid), so this index only costs writes
+    conn.execute('DROP INDEX IF EXISTS idx_users_user_id')
+
+
+# SQL expression for the current time in epoch milliseconds
+NOW_MS_SQL = "(CAST((julianday('now') - 2440587.5) * 86400000 AS INTEGER))"
+
+EPOCH_SCHEMA = f'''
+    CREATE TABLE new_users (
+        user_id INTEGER PRIMARY KEY,
+        username TEXT,
+        first_name TEXT,
+        balance REAL DEFAULT 0.0 CHECK (balance >= 0),
+        joined_date INTEGER NOT NULL,  -- epoch ms
+        last_activity INTEGER NOT NULL,  -- epoch ms
+        status TEXT DEFAULT 'active' CHECK (status IN ('active', 'banned', 'suspended')),
+        account_data TEXT,
+        created_at INTEGER NOT NULL DEFAULT {NOW_MS_SQL},
+        updated_at INTEGER NOT NULL DEFAULT {NOW_MS_SQL}
+    );
+    INSERT INTO new_users
+        SELECT user_id, username, first_name, balance,
+               COALESCE(legacy_to_ms(joined_date), legacy_to_ms(created_at), {NOW_MS_SQL}),
+               COALESCE(legacy_to_ms(last_activity), legacy_to_ms(joined_date), {NOW_MS_SQL}),
+               status, account_data,
+               COALESCE(legacy_to_ms(created_at), {NOW_MS_SQL}),
+               COALESCE(legacy_to_ms(updated_at), {NOW_MS_SQL})
+        FROM users;
+
+    CREATE TABLE new_balance_history (
+        history_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL,
+        old_balance REAL NOT NULL,
+        new_balance REAL NOT NULL,
+        change_amount REAL NOT NULL,
+        transaction_type TEXT NOT NULL,
+        created_at INTEGER NOT NULL DEFAULT {NOW_MS_SQL},
+        FOREIGN KEY (user_id) REFERENCES users(user_id) ON DELETE CASCADE
+    );
+    INSERT INTO new_balance_history
+        SELECT history_id, user_id, old_balance, new_balance, change_amount, transaction_type,
+               COALESCE(legacy_to_ms(created_at), {NOW_MS_SQL})
+        FROM balance_history;
+
+    CREATE TABLE new_orders (
+        order_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL,
+        product_type TEXT NOT NULL CHECK (product_type IN ('game', 'app')),
+        product_id TEXT NOT NULL,
+        amount TEXT NOT NULL,
+        price REAL NOT NULL,
+        created_at INTEGER NOT NULL,  -- epoch ms
+        status TEXT DEFAULT 'pending' CHECK (status IN ('pending', 'completed', 'rejected', 'expired')),
+        FOREIGN KEY (user_id) REFERENCES users(user_id) ON DELETE CASCADE
+    );
+    INSERT INTO new_orders
+        SELECT order_id, user_id, product_type, product_id, amount, price,
+               COALESCE(legacy_to_ms(created_at), {NOW_MS_SQL}), status
+        FROM orders;
+
+    CREATE TABLE new_transactions (
+        tx_id TEXT PRIMARY KEY,
+        user_id INTEGER NOT NULL,
+        amount REAL NOT NULL,
+        type TEXT NOT NULL CHECK (type IN ('deposit', 'withdrawal')),
+        payment_method TEXT NOT NULL,
+        payment_details TEXT,
+        original_amount REAL,
+        original_currency TEXT,
+        created_at INTEGER NOT NULL,  -- epoch ms
+        status TEXT DEFAULT 'pending' CHECK (status IN ('pending', 'completed', 'rejected', 'expired')),
+        reject_reason TEXT,
+        FOREIGN KEY (user_id) REFERENCES users(user_id) ON DELETE CASCADE
+    );
+    INSERT INTO new_transactions
+        SELECT tx_id, user_id, amount, type, payment_method, payment_details,
+               original_amount, original_currency, COALESCE(legacy_to_ms(created_at), {NOW_MS_SQL}),
+               status, reject_reason
+        FROM transactions;
+
+    DROP TABLE users;
+    DROP TABLE balance_history;
+    DROP TABLE orders;
+    DROP TABLE transactions;
+    ALTER TABLE new_users RENAME TO users;
+    ALTER TABLE new_balance_history RENAME TO balance_history;
+    ALTER TABLE new_orders RENAME TO orders;
+    ALTER TABLE new_transactions RENAME TO transactions;
+
+    CREATE INDEX idx_users_joined ON users (joined_date);
+    CREATE INDEX idx_balance_history_user_created ON balance_history (user_id, created_at);
+    CREATE INDEX idx_balance_history_created ON balance_history (created_at);
+    CREATE INDEX idx_orders_status_created ON orders (status, created_at);
+    CREATE INDEX idx_orders_user_created ON orders (user_id, created_at);
+    CREATE INDEX idx_orders_created ON orders (created_at);
+    CREATE INDEX idx_transactions_status_created ON transactions (status, created_at);
+    CREATE INDEX idx_transactions_user_status_created ON transactions (user_id, status, created_at);
+    CREATE INDEX idx_transactions_created ON transactions (created_at);
+'''
+
+
+def _legacy_to_ms(value):
+    """Convert a pre-epoch timestamp value to epoch milliseconds.
+
+    'YYYY-MM-DD HH:MM:SS' values come from CURRENT_TIMESTAMP and are UTC;
+    'YYYY-MM-DDTHH:MM:SS' values come from datetime.now().isoformat() and
+    are server local time. Unparseable values give None; the migration
+    falls back to a related column or the migration time.
+    """
+    if value is None or isinstance(value, int):
+        return value
+    if isinstance(value, float):
+        return int(value)
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        logger.warning(f"Unparseable timestamp {value!r}, using a fallback time")
+        return None
+    if parsed.tzinfo is None and 'T' not in value:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return int(parsed.timestamp() * 1000)
+
+
+def _epoch_timestamps(conn):
+    conn.create_function('legacy_to_ms', 1, _legacy_to_ms, deterministic=True)
+    sequences = dict(conn.execute(
+        "SELECT name, seq FROM sqlite_sequence WHERE name IN ('orders', 'balance_history')"
+    ).fetchall())
+    run_script(conn, EPOCH_SCHEMA)
+    # Keep AUTOINCREMENT counters so ids of deleted rows are never reused
+    for name, seq in sequences.items():
+        conn.execute("UPDATE sqlite_sequence SET seq = MAX(seq, ?) WHERE name = ?", (seq, name))
+
+_epoch_timestamps.rebuilds_tables = True
+
+
+INTEGER_MONEY_SCHEMA = f'''
+    CREATE TABLE new_users (
+        user_id INTEGER PRIMARY KEY,
+        username TEXT,
+        first_name TEXT,
+        balance INTEGER NOT NULL DEFAULT 0 CHECK (balance >= 0),  -- SYP minor units
+        joined_date INTEGER NOT NULL,  -- epoch ms
+        last_activity INTEGER NOT NULL,  -- epoch ms
+        status TEXT DEFAULT 'active' CHECK (status IN ('active', 'banned', 'suspended')),
+        account_data TEXT,
+        created_at INTEGER NOT NULL DEFAULT {NOW_MS_SQL},
+        updated_at INTEGER NOT NULL DEFAULT {NOW_MS_SQL}
+    );
+    INSERT INTO new_users
+        SELECT user_id, username, first_name,
+               CAST(ROUND(COALESCE(balance, 0) * {{minor}}) AS INTEGER),
+               joined_date, last_activity, status, account_data, created_at, updated_at
+        FROM users;
+
+    CREATE TABLE new_balance_history (
+        history_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL,
+        old_balance INTEGER NOT NULL,  -- SYP minor units
+        new_balance INTEGER NOT NULL,
+        change_amount INTEGER NOT NULL,
+        transaction_type TEXT NOT NULL,
+        created_at INTEGER NOT NULL DEFAULT {NOW_MS_SQL},
+        FOREIGN KEY (user_id) REFERENCES users(user_id) ON DELETE CASCADE
+    );
+    INSERT INTO new_balance_history
+        SELECT history_id, user_id,
+               CAST(ROUND(old_balance * {{minor}}) AS INTEGER),
+               CAST(ROUND(new_balance * {{minor}}) AS INTEGER),
+               CAST(ROUND(change_amount * {{minor}}) AS INTEGER),
+               transaction_type, created_at
+        FROM balance_history;
+
+    DROP TABLE users;
+    DROP TABLE balance_history;
+    ALTER TABLE new_users RENAME TO users;
+    ALTER TABLE new_balance_history RENAME TO balance_history;
+
+    CREATE INDEX idx_users_joined ON users (joined_date);
+    CREATE INDEX idx_balance_history_user_created ON balance_history (user_id, created_at);
+    CREATE INDEX idx_balance_history_created ON balance_history (created_at);
+'''
+
+# Smallest SYP unit stored in the database. Piastres are not in circulation,
+# so one unit is one pound; database.to_minor/from_minor convert.
+SYP_MINOR_UNITS = 1
+
+
+def _integer_money(conn):
+    sequences = dict(conn.execute(
+        "SELECT name, seq FROM sqlite_sequence WHERE name = 'balance_history'"
+    ).fetchall())
+    run_script(conn, INTEGER_MONEY_SCHEMA.format(minor=SYP_MINOR_UNITS))
+    for name, seq in sequences.items():
+        conn.execute("UPDATE sqlite_sequence SET seq = MAX(seq, ?) WHERE name = ?", (seq, name))
+
+_integer_money.rebuilds_tables = True
+
+
+# Incrementally maintained statistics. Buckets are epoch-ms starts of
+# Damascus (UTC+3) days and hours; bucket_kind 'all' (bucket 0) is all time.
+DAMASCUS_OFFSET_MS = 3 * 3600 * 1000
+
+BUCKET_KINDS_SQL = "(SELECT 'day' AS kind UNION ALL SELECT 'hour' UNION ALL SELECT 'all') AS k"
+
+
+def _bucket_sql(column):
+    """CASE expression giving the bucket of `column` for bucket kind k.kind."""
+    return (
+        f"CASE k.kind "
+        f"WHEN 'day' THEN (({column} + {DAMASCUS_OFFSET_MS}) / 86400000) * 86400000 - {DAMASCUS_OFFSET_MS} "
+        f"WHEN 'hour' THEN ({column} / 3600000) * 3600000 "
+        f"ELSE 0 END"
+    )
+
+
+STATS_SCHEMA = '''
+    CREATE TABLE stats_rollup (
+        dimension TEXT NOT NULL CHECK (dimension IN ('total', 'product', 'payment_method')),
+        key TEXT NOT NULL,
+        bucket_kind TEXT NOT NULL CHECK (bucket_kind IN ('day', 'hour', 'all')),
+        bucket INTEGER NOT NULL,
+        order_count INTEGER NOT NULL DEFAULT 0,
+        revenue INTEGER NOT NULL DEFAULT 0,
+        deposit_count INTEGER NOT NULL DEFAULT 0,
+        deposit_volume INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (dimension, key, bucket_kind, bucket)
+    ) WITHOUT ROWID;
+    CREATE INDEX idx_stats_rollup_bucket ON stats_rollup (bucket_kind, bucket, dimension);
+'''
+
+
+def _order_rollup_sql(row, sign):
+    return f'''
+        INSERT INTO stats_rollup (dimension, key, bucket_kind, bucket, order_count, revenue)
+        SELECT d.dimension, d.key, k.kind, {_bucket_sql(f'{row}.created_at')},
+               {sign}, {sign} * CAST(ROUND({row}.price) AS INTEGER)
+        FROM {BUCKET_KINDS_SQL},
+             (SELECT 'total' AS dimension, '' AS key
+              UNION ALL SELECT 'product', {row}.product_type || ':' || {row}.product_id) AS d
+        WHERE 1
+        ON CONFLICT (dimension, key, bucket_kind, bucket) DO UPDATE SET
+            order_count = order_count + excluded.order_count,
+            revenue = revenue + excluded.revenue;
+    '''
+
+
+def _deposit_rollup_sql(row, sign):
+    return f'''
+        INSERT INTO stats_rollup (dimension, key, bucket_kind, bucket, deposit_count, deposit_volume)
+        SELECT d.dimension, d.key, k.kind, {_bucket_sql(f'{row}.created_at')},
+               {sign}, {sign} * CAST(ROUND({row}.amount) AS INTEGER)
+        FROM {BUCKET_KINDS_SQL},
+             (SELECT 'total' AS dimension, '' AS key
+              UNION ALL SELECT 'payment_method', {row}.payment_method) AS d
+        WHERE 1
+        ON CONFLICT (dimension, key, bucket_kind, bucket) DO UPDATE SET
+            deposit_count = deposit_count + excluded.deposit_count,
+            deposit_volume = deposit_volume + excluded.deposit_volume;
+    '''
+
+
+# Counted when a row reaches 'completed' and uncounted if it leaves that
+# state. Deletes (e.g. archiving) deliberately do not touch the rollups.
+STATS_TRIGGERS = f'''
+    CREATE TRIGGER trg_stats_order_insert AFTER INSERT ON orders
+    WHEN NEW.status = 'completed'
+    BEGIN {_order_rollup_sql('NEW', 1)} END;
+
+    CREATE TRIGGER trg_stats_order_complete AFTER UPDATE OF status ON orders
+    WHEN NEW.status = 'completed' AND OLD.status IS NOT 'completed'
+    BEGIN {_order_rollup_sql('NEW', 1)} END;
+
+    CREATE TRIGGER trg_stats_order_uncomplete AFTER UPDATE OF status ON orders
+    WHEN OLD.status = 'completed' AND NEW.status IS NOT 'completed'
+    BEGIN {_order_rollup_sql('OLD', -1)} END;
+
+    CREATE TRIGGER trg_stats_deposit_insert AFTER INSERT ON transactions
+    WHEN NEW.type = 'deposit' AND NEW.status = 'completed'
+    BEGIN {_deposit_rollup_sql('NEW', 1)} END;
+
+    CREATE TRIGGER trg_stats_deposit_complete AFTER UPDATE OF status ON transactions
+    WHEN NEW.type = 'deposit' AND NEW.status = 'completed' AND OLD.status IS NOT 'completed'
+    BEGIN {_deposit_rollup_sql('NEW', 1)} END;
+
+    CREATE TRIGGER trg_stats_deposit_uncomplete AFTER UPDATE OF status ON transactions
+    WHEN OLD.type = 'deposit' AND OLD.status = 'completed' AND NEW.status IS NOT 'completed'
+    BEGIN {_deposit_rollup_sql('OLD', -1)} END;
+'''
+
+# Recompute every rollup from the base tables, hot and archived.
+STATS_REBUILD_SQL = f'''
+    DELETE FROM stats_rollup;
+
+    INSERT INTO stats_rollup (dimension, key, bucket_kind, bucket, order_count, revenue)
+    SELECT d.dimension,
+           CASE d.dimension WHEN 'total' THEN '' ELSE o.product_type || ':' || o.product_id END,
+           k.kind, {_bucket_sql('o.created_at')},
+           COUNT(*), SUM(CAST(ROUND(o.price) AS INTEGER))
+    FROM (
+        SELECT order_id, product_type, product_id, price, created_at FROM main.orders
+        WHERE status = 'completed'
+        UNION
+        SELECT order_id, product_type, product_id, price, created_at FROM archive.orders
+        WHERE status = 'completed'
+    ) AS o,
+    {BUCKET_KINDS_SQL},
+    (SELECT 'total' AS dimension UNION ALL SELECT 'product') AS d
+    GROUP BY 1, 2, 3, 4;
+
+    INSERT INTO stats_rollup (dimension, key, bucket_kind, bucket, deposit_count, deposit_volume)
+    SELECT d.dimension,
+           CASE d.dimension WHEN 'total' THEN '' ELSE t.payment_method END,
+           k.kind, {_bucket_sql('t.created_at')},
+           COUNT(*), SUM(CAST(ROUND(t.amount) AS INTEGER))
+    FROM main.transactions AS t,
+    {BUCKET_KINDS_SQL},
+    (SELECT 'total' AS dimension UNION ALL SELECT 'payment_method') AS d
+    WHERE t.type = 'deposit' AND t.status = 'completed'
+    GROUP BY 1, 2, 3, 4
+    ON CONFLICT (dimension, key, bucket_kind, bucket) DO UPDATE SET
+        deposit_count = excluded.deposit_count,
+        deposit_volume = excluded.deposit_volume;
+'''
+
+
+def _stats_rollups(conn):
+    run_script(conn, STATS_SCHEMA)
+    run_script(conn, STATS_TRIGGERS)
+    run_script(conn, STATS_REBUILD_SQL)
+
+
+# Product catalog. Every change bumps catalog_meta.version, which running
+# processes poll to refresh their in-memory snapshot.
+PRODUCTS_JSON_PATH = 'products.json'
+
+CATALOG_SCHEMA = '''
+    CREATE TABLE products (
+        product_pk INTEGER PRIMARY KEY,
+        product_type TEXT NOT NULL CHECK (product_type IN ('game', 'app')),
+        product_id TEXT NOT NULL,  -- Short name used in callbacks, e.g. 'pubg'
+        name TEXT NOT NULL,
+        icon TEXT NOT NULL DEFAULT '',
+        note TEXT NOT NULL DEFAULT '',
+        package_size INTEGER,  -- Apps: units per package
+        sort_order INTEGER NOT NULL DEFAULT 0,
+        active INTEGER NOT NULL DEFAULT 1,
+        UNIQUE (product_type, product_id)
+    );
+
+    CREATE TABLE packages (
+        package_id INTEGER PRIMARY KEY,
+        product_pk INTEGER NOT NULL REFERENCES products(product_pk) ON DELETE CASCADE,
+        label TEXT NOT NULL,
+        price INTEGER NOT NULL CHECK (price >= 0),  -- SYP minor units
+        sort_order INTEGER NOT NULL DEFAULT 0,
+        active INTEGER NOT NULL DEFAULT 1
+    );
+    CREATE INDEX idx_packages_product ON packages (product_pk, sort_order);
+
+    CREATE TABLE catalog_meta (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        version INTEGER NOT NULL
+    );
+    INSERT INTO catalog_meta (id, version) VALUES (1, 1);
+
+    CREATE TRIGGER trg_catalog_products_insert AFTER INSERT ON products
+    BEGIN UPDATE catalog_meta SET version = version + 1; END;
+    CREATE TRIGGER trg_catalog_products_update AFTER UPDATE ON products
+    BEGIN UPDATE catalog_meta SET version = version + 1; END;
+    CREATE TRIGGER trg_catalog_products_delete AFTER DELETE ON products
+    BEGIN UPDATE catalog_meta SET version = version + 1; END;
+    CREATE TRIGGER trg_catalog_packages_insert AFTER INSERT ON packages
+    BEGIN UPDATE catalog_meta SET version = version + 1; END;
+    CREATE TRIGGER trg_catalog_packages_update AFTER UPDATE ON packages
+    BEGIN UPDATE catalog_meta SET version = version + 1; END;
+    CREATE TRIGGER trg_catalog_packages_delete AFTER DELETE ON packages
+    BEGIN UPDATE catalog_meta SET version = version + 1; END;
+
+    ALTER TABLE orders ADD COLUMN package_id INTEGER REFERENCES packages(package_id);
+    CREATE INDEX idx_orders_package ON orders (package_id);
+'''
+
+
+def import_products_data(conn, data):
+    """Upsert products and packages from products.json-shaped data.
+
+    Packages are matched by product and position, so re-importing an edited
+    file updates prices in place and keeps package ids stable. Returns the
+    ids of packages that were added or whose price changed.
+    """
+    priced = []
+    for product_type, section in (('game', 'games'), ('app', 'apps')):
+        for sort_order, (product_id, raw) in enumerate(data.get(section, {}).items()):
+            product_pk = conn.execute('''
+                INSERT INTO products (product_type, product_id, name, icon, note, package_size, sort_order)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (product_type, product_id) DO UPDATE SET
+                    name = excluded.name, icon = excluded.icon, note = excluded.note,
+                    package_size = excluded.package_size, sort_order = excluded.sort_order
+                RETURNING product_pk
+            ''', (
+                product_type, product_id, raw['name'], raw.get('icon', ''), raw.get('note', ''),
+                raw.get('package_size'), sort_order
+            )).fetchone()[0]
+
+            if 'packages' in raw:
+                packages = [(str(label), int(price)) for label, price in raw['packages']]
+            else:
+                # Apps are sold as a single package of `package_size` units
+                packages = [(str(raw.get('package_size', '')), int(raw['price']))]
+
+            existing = conn.execute(
+                "SELECT package_id, price FROM packages WHERE product_pk = ? ORDER BY sort_order, package_id",
+                (product_pk,)
+            ).fetchall()
+            for position, (label, price) in enumerate(packages):
+                if position < len(existing):
+                    package_id, old_price = existing[position]
+                    conn.execute(
+                        "UPDATE packages SET label = ?, price = ?, sort_order = ?, active = 1 "
+                        "WHERE package_id = ? AND (label, price, sort_order, active) IS NOT (?, ?, ?, 1)",
+                        (label, price, position, package_id, label, price, position)
+                    )
+                    if price != old_price:
+                        priced.append(package_id)
+                else:
+                    priced.append(conn.execute(
+                        "INSERT INTO packages (product_pk, label, price, sort_order) VALUES (?, ?, ?, ?) "
+                        "RETURNING package_id",
+                        (product_pk, label, price, position)
+                    ).fetchone()[0])
+            # Packages dropped from the file stay referenced by old orders
+            for package_id, _ in existing[len(packages):]:
+                conn.execute("UPDATE packages SET active = 0 WHERE package_id = ? AND active = 1", (package_id,))
+    return priced
+
+
+def _catalog_tables(conn):
+    run_script(conn, CATALOG_SCHEMA)
+    columns = [row[1] for row in conn.execute("PRAGMA archive.table_info(orders)")]
+    if columns and 'package_id' not in columns:
+        conn.execute("ALTER TABLE archive.orders ADD COLUMN package_id INTEGER")
+
+    if os.path.exists(PRODUCTS_JSON_PATH):
+        with open(PRODUCTS_JSON_PATH, 'r', encoding='utf-8') as f:
+            import_products_data(conn, json.load(f))
+
+    # Link existing orders to their package by the old label match, once
+    for table in ('main.orders', 'archive.orders') if columns else ('main.orders',):
+        conn.execute(f'''
+            UPDATE {table} SET package_id = (
+                SELECT pk.package_id FROM packages pk
+                JOIN products p ON p.product_pk = pk.product_pk
+                WHERE p.product_type = {table}.product_type
+                  AND p.product_id = {table}.product_id
+                  AND pk.label = {table}.amount
+                ORDER BY pk.active DESC, pk.package_id
+                LIMIT 1
+            )
+            WHERE package_id IS NULL
+        ''')
+
+
+# Runtime settings edited from the admin panel. .env keeps bootstrap values
+# (token, owner, channel ids) and supplies defaults for keys not stored here.
+SETTINGS_KEYS = (
+    'ADMINS', 'USD_RATE', 'USDT_RATE', 'SYRIATEL_CASH_NUMBERS',
+    'USDT_WALLET_COINEX', 'USDT_WALLET_CWALLET', 'USD_WALLET_PAYEER', 'USDT_WALLET_PEB20',
+)
+
+SETTINGS_SCHEMA = f'''
+    CREATE TABLE settings (
+        key TEXT PRIMARY KEY,
+        value TEXT NOT NULL,
+        updated_at INTEGER NOT NULL DEFAULT ({NOW_MS_SQL})  -- epoch ms
+    ) WITHOUT ROWID;
+
+    CREATE TABLE settings_meta (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        version INTEGER NOT NULL  -- Bumped once per committed settings change
+    );
+    INSERT INTO settings_meta (id, version) VALUES (1, 1);
+'''
+
+
+def _settings_table(conn):
+    run_script(conn, SETTINGS_SCHEMA)
+    # Seed from the environment so upgrading keeps the current values
+    conn.executemany(
+        "INSERT INTO settings (key, value) VALUES (?, ?)",
+        [(key, os.environ[key]) for key in SETTINGS_KEYS if os.environ.get(key) is not None]
+    )
+
+
+# Exchange rates (SYP per unit) with history, and per-package USD cost so
+# prices can be recomputed from the current rate. Each new rate bumps the
+# catalog version because the published USD/USDT price table depends on it.
+RATES_SCHEMA = '''
+    CREATE TABLE rate_history (
+        rate_id INTEGER PRIMARY KEY,
+        currency TEXT NOT NULL CHECK (currency IN ('USD', 'USDT')),
+        rate INTEGER NOT NULL CHECK (rate > 0),  -- SYP per unit
+        created_at INTEGER NOT NULL,  -- epoch ms
+        created_by INTEGER  -- Admin user_id, NULL for migrations
+    );
+    CREATE INDEX idx_rate_history_currency ON rate_history (currency, rate_id);
+
+    CREATE TRIGGER trg_catalog_rates_insert AFTER INSERT ON rate_history
+    BEGIN UPDATE catalog_meta SET version = version + 1; END;
+
+    ALTER TABLE packages ADD COLUMN cost_usd_micros INTEGER CHECK (cost_usd_micros >= 0);
+    ALTER TABLE packages ADD COLUMN margin_bp INTEGER;  -- NULL: PRICE_MARGIN_BP setting
+'''
+
+
+# Cost that reprices to a package's current price at the latest USD rate and
+# its margin (its own margin_bp, else PRICE_MARGIN_BP), rounded to the micro-USD.
+PACKAGE_COST_SQL = '''
+    UPDATE packages AS pk SET cost_usd_micros = (
+        pk.price * 10000000000 + r.rate * (10000 + COALESCE(pk.margin_bp, :margin_bp)) / 2
+    ) / (r.rate * (10000 + COALESCE(pk.margin_bp, :margin_bp)))
+    FROM (SELECT rate FROM rate_history WHERE currency = 'USD' ORDER BY rate_id DESC LIMIT 1) AS r
+'''
+
+
+def default_margin_bp(conn):
+    """PRICE_MARGIN_BP as Config resolves it: settings table, then .env, then 0."""
+    row = conn.execute("SELECT value FROM settings WHERE key = 'PRICE_MARGIN_BP'").fetchone()
+    try:
+        return int(row[0] if row else os.environ.get('PRICE_MARGIN_BP', '0'))
+    except ValueError:
+        return 0
+
+
+def set_package_costs(conn, package_ids):
+    """Re-derive the USD cost of packages from their current price.
+
+    Called whenever a price is set by hand (admin edit, products.json import)
+    so the next USD rate change reprices from that price instead of undoing it.
+    """
+    params = {'margin_bp': default_margin_bp(conn)}
+    conn.executemany(
+        f"{PACKAGE_COST_SQL} WHERE pk.package_id = :package_id",
+        [dict(params, package_id=package_id) for package_id in package_ids]
+    )
+
+
+def _rate_engine(conn):
+    run_script(conn, RATES_SCHEMA)
+    for currency, key in (('USD', 'USD_RATE'), ('USDT', 'USDT_RATE')):
+        row = conn.execute("SELECT value FROM settings WHERE key = ?", (key,)).fetchone()
+        try:
+            rate = int(round(float(row[0] if row else os.environ.get(key, '10000'))))
+        except ValueError:
+            rate = 10000
+        conn.execute(
+            f"INSERT INTO rate_history (currency, rate, created_at) VALUES (?, ?, {NOW_MS_SQL})",
+            (currency, max(rate, 1))
+        )
+    # Derive each package's cost from today's price at today's rate and the
+    # margin setting, so repricing at an unchanged rate keeps every price and
+    # margin_bp stays NULL (follows PRICE_MARGIN_BP) until set per package.
+    set_package_costs(conn, [row[0] for row in conn.execute("SELECT package_id FROM packages")])
+
+
+ERRORS_SCHEMA = '''
+    CREATE TABLE error_groups (
+        fingerprint TEXT PRIMARY KEY,  -- Hash of the exception type and traceback frames
+        error_type TEXT NOT NULL,
+        location TEXT NOT NULL,  -- Innermost frame in our code: file:line (function)
+        message TEXT NOT NULL,  -- Latest occurrence
+        traceback TEXT NOT NULL,  -- Latest occurrence
+        first_seen INTEGER NOT NULL,  -- epoch ms
+        last_seen INTEGER NOT NULL,  -- epoch ms
+        occurrences INTEGER NOT NULL DEFAULT 0
+    );
+    CREATE INDEX idx_error_groups_last_seen ON error_groups (last_seen);
+
+    CREATE TABLE error_events (
+        event_id INTEGER PRIMARY KEY,
+        fingerprint TEXT NOT NULL REFERENCES error_groups (fingerprint) ON DELETE CASCADE,
+        user_id INTEGER,  -- NULL for errors outside a user update (jobs)
+        created_at INTEGER NOT NULL  -- epoch ms
+    );
+    CREATE INDEX idx_error_events_fingerprint ON error_events (fingerprint, created_at);
+    CREATE INDEX idx_error_events_created_at ON error_events (created_at);
+'''
+
+
+def _error_store(conn):
+    run_script(conn, ERRORS_SCHEMA)
+
+
+INBOX_SCHEMA = '''
+    CREATE TABLE update_inbox (
+        update_id INTEGER PRIMARY KEY,  -- Telegram's id; redeliveries are ignored
+        payload TEXT NOT NULL,  -- Update JSON as received
+        received_at INTEGER NOT NULL,  -- epoch ms
+        claimed_at INTEGER,  -- epoch ms, NULL until a consumer takes it
+        attempts INTEGER NOT NULL DEFAULT 0
+    );
+'''
+
+
+def _update_inbox(conn):
+    run_script(conn, INBOX_SCHEMA)
+
+
+BROADCASTS_SCHEMA = '''
+    ALTER TABLE users ADD COLUMN blocked_bot INTEGER NOT NULL DEFAULT 0;  -- 1 after a send was Forbidden
+
+    CREATE TABLE broadcasts (
+        broadcast_id INTEGER PRIMARY KEY,
+        text TEXT NOT NULL,
+        status TEXT NOT NULL DEFAULT 'running'
+            CHECK (status IN ('running', 'paused', 'completed', 'cancelled')),
+        cursor INTEGER NOT NULL DEFAULT 0,  -- Last user_id handled
+        total INTEGER NOT NULL,  -- Recipients when the broadcast was created
+        sent INTEGER NOT NULL DEFAULT 0,
+        failed INTEGER NOT NULL DEFAULT 0,
+        blocked INTEGER NOT NULL DEFAULT 0,
+        created_by INTEGER NOT NULL,
+        created_at INTEGER NOT NULL,  -- epoch ms
+        updated_at INTEGER NOT NULL,  -- epoch ms
+        finished_at INTEGER  -- epoch ms
+    );
+    CREATE INDEX idx_broadcasts_status ON broadcasts (status);
+'''
+
+
+def _broadcasts(conn):
+    run_script(conn, BROADCASTS_SCHEMA)
+
+
+PERSISTENCE_SCHEMA = '''
+    CREATE TABLE conversations (
+        name TEXT NOT NULL,  -- ConversationHandler name
+        key TEXT NOT NULL,  -- JSON array, e.g. [chat_id, user_id]
+        state TEXT NOT NULL,  -- JSON
+        updated_at INTEGER NOT NULL,  -- epoch ms
+        PRIMARY KEY (name, key)
+    ) WITHOUT ROWID;
+
+    CREATE TABLE user_data (
+        user_id INTEGER PRIMARY KEY,
+        data BLOB NOT NULL,  -- pickled context.user_data
+        updated_at INTEGER NOT NULL  -- epoch ms
+    );
+
+    CREATE TABLE chat_data (
+        chat_id INTEGER PRIMARY KEY,
+        data BLOB NOT NULL,  -- pickled context.chat_data
+        updated_at INTEGER NOT NULL  -- epoch ms
+    );
+
+    CREATE TABLE bot_data (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        data BLOB NOT NULL,  -- pickled context.bot_data
+        updated_at INTEGER NOT NULL  -- epoch ms
+    );
+'''
+
+
+def _persistence_tables(conn):
+    run_script(conn, PERSISTENCE_SCHEMA)
+
+
+# Ordered migration steps: (user_version, description, function(conn)).
+# Append new steps at the end; never renumber or edit a released step.
+# Index builds get a step of their own so each holds the write lock briefly.
+# Steps that rebuild tables set `rebuilds_tables = True` so they run with
+# foreign key enforcement off (it cannot be toggled inside a transaction).
+MIGRATIONS = [
+    (1, "baseline schema", _baseline),
+    (2, "index orders (user_id, created_at)", _index_orders_user),
+    (3, "index transactions (user_id, status, created_at)", _index_transactions_user),
+    (4, "index balance_history (user_id, created_at)", _index_balance_history_user),
+    (5, "drop redundant idx_users_user_id", _drop_redundant_user_index),
+    (6, "store timestamps as integer epoch milliseconds", _epoch_timestamps),
+    (7, "store balances as integer SYP minor units", _integer_money),
+    (8, "add incrementally maintained stats rollups", _stats_rollups),
+    (9, "move the product catalog into products/packages tables", _catalog_tables),
+    (10, "add the versioned settings store", _settings_table),
+    (11, "add rate history and per-package USD cost", _rate_engine),
+    (12, "add the error store", _error_store),
+    (13, "add the webhook update inbox", _update_inbox),
+    (14, "add broadcasts and users.blocked_bot", _broadcasts),
+    (15, "add conversation and user/chat/bot data persistence", _persistence_tables),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def get_schema_version(conn) -> int:
+    """Return the schema version recorded in the database file."""
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+
+def migrate(conn) -> int:
+    """Bring the schema up to LATEST_VERSION.
+
+    Each step runs in its own transaction together with the user_version
+    bump, so an interrupted upgrade resumes at the failed step. Returns the
+    resulting schema version.
+    """
+    current = get_schema_version(conn)
+    if current == LATEST_VERSION:
+        return current
+    if current > LATEST_VERSION:
+        raise RuntimeError(
+            f"Database schema version {current} is newer than this code ({LATEST_VERSION})"
+        )
+
+    # The per-connection views over the archive would block table rebuilds
+    views = conn.execute("SELECT name FROM temp.sqlite_master WHERE type = 'view'").fetchall()
+    for (name,) in views:
+        conn.execute(f'DROP VIEW temp.{name}')
+    try:
+        current = _apply_pending(conn, current)
+    finally:
+        if views:
+            run_script(conn, ARCHIVE_VIEWS)
+
+    # Refresh planner statistics for the new indexes
+    conn.execute('PRAGMA optimize')
+    return current
+
+
+def _apply_pending(conn, current):
+    """Apply every migration step newer than `current`."""
+    for version, description, step in MIGRATIONS:
+        if version <= current:
+            continue
+        logger.info(f"Applying migration {version}: {description}")
+        rebuilds_tables = getattr(step, 'rebuilds_tables', False)
+        if rebuilds_tables:
+            conn.execute('PRAGMA foreign_keys = OFF')
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            step(conn)
+            if rebuilds_tables:
+                # Older releases ran without foreign keys; report orphans rather than refuse to boot
+                violations = conn.execute('PRAGMA foreign_key_check').fetchall()
+                if violations:
+                    logger.warning(f"{len(violations)} orphaned rows after rebuild, e.g. {violations[:5]}")
+            conn.execute(f'PRAGMA user_version = {version}')
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            logger.error(f"Migration {version} ({description}) failed")
+            raise
+        finally:
+            if rebuilds_tables:
+                conn.execute('PRAGMA foreign_keys = ON')
+        current = version
+    return current
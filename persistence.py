@@ -0,0 +1,211 @@
+import os
+import json
+import pickle
+import asyncio
+import logging
+
+from telegram.ext import BasePersistence, PersistenceInput
+
+from database import get_async_db, now_ms, MS_PER_DAY
+
+# Logger
+logger = logging.getLogger(__name__)
+
+# Settings
+PERSISTENCE_INTERVAL = float(os.getenv('PERSISTENCE_INTERVAL_SECONDS', '5'))
+CONVERSATION_MAX_AGE_DAYS = int(os.getenv('CONVERSATION_MAX_AGE_DAYS', '7'))
+
+# table -> id column, for the per-user and per-chat data tables
+DATA_TABLES = {'user_data': 'user_id', 'chat_data': 'chat_id'}
+
+
+def _load_data(conn, table, key):
+    row = conn.execute(f"SELECT data FROM {table} WHERE {DATA_TABLES[table]} = ?", (key,)).fetchone()
+    return row[0] if row else None
+
+
+def _save_data(conn, table, key, blob, updated_at):
+    column = DATA_TABLES[table]
+    conn.execute(f'''
+        INSERT INTO {table} ({column}, data, updated_at) VALUES (?, ?, ?)
+        ON CONFLICT ({column}) DO UPDATE SET data = excluded.data, updated_at = excluded.updated_at
+    ''', (key, blob, updated_at))
+
+
+def _drop_data(conn, table, key):
+    conn.execute(f"DELETE FROM {table} WHERE {DATA_TABLES[table]} = ?", (key,))
+
+
+def _load_conversations(conn, name, cutoff):
+    # Conversations abandoned long ago are not worth restoring
+    conn.execute("DELETE FROM conversations WHERE name = ? AND updated_at < ?", (name, cutoff))
+    return conn.execute("SELECT key, state FROM conversations WHERE name = ?", (name,)).fetchall()
+
+
+def _save_conversation(conn, name, key, state, updated_at):
+    if state is None:
+        conn.execute("DELETE FROM conversations WHERE name = ? AND key = ?", (name, key))
+        return
+    conn.execute('''
+        INSERT INTO conversations (name, key, state, updated_at) VALUES (?, ?, ?, ?)
+        ON CONFLICT (name, key) DO UPDATE SET state = excluded.state, updated_at = excluded.updated_at
+    ''', (name, key, state, updated_at))
+
+
+def _load_bot_data(conn):
+    row = conn.execute("SELECT data FROM bot_data WHERE id = 1").fetchone()
+    return row[0] if row else None
+
+
+def _save_bot_data(conn, blob, updated_at):
+    conn.execute('''
+        INSERT INTO bot_data (id, data, updated_at) VALUES (1, ?, ?)
+        ON CONFLICT (id) DO UPDATE SET data = excluded.data, updated_at = excluded.updated_at
+    ''', (blob, updated_at))
+
+
+class _LazyStore:
+    """user_data or chat_data rows, loaded on first touch and written only when changed."""
+
+    def __init__(self, table):
+        self.table = table
+        self._loaded = set()
+        self._loading = {}  # key -> asyncio.Task of the pending load
+        self._hashes = {}  # key -> hash of the last stored pickle
+        self.metrics = dict.fromkeys(('loaded', 'written', 'unchanged', 'skipped', 'load_failed'), 0)
+
+    async def refresh(self, key, data):
+        if key in self._loaded:
+            return
+        task = self._loading.get(key)
+        if task is None:
+            task = self._loading[key] = asyncio.ensure_future(self._load(key))
+        try:
+            stored = await asyncio.shield(task)
+        except Exception:
+            # The key stays unloaded: the next update for it retries the read,
+            # and update() leaves the stored row alone until then
+            return
+        # Anything a handler already set in memory is newer than the stored copy
+        for name, value in stored.items():
+            data.setdefault(name, value)
+
+    async def _load(self, key):
+        try:
+            blob = await get_async_db().run_read(_load_data, self.table, key)
+            stored = pickle.loads(blob) if blob is not None else {}
+        except Exception as e:
+            self.metrics['load_failed'] += 1
+            logger.error(f"Could not load {self.table} for {key}: {e}")
+            raise
+        finally:
+            self._loading.pop(key, None)
+        self._hashes[key] = hash(blob if blob is not None else pickle.dumps({}))
+        self._loaded.add(key)
+        self.metrics['loaded'] += 1
+        return stored
+
+    async def update(self, key, data):
+        if key not in self._loaded:
+            # Never read from the database (or the read failed), so writing the
+            # in-memory dict would replace whatever is stored for this key
+            self.metrics['skipped'] += 1
+            return
+        try:
+            blob = pickle.dumps(data)
+        except Exception as e:
+            logger.error(f"Could not pickle {self.table} for {key}: {e}")
+            return
+        digest = hash(blob)
+        # Every update a user sends marks their data dirty; most leave it as it was
+        if self._hashes.get(key) == digest:
+            self.metrics['unchanged'] += 1
+            return
+        self._hashes[key] = digest
+        self.metrics['written'] += 1
+        if data:
+            await get_async_db().enqueue_write(_save_data, self.table, key, blob, now_ms())
+        else:
+            await get_async_db().enqueue_write(_drop_data, self.table, key)
+
+    async def drop(self, key):
+        self._hashes.pop(key, None)
+        self._loaded.discard(key)
+        await get_async_db().enqueue_write(_drop_data, self.table, key)
+
+
+class SQLitePersistence(BasePersistence):
+    """Conversation states, user_data, chat_data and bot_data in the bot's SQLite database.
+
+    Startup only reads the conversations that are in progress (a small table);
+    user_data and chat_data are read per user/chat the first time an update
+    for them arrives. The Application collects changes and hands them over
+    every PERSISTENCE_INTERVAL seconds (and on shutdown); unchanged data is
+    skipped and the rest goes through the group-commit writer, so one
+    interval's changes are written in a few transactions rather than one per
+    update.
+    """
+
+    def __init__(self, update_interval=PERSISTENCE_INTERVAL):
+        super().__init__(store_data=PersistenceInput(callback_data=False), update_interval=update_interval)
+        self.users = _LazyStore('user_data')
+        self.chats = _LazyStore('chat_data')
+        self._bot_hash = None
+
+    async def get_user_data(self):
+        return {}  # Loaded lazily in refresh_user_data
+
+    async def get_chat_data(self):
+        return {}  # Loaded lazily in refresh_chat_data
+
+    async def get_bot_data(self):
+        blob = await get_async_db().run_read(_load_bot_data)
+        self._bot_hash = hash(blob) if blob is not None else None
+        return pickle.loads(blob) if blob is not None else {}
+
+    async def get_callback_data(self):
+        return None
+
+    async def get_conversations(self, name):
+        cutoff = now_ms() - CONVERSATION_MAX_AGE_DAYS * MS_PER_DAY
+        rows = await get_async_db().enqueue_write(_load_conversations, name, cutoff)
+        logger.info(f"Restored {len(rows)} conversations of {name}")
+        return {tuple(json.loads(key)): json.loads(state) for key, state in rows}
+
+    async def update_conversation(self, name, key, new_state):
+        state = json.dumps(new_state) if new_state is not None else None
+        await get_async_db().enqueue_write(_save_conversation, name, json.dumps(list(key)), state, now_ms())
+
+    async def update_user_data(self, user_id, data):
+        await self.users.update(user_id, data)
+
+    async def update_chat_data(self, chat_id, data):
+        await self.chats.update(chat_id, data)
+
+    async def update_bot_data(self, data):
+        blob = pickle.dumps(data)
+        if hash(blob) == self._bot_hash:
+            return
+        self._bot_hash = hash(blob)
+        await get_async_db().enqueue_write(_save_bot_data, blob, now_ms())
+
+    async def update_callback_data(self, data):
+        pass
+
+    async def drop_user_data(self, user_id):
+        await self.users.drop(user_id)
+
+    async def drop_chat_data(self, chat_id):
+        await self.chats.drop(chat_id)
+
+    async def refresh_user_data(self, user_id, user_data):
+        await self.users.refresh(user_id, user_data)
+
+    async def refresh_chat_data(self, chat_id, chat_data):
+        await self.chats.refresh(chat_id, chat_data)
+
+    async def refresh_bot_data(self, bot_data):
+        pass  # Loaded at startup and only changed by this process
+
+    async def flush(self):
+        await get_async_db().flush_writes()
@@ -0,0 +1,115 @@
+import logging
+from typing import NamedTuple
+
+from database import get_async_db, now_ms
+from catalog import get_catalog, export_products_json
+from config import get_config
+
+# Logger
+logger = logging.getLogger(__name__)
+
+CURRENCIES = ('USD', 'USDT')
+SETTINGS_KEY = {'USD': 'USD_RATE', 'USDT': 'USDT_RATE'}
+
+# Price of a package with a USD cost: cost * rate * (1 + margin), rounded half
+# up to a multiple of round_to SYP. Integer arithmetic only (micro-USD x SYP
+# per USD x basis points), so one statement reprices the whole catalog.
+REPRICE_EXPR = '''
+    ((pk.cost_usd_micros * :rate * (10000 + COALESCE(pk.margin_bp, :margin_bp))
+      + 5000000000 * :round_to) / (10000000000 * :round_to)) * :round_to
+'''
+
+PREVIEW_SQL = f'''
+    SELECT pk.package_id, p.name, pk.label, pk.price, {REPRICE_EXPR} AS new_price
+    FROM packages pk JOIN products p ON p.product_pk = pk.product_pk
+    WHERE pk.active = 1 AND pk.cost_usd_micros IS NOT NULL AND new_price != pk.price
+    ORDER BY p.product_type, p.sort_order, pk.sort_order
+'''
+
+REPRICE_SQL = f'''
+    UPDATE packages AS pk SET price = {REPRICE_EXPR}
+    WHERE pk.active = 1 AND pk.cost_usd_micros IS NOT NULL AND pk.price != {REPRICE_EXPR}
+'''
+
+
+class PriceChange(NamedTuple):
+    """One package whose price a rate change would move."""
+    package_id: int
+    product_name: str
+    label: str
+    old_price: int
+    new_price: int
+
+
+def parse_rate(text):
+    """Parse an admin-entered rate ('15,000', '١٥٠٠٠'); None if not a positive number."""
+    try:
+        rate = int(round(float(text.strip().replace(',', '').replace('٬', ''))))
+    except (ValueError, AttributeError):
+        return None
+    return rate if rate > 0 else None
+
+
+def pricing_params(usd_rate):
+    """SQL parameters of the margin rule for a USD rate."""
+    config = get_config()
+    return {
+        'rate': usd_rate,
+        'margin_bp': int(config.PRICE_MARGIN_BP),
+        'round_to': max(1, int(config.PRICE_ROUND_TO)),
+    }
+
+
+def latest_rates(conn):
+    """Current rate per currency."""
+    return dict(conn.execute('''
+        SELECT currency, rate FROM rate_history
+        WHERE rate_id IN (SELECT MAX(rate_id) FROM rate_history GROUP BY currency)
+    '''))
+
+
+def preview_repricing(conn, usd_rate):
+    """Packages whose price would change at this USD rate."""
+    return [PriceChange(*row) for row in conn.execute(PREVIEW_SQL, pricing_params(usd_rate))]
+
+
+def apply_rate(conn, currency, rate, admin_id=None):
+    """Record a new rate and, for USD, reprice every costed package in one statement.
+
+    The settings row is updated in the same transaction so Config agrees
+    with the rate history. Returns the number of packages repriced.
+    """
+    now = now_ms()
+    conn.execute(
+        "INSERT INTO rate_history (currency, rate, created_at, created_by) VALUES (?, ?, ?, ?)",
+        (currency, rate, now, admin_id)
+    )
+    conn.execute('''
+        INSERT INTO settings (key, value, updated_at) VALUES (?, ?, ?)
+        ON CONFLICT (key) DO UPDATE SET value = excluded.value, updated_at = excluded.updated_at
+    ''', (SETTINGS_KEY[currency], str(rate), now))
+    conn.execute("UPDATE settings_meta SET version = version + 1 WHERE id = 1")
+    if currency != 'USD':
+        return 0
+    return conn.execute(REPRICE_SQL, pricing_params(rate)).rowcount
+
+
+async def preview_rate_change(currency, rate):
+    """Return (current rate, [PriceChange]) for a proposed rate."""
+    def preview(conn):
+        current = latest_rates(conn).get(currency)
+        return current, preview_repricing(conn, rate) if currency == 'USD' else []
+    return await get_async_db().run_read(preview)
+
+
+async def commit_rate_change(currency, rate, admin_id=None):
+    """Apply a rate change and publish the new prices; returns packages repriced."""
+    if currency not in CURRENCIES:
+        raise ValueError(f"Unknown currency {currency!r}")
+    repriced = await get_async_db().enqueue_write(apply_rate, currency, rate, admin_id)
+    await get_config().store.reload()
+    await get_catalog().reload()
+    if repriced:
+        await export_products_json()
+    logger.info(f"{currency} rate set to {rate} by {admin_id}: {repriced} packages repriced")
+    return repriced
@@ -0,0 +1,189 @@
+import re
+import heapq
+import logging
+import threading
+
+from catalog import get_catalog
+
+# Logger
+logger = logging.getLogger(__name__)
+
+# Settings
+NGRAM_SIZES = (2, 3)  # Shorter query tokens are skipped, longer ones use trigrams
+MAX_RESULTS = 20
+MAX_RANKED_TERMS = 4  # Later query terms still filter but do not rank
+
+_EMPTY = frozenset()
+
+# Arabic normalization: fold letter variants, drop diacritics and tatweel,
+# map Arabic-Indic and Extended Arabic-Indic digits to ASCII.
+_FOLD = {ord(c): 'ا' for c in 'أإآٱ'}
+_FOLD.update({ord('ى'): 'ي', ord('ة'): 'ه'})
+_FOLD.update({cp: None for cp in range(0x064B, 0x0653)})  # Harakat
+_FOLD.update({0x0670: None, 0x0640: None})  # Superscript alef, tatweel
+_FOLD.update({0x0660 + d: str(d) for d in range(10)})
+_FOLD.update({0x06F0 + d: str(d) for d in range(10)})
+
+_TOKEN_RE = re.compile(r'\w+')
+
+
+def normalize(text):
+    """Normalize text for matching; returns the list of tokens."""
+    return _TOKEN_RE.findall(text.casefold().translate(_FOLD).replace('_', ' '))
+
+
+def _grams(token):
+    n = max(size for size in NGRAM_SIZES if size <= len(token))
+    return {token[i:i + n] for i in range(len(token) - n + 1)}
+
+
+def _doc_grams(tokens):
+    grams = set()
+    for token in tokens:
+        for n in NGRAM_SIZES:
+            grams.update(token[i:i + n] for i in range(len(token) - n + 1))
+    return grams
+
+
+class SearchIndex:
+    """In-memory n-gram index over catalog packages.
+
+    Each package is one document made of its product's name, id and note and
+    its own label. Candidates come from intersecting n-gram postings; terms
+    longer than a trigram are confirmed with a substring check, so n-gram
+    collisions never leak into results. Ranking is done with set operations:
+    whole-token matches score 2, or 3 in the product name; ties go to the
+    lower package id. The index follows the catalog version and
+    only re-indexes packages whose text changed.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = None
+        self._sources = {}      # package_id -> raw text tuple it was indexed from
+        self._texts = {}        # package_id -> normalized text, for substring checks
+        self._postings = {}     # n-gram -> set of package_id
+        self._tokens = {}       # whole token -> set of package_id
+        self._name_tokens = {}  # whole product name token -> set of package_id
+
+    def _sync(self):
+        snapshot = get_catalog().snapshot()
+        if snapshot.version == self._version:
+            return snapshot
+        with self._lock:
+            if snapshot.version != self._version:
+                self._apply(snapshot)
+                self._version = snapshot.version
+        return snapshot
+
+    def _apply(self, snapshot):
+        current = {}
+        for products in snapshot.ordered.values():
+            for product in products:
+                for package in product.packages:
+                    current[package.package_id] = (product.name, product.product_id, product.note, package.label)
+
+        stale = [pid for pid, source in self._sources.items() if current.get(pid) != source]
+        for package_id in stale:
+            self._remove(package_id)
+        added = 0
+        for package_id, source in current.items():
+            if package_id not in self._sources:
+                self._add(package_id, source)
+                added += 1
+        logger.info(f"Search index at catalog version {snapshot.version}: {added} indexed, {len(stale)} dropped")
+
+    @staticmethod
+    def _index_terms(source):
+        name, product_id, note, label = source
+        name_tokens = set(normalize(f"{name} {product_id}"))
+        tokens = name_tokens.union(normalize(f"{note} {label}"))
+        return tokens, name_tokens
+
+    def _add(self, package_id, source):
+        tokens, name_tokens = self._index_terms(source)
+        self._sources[package_id] = source
+        self._texts[package_id] = ' '.join(tokens)
+        for gram in _doc_grams(tokens):
+            self._postings.setdefault(gram, set()).add(package_id)
+        for token in tokens:
+            self._tokens.setdefault(token, set()).add(package_id)
+        for token in name_tokens:
+            self._name_tokens.setdefault(token, set()).add(package_id)
+
+    def _remove(self, package_id):
+        tokens, name_tokens = self._index_terms(self._sources.pop(package_id))
+        del self._texts[package_id]
+        for index, keys in ((self._postings, _doc_grams(tokens)), (self._tokens, tokens), (self._name_tokens, name_tokens)):
+            for key in keys:
+                posting = index.get(key)
+                if posting is not None:
+                    posting.discard(package_id)
+                    if not posting:
+                        del index[key]
+
+    def search(self, query, limit=MAX_RESULTS):
+        """Return up to `limit` packages matching every token of the query."""
+        snapshot = self._sync()
+        terms = [t for t in normalize(query) if len(t) >= min(NGRAM_SIZES)]
+        if not terms:
+            return []
+
+        postings = []
+        for term in terms:
+            for gram in _grams(term):
+                posting = self._postings.get(gram)
+                if not posting:
+                    return []
+                postings.append(posting)
+        postings.sort(key=len)
+        candidates = postings[0].intersection(*postings[1:])
+        if not candidates:
+            return []
+
+        # Split candidates into score tiers with set operations per term:
+        # +3 for a whole-token match in the product name, +2 elsewhere.
+        tiers = {0: candidates}
+        for term in terms[:MAX_RANKED_TERMS]:
+            exact = self._tokens.get(term, _EMPTY)
+            name = self._name_tokens.get(term, _EMPTY)
+            ranked = {}
+            for score, ids in tiers.items():
+                for bonus, part in ((3, ids & name), (2, (ids & exact) - name), (0, ids - exact)):
+                    if part:
+                        ranked[score + bonus] = ranked[score + bonus] | part if score + bonus in ranked else part
+            tiers = ranked
+        tiers = [tiers[score] for score in sorted(tiers, reverse=True)]
+
+        # Only terms longer than a trigram can match every gram without
+        # being a substring; check those on the few packages we return.
+        long_terms = [t for t in terms if len(t) > max(NGRAM_SIZES)]
+        results = []
+        for tier in tiers:
+            for package_id in _lowest(tier, limit - len(results)):
+                if long_terms and not all(t in self._texts[package_id] for t in long_terms):
+                    continue
+                package = snapshot.package_by_id(package_id)
+                if package is not None:  # None if indexed from a newer snapshot than ours
+                    results.append(package)
+                    if len(results) == limit:
+                        return results
+        return results
+
+
+def _lowest(ids, count):
+    """Yield ids in ascending order, sorting all of them only if needed."""
+    if count <= 0:
+        return
+    first = heapq.nsmallest(count, ids)
+    yield from first
+    if len(ids) > count:
+        yield from sorted(ids)[count:]
+
+
+_search_index = SearchIndex()
+
+
+def get_search_index():
+    """Function to access the SearchIndex instance."""
+    return _search_index
@@ -0,0 +1,313 @@
+import os
+import time
+import heapq
+import asyncio
+import logging
+import itertools
+from collections import deque
+from datetime import timedelta
+
+from telegram.error import RetryAfter, BadRequest, NetworkError, Forbidden
+
+# Logger
+logger = logging.getLogger(__name__)
+
+# Priority classes; lower is sent first
+CUSTOMER = 0  # Replies to the user who is waiting on the bot
+ADMIN = 1     # Order/recharge notices and error reports to admins
+BULK = 2      # Broadcasts and other background traffic
+
+# Settings: Telegram's limits and the burst allowed on top of the steady rate.
+# A bucket refills at (limit - burst) per window, so even a full burst
+# followed by the steady rate stays within the limit in any one window.
+GLOBAL_PER_SECOND = float(os.getenv('SEND_GLOBAL_PER_SECOND', '30'))
+GLOBAL_BURST = float(os.getenv('SEND_GLOBAL_BURST', '5'))
+PRIVATE_PER_SECOND = float(os.getenv('SEND_PRIVATE_PER_SECOND', '1'))
+PRIVATE_BURST = float(os.getenv('SEND_PRIVATE_BURST', '3'))
+GROUP_PER_MINUTE = float(os.getenv('SEND_GROUP_PER_MINUTE', '20'))
+GROUP_BURST = float(os.getenv('SEND_GROUP_BURST', '1'))
+MAX_CONCURRENT_SENDS = int(os.getenv('SEND_MAX_CONCURRENT', '8'))
+MAX_QUEUE = int(os.getenv('SEND_MAX_QUEUE', '10000'))
+MAX_ATTEMPTS = 5
+PRUNE_INTERVAL = 1.0  # Seconds between sweeps of idle per-chat state
+
+
+class SendQueueFull(Exception):
+    """Raised (through the returned future) when the queue is at MAX_QUEUE."""
+
+
+class TokenBucket:
+    """Classic token bucket: `rate` tokens per second, at most `capacity` stored."""
+
+    __slots__ = ('rate', 'capacity', 'tokens', 'updated')
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def delay(self, now):
+        """Seconds until a token is available (0 if one is available now)."""
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self):
+        self.tokens -= 1
+
+    def full(self, now):
+        """Whether the bucket has refilled, i.e. is as good as a new one."""
+        return self.tokens + (now - self.updated) * self.rate >= self.capacity
+
+
+class _Item:
+    __slots__ = ('priority', 'seq', 'chat_id', 'method', 'args', 'kwargs', 'future', 'enqueued_at', 'attempts')
+
+    def __init__(self, priority, seq, chat_id, method, args, kwargs, future):
+        self.priority = priority
+        self.seq = seq
+        self.chat_id = chat_id
+        self.method = method
+        self.args = args
+        self.kwargs = kwargs
+        self.future = future
+        self.enqueued_at = time.monotonic()
+        self.attempts = 0
+
+
+class _Chat:
+    __slots__ = ('bucket', 'busy', 'waiting', 'blocked_until')
+
+    def __init__(self, chat_id):
+        if chat_id < 0:
+            self.bucket = TokenBucket((GROUP_PER_MINUTE - GROUP_BURST) / 60, GROUP_BURST)
+        else:
+            self.bucket = TokenBucket(PRIVATE_PER_SECOND, PRIVATE_BURST)
+        self.busy = False        # An item of this chat is scheduled or in flight
+        self.waiting = deque()   # Later items of this chat, in order
+        self.blocked_until = 0.0  # Set from retry_after
+
+
+def _seconds(value):
+    """retry_after as float seconds; PTB gives an int or, in newer versions, a timedelta."""
+    return value.total_seconds() if isinstance(value, timedelta) else float(value)
+
+
+def _consume_exception(future):
+    # Failures are logged by the queue; callers that do not await must not
+    # trigger "exception was never retrieved" warnings.
+    if not future.cancelled():
+        future.exception()
+
+
+class SendQueue:
+    """Central outbound queue for Bot API sends.
+
+    Handlers enqueue a send and return at once; one dispatcher task releases
+    sends under a global token bucket and a per-chat bucket (private chats
+    and groups have different limits). Each chat has at most one send
+    scheduled or in flight, so messages to a chat keep their order. Across
+    chats, lower priority classes go first. RetryAfter pauses all sends (the
+    limit hit may be the bot-wide one) and blocks the chat for the time
+    Telegram asks for, then the send is retried; network errors are retried
+    with backoff; other errors fail the returned future.
+    """
+
+    def __init__(self):
+        self._ready = []    # (priority, seq, item) of chats free to send
+        self._delayed = []  # (not_before, priority, seq, item) waiting for a bucket or retry_after
+        self._chats = {}
+        self._global = TokenBucket(GLOBAL_PER_SECOND - GLOBAL_BURST, GLOBAL_BURST)
+        self._paused_until = 0.0  # Set from retry_after; holds every chat
+        self._seq = itertools.count()
+        self._depth = 0
+        self._in_flight = 0
+        self._slots = None
+        self._wakeup = None
+        self._task = None
+        self._pruned_at = 0.0
+        self.metrics = dict.fromkeys(
+            ('enqueued', 'sent', 'failed', 'retried', 'rate_limited', 'rejected', 'max_depth'), 0
+        )
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+    def _ensure_started(self):
+        if self._task is None or self._task.done():
+            self._wakeup = asyncio.Event()
+            self._slots = asyncio.Semaphore(MAX_CONCURRENT_SENDS)
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    def depth(self):
+        """Queued sends not yet handed to Telegram."""
+        return self._depth
+
+    def enqueue(self, chat_id, method, /, *args, priority=CUSTOMER, **kwargs):
+        """Queue `await method(*args, **kwargs)` as a send to chat_id; returns a future of its result."""
+        self._ensure_started()
+        future = asyncio.get_running_loop().create_future()
+        future.add_done_callback(_consume_exception)
+        if self._depth >= MAX_QUEUE:
+            self.metrics['rejected'] += 1
+            future.set_exception(SendQueueFull(f"Send queue full ({self._depth} queued)"))
+            return future
+
+        item = _Item(priority, next(self._seq), chat_id, method, args, kwargs, future)
+        self._depth += 1
+        self.metrics['enqueued'] += 1
+        self.metrics['max_depth'] = max(self.metrics['max_depth'], self._depth)
+        chat = self._chats.get(chat_id)
+        if chat is None:
+            chat = self._chats[chat_id] = _Chat(chat_id)
+        if chat.busy:
+            chat.waiting.append(item)
+        else:
+            chat.busy = True
+            heapq.heappush(self._ready, (item.priority, item.seq, item))
+            self._wakeup.set()
+        return future
+
+    def send_message(self, bot, chat_id, text, priority=CUSTOMER, **kwargs):
+        """Queue bot.send_message(chat_id, text, **kwargs)."""
+        return self.enqueue(chat_id, bot.send_message, chat_id=chat_id, text=text, priority=priority, **kwargs)
+
+    async def _run(self):
+        while True:
+            now = time.monotonic()
+            while self._delayed and self._delayed[0][0] <= now:
+                _, priority, seq, item = heapq.heappop(self._delayed)
+                heapq.heappush(self._ready, (priority, seq, item))
+
+            if not self._ready:
+                timeout = self._delayed[0][0] - now if self._delayed else None
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            _, _, item = self._ready[0]
+            chat = self._chats[item.chat_id]
+            wait = max(chat.bucket.delay(now), chat.blocked_until - now)
+            if wait > 0:
+                heapq.heappop(self._ready)
+                heapq.heappush(self._delayed, (now + wait, item.priority, item.seq, item))
+                continue
+            wait = max(self._global.delay(now), self._paused_until - now)
+            if wait > 0:
+                await asyncio.sleep(wait)
+                continue
+
+            await self._slots.acquire()
+            if self._ready[0][2] is not item:
+                # Something more urgent arrived while all slots were busy
+                self._slots.release()
+                continue
+            heapq.heappop(self._ready)
+            chat.bucket.take()
+            self._global.take()
+            self._depth -= 1
+            self._in_flight += 1
+            waited = now - item.enqueued_at
+            self._wait_total += waited
+            self._wait_max = max(self._wait_max, waited)
+            asyncio.get_running_loop().create_task(self._send(item, chat))
+
+    async def _send(self, item, chat):
+        retry_in = None
+        try:
+            item.attempts += 1
+            result = await item.method(*item.args, **item.kwargs)
+        except RetryAfter as e:
+            self.metrics['rate_limited'] += 1
+            retry_in = _seconds(e.retry_after)
+            chat.blocked_until = time.monotonic() + retry_in
+            # Telegram does not say which limit was hit; other chats would get 429 too if it was the global one
+            self._paused_until = max(self._paused_until, chat.blocked_until)
+            logger.warning(f"Flood control for chat {item.chat_id}: all sends paused for {retry_in:.0f}s")
+        except BadRequest as e:
+            self._fail(item, e)
+        except NetworkError as e:
+            retry_in = min(30.0, 2 ** item.attempts)
+            logger.warning(f"Send to chat {item.chat_id} failed ({e}), attempt {item.attempts}")
+        except Exception as e:
+            self._fail(item, e)
+        else:
+            self.metrics['sent'] += 1
+            if not item.future.done():
+                item.future.set_result(result)
+        finally:
+            self._in_flight -= 1
+            self._slots.release()
+
+        if retry_in is not None:
+            if item.attempts < MAX_ATTEMPTS:
+                self.metrics['retried'] += 1
+                self._depth += 1
+                heapq.heappush(self._delayed, (time.monotonic() + retry_in, item.priority, item.seq, item))
+                self._wakeup.set()
+                return  # The chat stays busy so later messages keep their place
+            self._fail(item, RuntimeError(f"Gave up after {item.attempts} attempts"))
+
+        # Let the chat's next message in
+        if chat.waiting:
+            nxt = chat.waiting.popleft()
+            heapq.heappush(self._ready, (nxt.priority, nxt.seq, nxt))
+        else:
+            chat.busy = False
+            self._forget_idle()
+        self._wakeup.set()
+
+    def _fail(self, item, error):
+        self.metrics['failed'] += 1
+        # Users who blocked the bot are routine during broadcasts
+        level = logging.INFO if isinstance(error, Forbidden) else logging.ERROR
+        logger.log(level, f"Send to chat {item.chat_id} failed: {error}")
+        if not item.future.done():
+            item.future.set_exception(error)
+
+    def _forget_idle(self):
+        # State of an idle chat with a refilled bucket carries no information,
+        # so dropping it keeps memory flat during broadcasts to many users.
+        now = time.monotonic()
+        if now - self._pruned_at < PRUNE_INTERVAL:
+            return
+        self._pruned_at = now
+        idle = [
+            chat_id for chat_id, chat in self._chats.items()
+            if not chat.busy and chat.blocked_until <= now and chat.bucket.full(now)
+        ]
+        for chat_id in idle:
+            del self._chats[chat_id]
+
+    async def drain(self, timeout=10):
+        """Wait until everything queued has been sent (or timeout seconds pass)."""
+        deadline = time.monotonic() + timeout
+        while (self._depth or self._in_flight) and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+        return self._depth == 0 and self._in_flight == 0
+
+    def status_text(self) -> str:
+        """Queue metrics for the admin panel."""
+        m = self.metrics
+        started = m['sent'] + m['failed'] + m['retried']
+        avg_wait = self._wait_total / started * 1000 if started else 0
+        paused = self._paused_until - time.monotonic()
+        return (
+            "📤 طابور الإرسال:\n"
+            f"• في الانتظار: {self._depth} (الأقصى: {m['max_depth']})، قيد الإرسال: {self._in_flight}\n"
+            f"• أُرسلت: {m['sent']}، فشلت: {m['failed']}، أُعيدت: {m['retried']}، مرفوضة: {m['rejected']}\n"
+            f"• حدود تيليجرام (429): {m['rate_limited']}"
+            + (f" (الإرسال متوقف لمدة {paused:.0f} ث)" if paused > 0 else "") + "\n"
+            f"• زمن الانتظار: متوسط {avg_wait:.0f} ms، أقصى {self._wait_max * 1000:.0f} ms"
+        )
+
+
+_send_queue = SendQueue()
+
+
+def get_send_queue():
+    """Function to access the SendQueue instance."""
+    return _send_queue
@@ -0,0 +1,110 @@
+import logging
+
+from database import (
+    get_async_db, damascus_today_range, from_ms, MS_PER_DAY, DAMASCUS_TZ
+)
+from migrations import run_script, STATS_REBUILD_SQL
+from catalog import get_catalog
+from utils import format_currency
+
+# Logger
+logger = logging.getLogger(__name__)
+
+TOP_PRODUCTS_LIMIT = 5
+
+
+def _read_stats(conn, today_start, today_end):
+    """Read everything the stats screen needs from stats_rollup.
+
+    Every query is a primary-key or index range over at most one row per
+    day, hour, product or payment method, so the cost does not grow with
+    the amount of history.
+    """
+    columns = "order_count, revenue, deposit_count, deposit_volume"
+    stats = {}
+    days = conn.execute(f"""
+        SELECT bucket, {columns} FROM stats_rollup
+        WHERE dimension = 'total' AND key = '' AND bucket_kind = 'day' AND bucket >= ?
+    """, (today_start - 6 * MS_PER_DAY,)).fetchall()
+    stats['days'] = {row[0]: row[1:] for row in days}
+    stats['all_time'] = conn.execute(f"""
+        SELECT {columns} FROM stats_rollup
+        WHERE dimension = 'total' AND key = '' AND bucket_kind = 'all' AND bucket = 0
+    """).fetchone() or (0, 0, 0, 0)
+    stats['hours'] = conn.execute(f"""
+        SELECT bucket, {columns} FROM stats_rollup
+        WHERE dimension = 'total' AND key = '' AND bucket_kind = 'hour' AND bucket >= ? AND bucket < ?
+    """, (today_start, today_end)).fetchall()
+    stats['top_products'] = conn.execute("""
+        SELECT key, order_count, revenue FROM stats_rollup
+        WHERE bucket_kind = 'day' AND bucket = ? AND dimension = 'product' AND order_count > 0
+        ORDER BY revenue DESC LIMIT ?
+    """, (today_start, TOP_PRODUCTS_LIMIT)).fetchall()
+    stats['payment_methods'] = conn.execute("""
+        SELECT key, deposit_count, deposit_volume FROM stats_rollup
+        WHERE bucket_kind = 'day' AND bucket = ? AND dimension = 'payment_method' AND deposit_count > 0
+        ORDER BY deposit_volume DESC
+    """, (today_start,)).fetchall()
+    return stats
+
+
+async def get_stats():
+    """Return the rollup figures for today, the last 7 days and all time."""
+    today_start, today_end = damascus_today_range()
+    stats = await get_async_db().run_read(_read_stats, today_start, today_end)
+    empty = (0, 0, 0, 0)
+    stats['today'] = stats['days'].get(today_start, empty)
+    stats['yesterday'] = stats['days'].get(today_start - MS_PER_DAY, empty)
+    stats['week'] = tuple(sum(values) for values in zip(empty, *stats['days'].values()))
+    return stats
+
+
+def format_stats(stats) -> str:
+    """Render the stats screen text."""
+    def summary(title, values):
+        orders, revenue, deposits, volume = values
+        return (
+            f"{title}\n"
+            f"• الطلبات المكتملة: {orders}\n"
+            f"• المبيعات: {format_currency(revenue)}\n"
+            f"• الإيداعات: {deposits} ({format_currency(volume)})\n"
+        )
+
+    lines = [
+        "📊 الإحصائيات\n",
+        summary("📅 اليوم:", stats['today']),
+        summary("🕐 أمس:", stats['yesterday']),
+        summary("🗓 آخر 7 أيام:", stats['week']),
+        summary("♾ الإجمالي:", stats['all_time']),
+    ]
+    if stats['top_products']:
+        lines.append("🏆 الأكثر مبيعاً اليوم:")
+        snapshot = get_catalog().snapshot()
+        for key, orders, revenue in stats['top_products']:
+            product = snapshot.product(*key.split(':', 1))
+            name = product.name if product else key
+            lines.append(f"• {name}: {orders} طلب ({format_currency(revenue)})")
+        lines.append("")
+    if stats['payment_methods']:
+        lines.append("💳 الإيداعات حسب طريقة الدفع اليوم:")
+        for method, deposits, volume in stats['payment_methods']:
+            lines.append(f"• {method}: {deposits} ({format_currency(volume)})")
+        lines.append("")
+    if stats['hours']:
+        busiest = max(stats['hours'], key=lambda row: row[1])
+        if busiest[1]:
+            hour = from_ms(busiest[0], DAMASCUS_TZ)
+            lines.append(f"⏰ أكثر ساعة نشاطاً اليوم: {hour.strftime('%H:00')} ({busiest[1]} طلب)")
+    return "\n".join(lines).strip()
+
+
+def _rebuild(conn):
+    run_script(conn, STATS_REBUILD_SQL)
+    return conn.execute("SELECT COUNT(*) FROM stats_rollup").fetchone()[0]
+
+
+async def rebuild_stats() -> int:
+    """Recompute all rollups from orders and transactions. Returns the row count."""
+    rows = await get_async_db().run_write(_rebuild)
+    logger.info(f"Stats rollups rebuilt ({rows} rows)")
+    return rows
@@ -0,0 +1,26 @@
+import os
+import sys
+
+import pytest
+
+# The bot's modules live at the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database
+
+
+@pytest.fixture
+def temp_db(tmp_path, monkeypatch):
+    """A fresh, migrated database (and archive) in a temporary directory.
+
+    DB_PATH is relative, so running in tmp_path gives every test its own
+    files; the pool and async facade are reset so nothing is shared.
+    """
+    monkeypatch.chdir(tmp_path)
+    database.close_pool()
+    database._pool = None
+    database.init_db()
+    database.init_wal()
+    yield tmp_path
+    database.close_pool()
+    database._pool = None
@@ -0,0 +1,188 @@
+"""A local stand-in for the Telegram Bot API and for Telegram's webhook delivery.
+
+FakeBotApi answers the few methods the bot uses (getMe, setWebhook,
+deleteWebhook, getUpdates, sendMessage) and records every sendMessage.
+Updates handed to push_updates are served to long polling. WebhookClient
+plays Telegram's side of a webhook: it POSTs updates to the bot's endpoint
+with the secret token header over keep-alive connections.
+"""
+import json
+import time
+import asyncio
+from urllib.parse import parse_qs
+
+BOT_TOKEN = '123456:TEST'
+
+
+def make_update(update_id, chat_id=None, text='/start'):
+    """A private text message update from user/chat `chat_id`."""
+    chat_id = chat_id or 100000 + update_id
+    return {
+        'update_id': update_id,
+        'message': {
+            'message_id': update_id,
+            'date': int(time.time()),
+            'chat': {'id': chat_id, 'type': 'private'},
+            'from': {'id': chat_id, 'is_bot': False, 'first_name': 'User'},
+            'text': text,
+        },
+    }
+
+
+async def _read_request(reader):
+    """Read one HTTP/1.1 request; returns (method, target, headers, body) or None at EOF."""
+    line = await reader.readline()
+    if not line:
+        return None
+    method, target, _ = line.decode('latin-1').split(' ', 2)
+    headers = {}
+    while True:
+        header = await reader.readline()
+        if header in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = header.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+    body = await reader.readexactly(int(headers.get('content-length', '0')))
+    return method, target, headers, body
+
+
+class FakeBotApi:
+    """Bot API server on 127.0.0.1; use base_url as the bot's base URL."""
+
+    def __init__(self):
+        self.sent = []  # (chat_id, text) of every sendMessage, in order
+        self.sent_at = {}  # chat_id -> time.monotonic() of its latest sendMessage
+        self.webhook_url = None
+        self.calls = {}
+        self._server = None
+        self._message_id = 0
+        self._updates = []  # Pending updates for getUpdates, in update_id order
+        self._pushed = asyncio.Event()
+
+    @property
+    def base_url(self):
+        port = self._server.sockets[0].getsockname()[1]
+        return f"http://127.0.0.1:{port}/bot"
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._serve, '127.0.0.1', 0)
+
+    async def stop(self):
+        self._pushed.set()  # Answer pending long polls so their connections can end
+        self._server.close()
+        await self._server.wait_closed()
+
+    async def _serve(self, reader, writer):
+        try:
+            while True:
+                request = await _read_request(reader)
+                if request is None:
+                    break
+                _, target, headers, body = request
+                if 'json' in headers.get('content-type', ''):
+                    params = json.loads(body or b'{}')
+                else:
+                    params = {k: v[0] for k, v in parse_qs(body.decode('utf-8')).items()}
+                result = await self._call(target.rsplit('/', 1)[1], params)
+                out = json.dumps({'ok': True, 'result': result}).encode('utf-8')
+                writer.write(
+                    b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n"
+                    b"Content-Length: %d\r\n\r\n" % len(out) + out
+                )
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    def push_updates(self, updates):
+        """Make updates available to getUpdates."""
+        self._updates.extend(updates)
+        self._pushed.set()
+
+    async def _get_updates(self, params):
+        # Long polling: confirm everything below offset, then wait up to
+        # `timeout` seconds for something to return
+        offset = int(params.get('offset') or 0)
+        self._updates = [u for u in self._updates if u['update_id'] >= offset]
+        if not self._updates:
+            self._pushed.clear()
+            try:
+                await asyncio.wait_for(self._pushed.wait(), float(params.get('timeout') or 0))
+            except asyncio.TimeoutError:
+                pass
+        return self._updates[:int(params.get('limit') or 100)]
+
+    async def _call(self, method, params):
+        self.calls[method] = self.calls.get(method, 0) + 1
+        if method == 'getMe':
+            return {'id': 1, 'is_bot': True, 'first_name': 'Bot', 'username': 'test_bot'}
+        if method == 'setWebhook':
+            self.webhook_url = params.get('url')
+            return True
+        if method == 'deleteWebhook':
+            self.webhook_url = None
+            return True
+        if method == 'getUpdates':
+            return await self._get_updates(params)
+        if method == 'sendMessage':
+            self._message_id += 1
+            chat_id = int(params['chat_id'])
+            self.sent.append((chat_id, params.get('text', '')))
+            self.sent_at[chat_id] = time.monotonic()
+            return {
+                'message_id': self._message_id,
+                'date': int(time.time()),
+                'chat': {'id': chat_id, 'type': 'private'},
+                'text': params.get('text', ''),
+            }
+        return True
+
+    async def wait_for_sent(self, count, timeout=10):
+        """Wait until `count` messages were sent; returns whether they were."""
+        deadline = time.monotonic() + timeout
+        while len(self.sent) < count and time.monotonic() < deadline:
+            await asyncio.sleep(0.01)
+        return len(self.sent) >= count
+
+
+class WebhookClient:
+    """Delivers updates to a webhook the way Telegram does."""
+
+    def __init__(self, port, path, secret):
+        self.port = port
+        self.path = path
+        self.secret = secret
+
+    async def post_all(self, updates, connections=8):
+        """POST every update over `connections` keep-alive connections; returns {update_id: status}."""
+        queue = asyncio.Queue()
+        for update in updates:
+            queue.put_nowait(update)
+        statuses = {}
+
+        async def connection():
+            reader, writer = await asyncio.open_connection('127.0.0.1', self.port)
+            try:
+                while not queue.empty():
+                    update = queue.get_nowait()
+                    statuses[update['update_id']] = await self.post(reader, writer, update)
+            finally:
+                writer.close()
+
+        await asyncio.gather(*(connection() for _ in range(connections)))
+        return statuses
+
+    async def post(self, reader, writer, update):
+        """POST one update on an open connection; returns the HTTP status."""
+        body = json.dumps(update).encode('utf-8')
+        writer.write(
+            f"POST {self.path} HTTP/1.1\r\nHost: 127.0.0.1\r\nContent-Type: application/json\r\n"
+            f"X-Telegram-Bot-Api-Secret-Token: {self.secret}\r\n"
+            f"Content-Length: {len(body)}\r\n\r\n".encode('latin-1') + body
+        )
+        await writer.drain()
+        status = int((await reader.readline()).split()[1])
+        while (await reader.readline()) not in (b'\r\n', b''):
+            pass
+        return status
@@ -0,0 +1,63 @@
+import os
+import time
+from datetime import datetime, timezone
+
+import pytest
+
+import backup_manager
+from backup_manager import BackupManager, archive_backup_path
+
+
+def test_backups_in_the_same_second_get_their_own_files(temp_db, monkeypatch):
+    frozen = datetime(2026, 3, 29, 0, 30, 15, tzinfo=timezone.utc)
+
+    class FrozenDatetime(datetime):
+        @classmethod
+        def now(cls, tz=None):
+            return frozen
+
+    monkeypatch.setattr(backup_manager, 'datetime', FrozenDatetime)
+    manager = BackupManager(backup_dir=str(temp_db / 'backup'))
+    scheduled = manager.backup_now(throttled=False)
+    manual = manager.backup_now(throttled=False)
+
+    assert scheduled['ok'] and manual['ok']
+    assert os.path.basename(scheduled['path']) == 'diamond_store_20260329_003015Z.db'
+    assert os.path.basename(manual['path']) == 'diamond_store_20260329_003015Z_1.db'
+    # Both are the newest backup of their hour, so retention keeps the newer one
+    assert [path for _, path in manager._list_backups()] == [manual['path']]
+    assert os.path.exists(archive_backup_path(manual['path']))
+    assert not os.path.exists(scheduled['path'])
+
+
+@pytest.fixture
+def berlin_time():
+    # On 2026-10-25 00:00Z and 01:00Z are both 02:00 in Berlin (DST ends)
+    old = os.environ.get('TZ')
+    os.environ['TZ'] = 'Europe/Berlin'
+    time.tzset()
+    yield
+    if old is None:
+        del os.environ['TZ']
+    else:
+        os.environ['TZ'] = old
+    time.tzset()
+
+
+def test_retention_buckets_are_utc(temp_db, berlin_time, monkeypatch):
+    backup_dir = temp_db / 'backup'
+    backup_dir.mkdir()
+    names = [f'diamond_store_20261025_{hour:02d}0000Z.db' for hour in range(6)]
+    for name in names:
+        (backup_dir / name).write_bytes(b'')
+        (backup_dir / archive_backup_path(name)).write_bytes(b'')
+    monkeypatch.setitem(backup_manager.RETENTION, 'hourly', 5)
+    monkeypatch.setitem(backup_manager.RETENTION, 'daily', 1)
+    monkeypatch.setitem(backup_manager.RETENTION, 'weekly', 1)
+
+    manager = BackupManager(backup_dir=str(backup_dir))
+    manager._prune()
+
+    # Five distinct UTC hours are kept; only the oldest falls outside the policy
+    kept = sorted(os.listdir(backup_dir))
+    assert kept == sorted(names[1:] + [archive_backup_path(name) for name in names[1:]])
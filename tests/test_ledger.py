@@ -0,0 +1,66 @@
+import asyncio
+
+from database import get_async_db, debit_balance, credit_balance, get_balance, now_ms
+
+USER_ID = 1001
+STARTING_BALANCE = 30000
+PRICE = 100
+PURCHASES = 500  # More than the balance covers, so some must be refused
+
+
+async def _create_user(user_id, balance):
+    now = now_ms()
+    await get_async_db().execute(
+        "INSERT INTO users (user_id, username, first_name, balance, joined_date, last_activity) "
+        "VALUES (?, ?, ?, ?, ?, ?)",
+        (user_id, 'stress', 'Stress', balance, now, now)
+    )
+
+
+async def _history(user_id):
+    return await get_async_db().fetchall(
+        "SELECT old_balance, new_balance, change_amount FROM balance_history "
+        "WHERE user_id = ? ORDER BY history_id",
+        (user_id,)
+    )
+
+
+def test_concurrent_debits_lose_no_updates(temp_db):
+    async def run():
+        await _create_user(USER_ID, STARTING_BALANCE)
+        results = await asyncio.gather(*(
+            debit_balance(USER_ID, PRICE, 'purchase') for _ in range(PURCHASES)
+        ))
+        return results, await get_balance(USER_ID), await _history(USER_ID)
+
+    results, balance, history = asyncio.run(run())
+
+    succeeded = [r for r in results if r is not None]
+    assert len(succeeded) == STARTING_BALANCE // PRICE
+    assert results.count(None) == PURCHASES - len(succeeded)
+    assert balance == 0
+    # Every debit saw a different balance, so none was applied twice or lost
+    assert sorted(succeeded, reverse=True) == list(range(STARTING_BALANCE - PRICE, -1, -PRICE))
+
+    assert len(history) == len(succeeded)
+    assert sum(change for _, _, change in history) == balance - STARTING_BALANCE
+    assert all(new == old + change for old, new, change in history)
+    assert history[-1][1] == balance
+
+
+def test_concurrent_credits_and_debits_balance_out(temp_db):
+    async def run():
+        await _create_user(USER_ID, 0)
+        credits = [credit_balance(USER_ID, PRICE, 'recharge') for _ in range(300)]
+        debits = [debit_balance(USER_ID, PRICE, 'purchase') for _ in range(300)]
+        # Interleave so debits race credits rather than all running after them
+        results = await asyncio.gather(*(op for pair in zip(credits, debits) for op in pair))
+        return results, await get_balance(USER_ID), await _history(USER_ID)
+
+    results, balance, history = asyncio.run(run())
+
+    debits_ok = sum(1 for r in results[1::2] if r is not None)
+    assert balance == (300 - debits_ok) * PRICE
+    assert len(history) == 300 + debits_ok
+    assert sum(change for _, _, change in history) == balance
+    assert all(new == old + change and new >= 0 for old, new, change in history)
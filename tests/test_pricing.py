@@ -0,0 +1,86 @@
+import json
+import asyncio
+import logging
+
+import pytest
+
+import catalog
+from database import get_async_db
+from catalog import get_catalog, import_products_json, export_products_json, update_package_price
+from config import get_config
+from rate_manager import commit_rate_change
+
+PRODUCTS = {
+    'games': {
+        'pubg': {'name': 'PUBG Mobile', 'icon': '', 'packages': [['60 UC', 9000], ['120 UC', 18000]]},
+    },
+    'apps': {},
+}
+
+
+@pytest.fixture(autouse=True)
+def fresh_snapshots(monkeypatch):
+    # The catalog and settings caches are process-wide; each test has a new database
+    store = get_config().store
+    monkeypatch.setattr(get_config(), 'store', type(store)(store._owner_id))
+    monkeypatch.setattr(catalog, '_catalog', catalog.Catalog())
+
+
+async def _setup(tmp_path):
+    path = tmp_path / 'products.json'
+    path.write_text(json.dumps(PRODUCTS), encoding='utf-8')
+    get_config().store.load()
+    get_catalog().load()
+    await import_products_json(str(path))
+    return [package.package_id for package in get_catalog().snapshot().product('game', 'pubg').packages]
+
+
+async def _prices():
+    return [row[0] for row in await get_async_db().fetchall(
+        "SELECT price FROM packages ORDER BY package_id"
+    )]
+
+
+def test_rate_change_keeps_a_manual_price_edit(temp_db):
+    async def run():
+        package_ids = await _setup(temp_db)
+        await commit_rate_change('USD', 10000)
+        assert await update_package_price(package_ids[0], 18000)
+        await commit_rate_change('USD', 10100)
+        return await _prices()
+
+    # The edited package moves with the rate from its new price, not its old one
+    assert asyncio.run(run()) == [18200, 18200]
+
+
+def test_imported_packages_follow_the_rate(temp_db):
+    async def run():
+        await _setup(temp_db)
+        repriced = await commit_rate_change('USD', 20000)
+        return repriced, await _prices()
+
+    assert asyncio.run(run()) == (2, [18000, 36000])
+
+
+def test_margin_setting_applies_to_every_package(temp_db):
+    async def run():
+        await _setup(temp_db)
+        await get_config().store.update_many({'PRICE_MARGIN_BP': '1000'})
+        await commit_rate_change('USD', 10000)
+        return await _prices()
+
+    assert asyncio.run(run()) == [9900, 19800]
+
+
+def test_concurrent_exports_leave_a_whole_file(temp_db, caplog):
+    async def run():
+        await _setup(temp_db)
+        path = str(temp_db / 'products.json')
+        await asyncio.gather(*(export_products_json(path) for _ in range(20)))
+        with open(path, encoding='utf-8') as f:
+            return json.load(f), sorted(p.name for p in temp_db.iterdir() if p.suffix == '.tmp')
+
+    data, leftovers = asyncio.run(run())
+    assert [label for label, _ in data['games']['pubg']['packages']] == ['60 UC', '120 UC']
+    assert leftovers == []
+    assert not [r for r in caplog.records if r.levelno >= logging.ERROR]
@@ -0,0 +1,147 @@
+import asyncio
+import time
+
+from telegram.ext import Application, MessageHandler, filters
+
+from database import get_async_db
+from webhook_manager import WebhookServer, InboxConsumer, WEBHOOK_PATH
+from fake_bot_api import FakeBotApi, WebhookClient, make_update, BOT_TOKEN
+
+SECRET = 'test-secret'
+
+
+async def _reply(update, context):
+    await update.message.reply_text(f"got {update.message.text}")
+
+
+async def _start_application(api):
+    application = Application.builder().token(BOT_TOKEN).base_url(api.base_url).updater(None).build()
+    application.add_handler(MessageHandler(filters.TEXT, _reply))
+    await application.initialize()
+    await application.start()
+    return application
+
+
+async def _stop_application(application):
+    await application.stop()
+    await application.shutdown()
+
+
+async def _start_server(on_stored=None):
+    server = WebhookServer(SECRET, on_stored=on_stored)
+    listening = await server.start('127.0.0.1', 0)
+    return server, listening.sockets[0].getsockname()[1]
+
+
+async def _inbox_count():
+    return (await get_async_db().fetchone("SELECT COUNT(*) FROM update_inbox"))[0]
+
+
+async def _wait_for_empty_inbox(timeout=10):
+    deadline = time.monotonic() + timeout
+    while await _inbox_count() and time.monotonic() < deadline:
+        await asyncio.sleep(0.02)
+    return await _inbox_count()
+
+
+def test_updates_are_acknowledged_processed_and_drained(temp_db):
+    async def run():
+        api = FakeBotApi()
+        await api.start()
+        application = await _start_application(api)
+        consumer = InboxConsumer(application)
+        await consumer.start()
+        server, port = await _start_server(on_stored=consumer.wake)
+        try:
+            updates = [make_update(i) for i in range(1, 201)]
+            statuses = await WebhookClient(port, WEBHOOK_PATH, SECRET).post_all(updates)
+            all_sent = await api.wait_for_sent(len(updates))
+            left = await _wait_for_empty_inbox()
+        finally:
+            await server.stop()
+            await consumer.stop()
+            await _stop_application(application)
+            await api.stop()
+        return updates, statuses, all_sent, left, api.sent, consumer.metrics
+
+    updates, statuses, all_sent, left, sent, metrics = asyncio.run(run())
+
+    assert set(statuses.values()) == {200}
+    assert all_sent
+    assert sorted(chat_id for chat_id, _ in sent) == [u['message']['chat']['id'] for u in updates]
+    assert left == 0
+    assert metrics == {'processed': len(updates), 'failed': 0}
+
+
+def test_wrong_secret_is_rejected_and_not_stored(temp_db):
+    async def run():
+        server, port = await _start_server()
+        try:
+            statuses = await WebhookClient(port, WEBHOOK_PATH, 'wrong').post_all([make_update(1)], connections=1)
+            stored = await _inbox_count()
+        finally:
+            await server.stop()
+        return statuses, stored, server.metrics
+
+    statuses, stored, metrics = asyncio.run(run())
+
+    assert statuses == {1: 403}
+    assert stored == 0
+    assert metrics['rejected'] == 1
+
+
+def test_acknowledged_updates_survive_until_a_consumer_runs(temp_db):
+    async def run():
+        api = FakeBotApi()
+        await api.start()
+        # Only the endpoint is up, as if the bot crashed right after answering 200
+        server, port = await _start_server()
+        updates = [make_update(i) for i in range(1, 51)]
+        client = WebhookClient(port, WEBHOOK_PATH, SECRET)
+        statuses = await client.post_all(updates)
+        # Telegram redelivers what it is unsure about; stored update_ids are ignored
+        redelivered = await client.post_all(updates[:10], connections=2)
+        stored = await _inbox_count()
+        await server.stop()
+        sent_before = len(api.sent)
+
+        application = await _start_application(api)
+        consumer = InboxConsumer(application)
+        try:
+            await consumer.start()
+            all_sent = await api.wait_for_sent(len(updates))
+            left = await _wait_for_empty_inbox()
+        finally:
+            await consumer.stop()
+            await _stop_application(application)
+            await api.stop()
+        return statuses, redelivered, stored, sent_before, all_sent, left, api.sent
+
+    statuses, redelivered, stored, sent_before, all_sent, left, sent = asyncio.run(run())
+
+    assert set(statuses.values()) == {200}
+    assert set(redelivered.values()) == {200}
+    assert stored == 50
+    assert sent_before == 0
+    assert all_sent and len(sent) == 50
+    assert left == 0
+
+
+def test_stop_closes_idle_keep_alive_connections(temp_db):
+    async def run():
+        server, port = await _start_server()
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        client = WebhookClient(port, WEBHOOK_PATH, SECRET)
+        status = await client.post(reader, writer, make_update(1))
+        started = time.monotonic()
+        await server.stop()
+        # The server hangs up instead of waiting out IDLE_TIMEOUT
+        closed = await asyncio.wait_for(reader.read(), 5)
+        writer.close()
+        return status, closed, time.monotonic() - started
+
+    status, closed, elapsed = asyncio.run(run())
+
+    assert status == 200
+    assert closed == b''
+    assert elapsed < 5
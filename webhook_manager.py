@@ -0,0 +1,305 @@
+import os
+import hmac
+import json
+import signal
+import asyncio
+import logging
+import secrets
+
+from telegram import Update
+
+from database import get_async_db, now_ms
+
+# Logger
+logger = logging.getLogger(__name__)
+
+# Settings
+WEBHOOK_URL = os.getenv('WEBHOOK_URL', '')  # Public https URL; empty runs long polling
+WEBHOOK_LISTEN = os.getenv('WEBHOOK_LISTEN', '0.0.0.0')
+WEBHOOK_PORT = int(os.getenv('WEBHOOK_PORT', '8443'))
+WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', '/telegram')
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET') or secrets.token_urlsafe(32)
+WEBHOOK_MAX_CONNECTIONS = int(os.getenv('WEBHOOK_MAX_CONNECTIONS', '40'))
+INBOX_MAX_CONCURRENT = int(os.getenv('INBOX_MAX_CONCURRENT', '32'))
+INBOX_BATCH_SIZE = 100
+INBOX_MAX_ATTEMPTS = 3  # An update that was claimed this often without finishing is left alone
+MAX_BODY_BYTES = 1024 * 1024
+IDLE_TIMEOUT = 75  # Seconds a keep-alive connection may sit idle
+
+SECRET_HEADER = 'x-telegram-bot-api-secret-token'
+_REASONS = {
+    200: 'OK', 400: 'Bad Request', 403: 'Forbidden', 404: 'Not Found',
+    405: 'Method Not Allowed', 413: 'Payload Too Large', 500: 'Internal Server Error',
+}
+
+
+def _store_update(conn, update_id, payload, received_at):
+    conn.execute(
+        "INSERT OR IGNORE INTO update_inbox (update_id, payload, received_at) VALUES (?, ?, ?)",
+        (update_id, payload, received_at)
+    )
+
+
+def _claim_updates(conn, limit, claimed_at):
+    return conn.execute('''
+        UPDATE update_inbox SET claimed_at = ?, attempts = attempts + 1
+        WHERE update_id IN (
+            SELECT update_id FROM update_inbox
+            WHERE claimed_at IS NULL AND attempts < ?
+            ORDER BY update_id LIMIT ?
+        )
+        RETURNING update_id, payload
+    ''', (claimed_at, INBOX_MAX_ATTEMPTS, limit)).fetchall()
+
+
+def _finish_update(conn, update_id):
+    conn.execute("DELETE FROM update_inbox WHERE update_id = ?", (update_id,))
+
+
+def _unclaim_updates(conn, update_ids):
+    """Return claimed updates that were never started to the queue."""
+    conn.executemany(
+        "UPDATE update_inbox SET claimed_at = NULL, attempts = attempts - 1 WHERE update_id = ?",
+        [(update_id,) for update_id in update_ids]
+    )
+
+
+def _release_claims(conn):
+    """Make updates claimed by a previous run pending again; returns (released, given up)."""
+    released = conn.execute(
+        "UPDATE update_inbox SET claimed_at = NULL WHERE claimed_at IS NOT NULL AND attempts < ?",
+        (INBOX_MAX_ATTEMPTS,)
+    ).rowcount
+    given_up = conn.execute(
+        "SELECT COUNT(*) FROM update_inbox WHERE attempts >= ?", (INBOX_MAX_ATTEMPTS,)
+    ).fetchone()[0]
+    return released, given_up
+
+
+class WebhookServer:
+    """Minimal HTTP/1.1 endpoint for Telegram's webhook.
+
+    A POST to WEBHOOK_PATH with the right secret token header is written to
+    the update_inbox table, and only after that commit is 200 returned, so an
+    update Telegram considers delivered survives a crash or restart. Telegram
+    redelivers anything that did not get a 200; redeliveries of a stored
+    update_id are ignored. Connections are kept alive between requests.
+    """
+
+    def __init__(self, secret, path=WEBHOOK_PATH, on_stored=None):
+        self.secret = secret.encode('utf-8')
+        self.path = path
+        self.on_stored = on_stored
+        self._server = None
+        self._idle = set()  # Writers of keep-alive connections waiting for a request
+        self._closing = False
+        self.metrics = dict.fromkeys(('accepted', 'rejected', 'failed'), 0)
+
+    async def start(self, host=WEBHOOK_LISTEN, port=WEBHOOK_PORT):
+        self._closing = False
+        self._server = await asyncio.start_server(self._serve, host, port)
+        logger.info(f"Webhook server listening on {host}:{port}{self.path}")
+        return self._server
+
+    async def stop(self):
+        if self._server is not None:
+            self._closing = True
+            self._server.close()
+            # Telegram keeps its connections open; an idle one would hold
+            # wait_closed() (Python 3.12+) for up to IDLE_TIMEOUT. Requests in
+            # progress are answered first and then the connection is closed.
+            for writer in self._idle:
+                writer.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def _serve(self, reader, writer):
+        try:
+            while not self._closing:
+                self._idle.add(writer)
+                try:
+                    request_line = await asyncio.wait_for(reader.readline(), IDLE_TIMEOUT)
+                finally:
+                    self._idle.discard(writer)
+                if not request_line:
+                    break
+                method, target, _ = request_line.decode('latin-1').split(' ', 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+
+                length = int(headers.get('content-length', '0'))
+                if length > MAX_BODY_BYTES:
+                    await self._respond(writer, 413, keep_alive=False)
+                    break
+                body = await reader.readexactly(length)
+                status = await self._handle(method, target, headers, body)
+                keep_alive = headers.get('connection', '').lower() != 'close' and not self._closing
+                await self._respond(writer, status, keep_alive)
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, asyncio.TimeoutError, ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def _handle(self, method, target, headers, body):
+        if target.split('?', 1)[0] != self.path:
+            return 404
+        if method != 'POST':
+            return 405
+        if not hmac.compare_digest(headers.get(SECRET_HEADER, '').encode('utf-8'), self.secret):
+            self.metrics['rejected'] += 1
+            logger.warning("Webhook request with a wrong secret token")
+            return 403
+        try:
+            payload = body.decode('utf-8')
+            update_id = json.loads(payload)['update_id']
+            if not isinstance(update_id, int):
+                raise ValueError(update_id)
+        except (ValueError, KeyError, TypeError):
+            return 400
+        try:
+            await get_async_db().enqueue_write(_store_update, update_id, payload, now_ms())
+        except Exception as e:
+            # No 200, so Telegram delivers it again
+            self.metrics['failed'] += 1
+            logger.error(f"Could not store update {update_id}: {e}")
+            return 500
+        self.metrics['accepted'] += 1
+        if self.on_stored is not None:
+            self.on_stored()
+        return 200
+
+    @staticmethod
+    async def _respond(writer, status, keep_alive=True):
+        writer.write(
+            f"HTTP/1.1 {status} {_REASONS[status]}\r\n"
+            f"Content-Length: 0\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode('latin-1')
+        )
+        await writer.drain()
+
+
+class InboxConsumer:
+    """Processes stored updates with at most INBOX_MAX_CONCURRENT in flight.
+
+    Updates are claimed in update_id order in batches, handed to
+    application.process_update, and deleted from the inbox once their
+    handlers have finished. Updates claimed by a run that crashed are
+    released on start; one claimed INBOX_MAX_ATTEMPTS times is left in the
+    table for inspection instead of crashing every restart.
+    """
+
+    def __init__(self, application, max_concurrent=INBOX_MAX_CONCURRENT):
+        self.application = application
+        self._slots = asyncio.Semaphore(max_concurrent)
+        self._wakeup = asyncio.Event()
+        self._tasks = set()
+        self._claimed = []  # Claimed update_ids not yet handed to a task
+        self._task = None
+        self.metrics = dict.fromkeys(('processed', 'failed'), 0)
+
+    def wake(self):
+        self._wakeup.set()
+
+    async def start(self):
+        released, given_up = await get_async_db().enqueue_write(_release_claims)
+        if released or given_up:
+            logger.info(f"Update inbox: {released} updates resumed, {given_up} given up after repeated failures")
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def _run(self):
+        db = get_async_db()
+        while True:
+            self._wakeup.clear()
+            rows = await db.enqueue_write(_claim_updates, INBOX_BATCH_SIZE, now_ms())
+            if not rows:
+                await self._wakeup.wait()
+                continue
+            self._claimed = [update_id for update_id, _ in reversed(rows)]
+            for update_id, payload in rows:
+                await self._slots.acquire()
+                self._claimed.pop()
+                task = asyncio.get_running_loop().create_task(self._process(update_id, payload))
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+
+    async def _process(self, update_id, payload):
+        try:
+            update = Update.de_json(json.loads(payload), self.application.bot)
+            # Handler errors go to the application's error handlers, not here
+            await self.application.process_update(update)
+            self.metrics['processed'] += 1
+        except Exception as e:
+            self.metrics['failed'] += 1
+            logger.error(f"Could not process update {update_id}: {e}")
+        finally:
+            self._slots.release()
+        try:
+            await get_async_db().enqueue_write(_finish_update, update_id)
+        except Exception as e:
+            logger.error(f"Could not remove update {update_id} from the inbox: {e}")
+
+    async def stop(self, timeout=10):
+        """Stop claiming updates and wait for the ones in flight."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._claimed:
+            await get_async_db().enqueue_write(_unclaim_updates, self._claimed)
+            self._claimed = []
+        if self._tasks:
+            await asyncio.wait(self._tasks, timeout=timeout)
+
+
+async def run_webhook(application, url=WEBHOOK_URL, secret=WEBHOOK_SECRET):
+    """Run the application on the webhook until SIGINT/SIGTERM.
+
+    Same lifecycle as Application.run_polling (post_init, post_stop and
+    post_shutdown are called), but updates come from the inbox.
+    """
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except NotImplementedError:
+            pass
+
+    consumer = InboxConsumer(application)
+    server = WebhookServer(secret, on_stored=consumer.wake)
+    await application.initialize()
+    try:
+        if application.post_init:
+            await application.post_init(application)
+        await application.start()
+        await consumer.start()
+        await server.start()
+        # Updates sent while the bot was down are kept by Telegram and delivered now
+        await application.bot.set_webhook(
+            url=url,
+            secret_token=secret,
+            allowed_updates=Update.ALL_TYPES,
+            max_connections=WEBHOOK_MAX_CONNECTIONS,
+            drop_pending_updates=False
+        )
+        await stop.wait()
+    finally:
+        await server.stop()
+        await consumer.stop()
+        if application.running:
+            await application.stop()
+        if application.post_stop:
+            await application.post_stop(application)
+        await application.shutdown()
+        if application.post_shutdown:
+            await application.post_shutdown(application)